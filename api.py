@@ -4,33 +4,62 @@ StudyWithAI API
 A simplified REST API for generating flashcards and quizzes from educational content.
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Optional
-import io
-import PyPDF2
-import re
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from collections import Counter
+import asyncio
 import importlib.util
 from pathlib import Path
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.genai import types
 import uuid
 import json
 import logging
 import os
+import sys
+import time
 from dotenv import load_dotenv
+from pdf_extraction import (
+    PdfExtractionPool, PdfExtractionError, ExtractionPoolSaturated, PdfSource, PageRanges,
+    parse_page_ranges, PDF_EXTRACTION_MAX_CHARS, PAGE_BREAK
+)
+from caching import create_pdf_text_cache, create_generation_cache, generation_key
+from uploads import RequestSizeLimitMiddleware, UploadTooLarge, spool_upload
+from auth import ApiKeyMiddleware
+from serialization import FastJSONResponse, CompressionMiddleware, dumps
+from structured_logging import (
+    RequestIdMiddleware, setup_logging, payload_sampled, set_request_id, reset_request_id
+)
+from condense import condense_documents, CONDENSE_ENABLED
+from dedup import NearDuplicateIndex, dedup_items, DEDUP_ENABLED, DEDUP_TOPUP, DEDUP_FIELDS
+from singleflight import SingleFlight
+from dispatch import DispatchStats, resolve_dispatch_mode, DIRECT, ROUTED
+from json_stream import IncrementalArrayParser, ArrayParseResult, parse_array
+from sessions import create_session_service, SESSION_DROP_AFTER_RESPONSE
+from jobs import JobManager, Job, QueueFull, create_job_queue, FAILED
+from documents import Document, create_document_store
+from lifecycle import Lifecycle, WarmupModel, WARMUP_ENABLED, SHUTDOWN_DRAIN_TIMEOUT
+from governor import ModelCallGovernor, GovernorSaturated, ModelRateLimited, set_caller_key
+from tiering import (
+    TierRouter, ModelTier, TierTimeout, parse_tiers, track_tier_usage, record_tier_use, MODEL_TIERS, QUOTA, TIMEOUT
+)
+import metrics
+from metrics import timed_stage, record_stage, estimate_tokens
+from chunking import (
+    chunk_text, allocate_items, split_header, fan_out,
+    CHUNKING_THRESHOLD_CHARS, CHUNK_CONCURRENCY, MAX_SHARED_HEADER_CHARS,
+    FANOUT_THRESHOLD_ITEMS, FANOUT_CONCURRENCY
+)
 
 # Load environment variables
 load_dotenv()
 
-# Set up logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Set up logging (JSON records written by a background thread)
+log_pipeline = setup_logging()
 logger = logging.getLogger("studywithai.api")
 
 # Configure Google AI API
@@ -44,17 +73,25 @@ API_SECRET_KEY = os.getenv("API_SECRET_KEY")
 if not API_SECRET_KEY:
     logger.error("API_SECRET_KEY not found in environment variables")
     raise ValueError("API_SECRET_KEY is required for API security")
+# Further accepted keys, one per client, so each client gets its own model call cap
+API_CLIENT_KEYS = [key.strip() for key in os.getenv("API_CLIENT_KEYS", "").split(",") if key.strip()]
 
 # Set the Google API key as environment variable for the SDK
 os.environ["GOOGLE_API_KEY"] = google_api_key
 logger.info("Google API key configured successfully")
 
-# Load the StudyWithAI agent
-agent_path = Path(__file__).parent / "studywithai-agent" / "agent.py"
-spec = importlib.util.spec_from_file_location("agent_module", agent_path)
-agent_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(agent_module)
+# Load the StudyWithAI agent once per process (registered in sys.modules so
+# later imports reuse the built agents)
+agent_module = sys.modules.get("agent_module")
+if agent_module is None:
+    agent_path = Path(__file__).parent / "studywithai-agent" / "agent.py"
+    spec = importlib.util.spec_from_file_location("agent_module", agent_path)
+    agent_module = importlib.util.module_from_spec(spec)
+    sys.modules["agent_module"] = agent_module
+    spec.loader.exec_module(agent_module)
 root_agent = agent_module.root_agent
+flashcard_agent = agent_module.flashcard_agent
+quiz_agent = agent_module.quiz_agent
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -62,31 +99,32 @@ app = FastAPI(
     description="Generate flashcards and quizzes from educational content",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
-# API Key validation middleware
-@app.middleware("http")
-async def validate_api_key(request: Request, call_next):
-    # Allow health check and root endpoint without API key
-    if request.url.path in ["/", "/health", "/docs", "/redoc", "/openapi.json"]:
-        response = await call_next(request)
-        return response
-    
-    # Check for API key in headers
-    api_key = request.headers.get("X-API-Key")
-    if not api_key or api_key != API_SECRET_KEY:
-        return JSONResponse(
-            status_code=401,
-            content={
-                "success": False,
-                "message": "Invalid or missing API key",
-                "error": "Unauthorized access"
-            }
-        )
-    
-    response = await call_next(request)
-    return response
+# Reject oversized request bodies before they are parsed (innermost, so
+# unauthenticated requests are turned away without reading the body)
+app.add_middleware(RequestSizeLimitMiddleware)
+
+# API key check as plain ASGI middleware; model calls made for a request
+# count against its API key's concurrency cap
+app.add_middleware(
+    ApiKeyMiddleware,
+    api_key=API_SECRET_KEY,
+    client_keys=API_CLIENT_KEYS,
+    is_public=lambda path: path == "/metrics" and metrics.METRICS_PUBLIC,
+    on_authorized=set_caller_key,
+)
+
+# Request metrics (wraps the API key check, so rejected requests are counted too)
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+# Request id for log records, echoed in the X-Request-ID response header
+app.add_middleware(RequestIdMiddleware)
+
+# Compress large JSON responses for clients that accept br or gzip
+app.add_middleware(CompressionMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -97,9 +135,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize session service
-session_service = InMemorySessionService()
-logger.info("Initialized InMemorySessionService for StudyWithAI API")
+# Initialize bounded session service
+session_service = create_session_service()
+
+# Create one runner per entry agent: the root agent for routed and free-form
+# requests, and each sub-agent for direct dispatch
+APP_NAME = "studywithai_api"
+API_USER_ID = "api_user"
+def build_runners(root, flashcards, quiz) -> Dict[str, Runner]:
+    return {
+        ROUTED: Runner(agent=root, app_name=APP_NAME, session_service=session_service),
+        "flashcards": Runner(agent=flashcards, app_name=APP_NAME, session_service=session_service),
+        "quiz": Runner(agent=quiz, app_name=APP_NAME, session_service=session_service),
+    }
+
+runners = build_runners(root_agent, flashcard_agent, quiz_agent)
+dispatch_stats = DispatchStats()
+
+# Model tiers: every tier gets its own agent tree and runners, except that
+# tiers on the default model share the agents above
+model_tiers = parse_tiers(MODEL_TIERS, agent_module.GEMINI_MODEL)
+tier_router = TierRouter(model_tiers)
+tier_agents = {
+    tier.name: (root_agent, flashcard_agent, quiz_agent) if tier.model == agent_module.GEMINI_MODEL
+    else agent_module.create_agents(tier.model)
+    for tier in model_tiers
+}
+tier_runners = {
+    name: runners if agents[0] is root_agent else build_runners(*agents)
+    for name, agents in tier_agents.items()
+}
+
+# Batch limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Initialize PDF extraction pool (worker processes start on first use)
+pdf_pool = PdfExtractionPool()
+
+# Initialize extracted PDF text cache
+pdf_text_cache = create_pdf_text_cache()
+
+# Initialize generation result cache (None unless GENERATION_CACHE_BACKEND is set)
+generation_cache = create_generation_cache()
+
+# Readiness and drain state of this worker
+lifecycle = Lifecycle()
+
+# Uploaded documents referenced by doc_id in later requests
+document_store = create_document_store()
+
+# Identical concurrent generations share one upstream model call
+inflight_generations = SingleFlight()
+
+# Concurrency, rate and retry control for every model call
+model_governor = ModelCallGovernor(
+    callers=len({API_SECRET_KEY, *API_CLIENT_KEYS}),
+    observe_wait=lambda seconds: record_stage("queue", seconds),
+)
 
 # Pydantic models for response
 class Flashcard(BaseModel):
@@ -120,169 +213,1150 @@ class FlashcardResponse(BaseModel):
     success: bool
     message: str
     session_id: str
+    cached: bool = False
+    metadata: Dict[str, Any] = {}
     flashcards: List[Flashcard]
 
 class QuizResponse(BaseModel):
     success: bool
     message: str
     session_id: str
+    cached: bool = False
+    metadata: Dict[str, Any] = {}
+    quiz_questions: List[QuizQuestion]
+
+class StudySetResponse(BaseModel):
+    success: bool
+    message: str
+    session_id: str
+    metadata: Dict[str, Any] = {}
+    flashcards: List[Flashcard]
     quiz_questions: List[QuizQuestion]
 
+class JobResponse(BaseModel):
+    success: bool
+    job_id: str
+    status: str
+    material_type: str
+    priority: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cached: bool = False
+    metadata: Dict[str, Any] = {}
+    error: Optional[str] = None
+    flashcards: Optional[List[Flashcard]] = None
+    quiz_questions: Optional[List[QuizQuestion]] = None
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    prompt: str
+    material_type: str = "flashcards"
+    num_items: int = 10
+    files: List[str] = []
+    use_cache: bool = True
+    dispatch_mode: Optional[str] = None
+
 # Helper functions
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    """Extract text content from PDF bytes."""
+def extraction_cache_key(digest: str, ranges: Optional[PageRanges], max_chars: int) -> str:
+    """Text cache key of a PDF extraction; whole-document extractions are keyed by the digest alone."""
+    if ranges is None and not max_chars:
+        return digest
+    pages = ",".join(f"{start + 1}-{'' if stop is None else stop}" for start, stop in ranges or [(0, None)])
+    return f"{digest}:pages={pages}:max_chars={max_chars}"
+
+async def extract_text_from_pdf(source: PdfSource, digest: str, ranges: Optional[PageRanges] = None, max_chars: int = 0) -> Tuple[str, Dict[str, Any]]:
+    """Extract the selected pages of PDF bytes or a PDF file, reusing cached text for identical requests.
+
+    ``digest`` is the SHA-256 digest of the PDF bytes. Extraction stops once
+    ``max_chars`` characters are collected (0 for no limit). Returns the
+    text and its extraction statistics.
+    """
+    cache_key = extraction_cache_key(digest, ranges, max_chars)
+    cached_text = await pdf_text_cache.get(cache_key)
+    if cached_text is not None:
+        return cached_text, {"cached": True, "chars": len(cached_text)}
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
-    except Exception as e:
+        with timed_stage("extract"):
+            extraction = await pdf_pool.extract(source, ranges, max_chars)
+    except ExtractionPoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="PDF extraction is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except PdfExtractionError as e:
         raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+    text = extraction.text
+    await pdf_text_cache.set(cache_key, text)
+    return text, extraction.stats()
 
-def parse_flashcards(response: str) -> List[dict]:
-    """Parse flashcard response from JSON format."""
+async def extract_upload_text(file: UploadFile, ranges: Optional[PageRanges] = None, max_chars: int = 0) -> Tuple[str, Dict[str, Any]]:
+    """Spool an uploaded PDF to disk under the size limit and extract the selected pages.
+
+    Returns the text and its extraction statistics.
+    """
     try:
-        # Log the raw response for debugging
-        logger.info(f"Raw flashcard response: {response[:500]}...")
-        
-        # Clean up the response - remove markdown code blocks if present
-        clean_response = response.strip()
-        if clean_response.startswith('```json'):
-            clean_response = clean_response[7:]
-        if clean_response.endswith('```'):
-            clean_response = clean_response[:-3]
-        clean_response = clean_response.strip()
-        
-        logger.info(f"Cleaned response: {clean_response[:500]}...")
-        
-        data = json.loads(clean_response)
-        flashcards = []
-        
-        if 'flashcards' in data:
-            raw_flashcards = data['flashcards']
-            logger.info(f"Found {len(raw_flashcards)} raw flashcards")
+        with timed_stage("upload"):
+            spooled = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        # The request's own copy of the upload is no longer needed
+        await file.close()
+    try:
+        return await extract_text_from_pdf(spooled.source, spooled.digest, ranges, max_chars)
+    finally:
+        spooled.close()
+
+async def condense_file_texts(texts: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+    """Strip boilerplate from extracted texts and fit them to the token budget.
+
+    Returns the condensed texts and response metadata reporting the
+    original and condensed sizes (empty when condensation is disabled).
+    """
+    if not CONDENSE_ENABLED or not texts:
+        return [text.replace(PAGE_BREAK, "\n") for text in texts], {}
+    with timed_stage("condense"):
+        texts, condensation = await asyncio.to_thread(condense_documents, texts)
+    return texts, {"condensation": condensation}
+
+def parse_file_page_ranges(page_ranges: Optional[str], filenames: List[str]) -> Dict[str, PageRanges]:
+    """Parse the ``page_ranges`` form field into page ranges per filename.
+
+    The field is either a JSON object mapping filenames to selections such
+    as ``"1-3,7,10-"``, or a single selection applied to every file.
+    """
+    if not page_ranges or not page_ranges.strip():
+        return {}
+    try:
+        if page_ranges.strip().startswith("{"):
+            selections = json.loads(page_ranges)
+            unknown = [name for name in selections if name not in filenames]
+            if unknown:
+                raise ValueError(f"page_ranges refers to files that were not uploaded: {', '.join(unknown)}")
+            return {name: parse_page_ranges(str(spec)) for name, spec in selections.items()}
+        ranges = parse_page_ranges(page_ranges)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {name: ranges for name in filenames}
+
+async def extract_files(files: Optional[List[UploadFile]], page_ranges: Optional[str] = None) -> Tuple[List[str], List[str], Dict[str, Any]]:
+    """Extract the text of uploaded PDF files, rejecting any other file type.
+
+    Only the pages selected by ``page_ranges`` are read, and extraction
+    stops once PDF_EXTRACTION_MAX_CHARS characters have been collected
+    across the files; files past the budget are skipped. Returns the
+    filenames, their texts and metadata with per-file extraction statistics.
+    """
+    names, texts, stats = [], [], {}
+    if not files:
+        return names, texts, {}
+    for file in files:
+        if not file.filename.endswith('.pdf'):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+    ranges = parse_file_page_ranges(page_ranges, [file.filename for file in files])
+    remaining = PDF_EXTRACTION_MAX_CHARS
+    for file in files:
+        if PDF_EXTRACTION_MAX_CHARS and remaining <= 0:
+            stats[file.filename] = {"skipped": "character budget reached"}
+            await file.close()
+            continue
+        text, stats[file.filename] = await extract_upload_text(file, ranges.get(file.filename), max(remaining, 0))
+        remaining -= len(text)
+        names.append(file.filename)
+        texts.append(text)
+    return names, texts, {"extraction": stats}
+
+def file_sections(names: List[str], texts: List[str]) -> str:
+    """Format file texts the way they are appended to the prompt."""
+    return "".join(f"\n\nContent from {name}:\n{text}" for name, text in zip(names, texts))
+
+async def call_document_store(method, *args):
+    """Call a document store method, in a worker thread when the store blocks."""
+    if document_store.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+async def get_document(doc_id: Optional[str]) -> Optional[Document]:
+    """Look up a stored document, or None when no doc_id was given."""
+    if not doc_id:
+        return None
+    document = await call_document_store(document_store.get, doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found or expired")
+    return document
+
+async def collect_content(prompt: str, files: Optional[List[UploadFile]], doc_id: Optional[str] = None, page_ranges: Optional[str] = None) -> Tuple[str, Dict[str, Any], Optional[List[str]]]:
+    """Combine the prompt with a stored document and the condensed text of any uploaded PDF files.
+
+    Returns the content, metadata describing how it was condensed, and the
+    stored document's precomputed chunks when they still apply (no other
+    files were uploaded).
+    """
+    document = await get_document(doc_id)
+    names, texts, extraction_metadata = await extract_files(files, page_ranges)
+    texts, content_metadata = await condense_file_texts(texts)
+    content_metadata = {**extraction_metadata, **content_metadata}
+    parts = [prompt]
+    chunks = None
+    if document is not None:
+        parts.append(document.body)
+        content_metadata = {"doc_id": document.id, **document.metadata, **content_metadata}
+        chunks = document.chunks if not names else None
+    parts.append(file_sections(names, texts))
+    return "".join(parts), content_metadata, chunks
+
+async def extract_batch_files(files: Optional[List[UploadFile]]) -> Dict[str, Any]:
+    """Extract every uploaded PDF of a batch once, keyed by filename.
+
+    Failures are stored in place of the text so only the items that
+    reference a broken file fail. At most one file per pool worker is
+    extracted at a time, so a large batch keeps the pool busy without
+    filling its queue and being rejected.
+    """
+    if not files:
+        return {}
+    limit = asyncio.Semaphore(min(pdf_pool.max_workers, pdf_pool.max_queue))
+    
+    async def extract(file: UploadFile):
+        if not file.filename.endswith('.pdf'):
+            return HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+        try:
+            async with limit:
+                text, _ = await extract_upload_text(file, max_chars=PDF_EXTRACTION_MAX_CHARS)
+            return text
+        except HTTPException as e:
+            return e
+    
+    texts = await asyncio.gather(*[extract(file) for file in files])
+    return {file.filename: text for file, text in zip(files, texts)}
+
+def as_text(value: Any) -> str:
+    """Coerce a model-supplied field to a string ("" for missing values)."""
+    if isinstance(value, str):
+        return value
+    return "" if value is None else str(value)
+
+def as_number(value: Any, default: int) -> int:
+    """Coerce a model-supplied item number to an int, falling back to its position."""
+    if isinstance(value, bool):
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def normalize_flashcard(card: dict, index: int) -> Optional[dict]:
+    """Fill in and coerce flashcard fields, or return None if the front or back is missing.
+
+    Items are validated here once; responses serialize them as they are.
+    """
+    flashcard = {
+        'number': as_number(card.get('number'), index),
+        'front': as_text(card.get('front')),
+        'back': as_text(card.get('back'))
+    }
+    if flashcard['front'] and flashcard['back']:  # Only keep if both front and back exist
+        return flashcard
+    return None
+
+def normalize_quiz_question(question: dict, index: int) -> Optional[dict]:
+    """Fill in and coerce quiz question fields, or return None if the question or answer is missing."""
+    options = question.get('options')
+    quiz_question = {
+        'number': as_number(question.get('number'), index),
+        'type': as_text(question.get('type')) or 'multiple_choice',
+        'difficulty': as_text(question.get('difficulty')) or 'medium',
+        'question': as_text(question.get('question')),
+        'options': [as_text(option) for option in options] if isinstance(options, list) else [],
+        'answer': as_text(question.get('answer')),
+        'explanation': as_text(question.get('explanation'))
+    }
+    if quiz_question['question'] and quiz_question['answer']:  # Only keep if question and answer exist
+        return quiz_question
+    return None
+
+# Array key in the model's JSON output for each material type
+RESPONSE_KEYS = {"flashcards": "flashcards", "quiz": "quiz_questions"}
+
+def parse_response(response: str, material_type: str) -> Tuple[List[dict], ArrayParseResult]:
+    """Parse the model's JSON output into normalized study items.
+
+    The payload is located anywhere in the response. When the document is
+    malformed or truncated, every complete element is still recovered.
+    Returns the valid items and the raw parse result.
+    """
+    if payload_sampled(logger):
+        logger.debug("Raw %s response: %s", material_type, response, extra={"material_type": material_type})
+    normalize = normalize_flashcard if material_type == "flashcards" else normalize_quiz_question
+    result = parse_array(response, RESPONSE_KEYS[material_type])
+    if not result.complete:
+        metrics.PARSE_FAILURES.inc(1, material_type)
+
+    items = []
+    skipped = []
+    for i, raw_item in enumerate(result.items, 1):
+        item = normalize(raw_item, i)
+        if item:
+            items.append(item)
         else:
-            logger.warning("No 'flashcards' key found in response data")
-            raw_flashcards = []
-        
-        # Ensure each flashcard has the required fields
-        for i, card in enumerate(raw_flashcards, 1):
-            if isinstance(card, dict):
-                flashcard = {
-                    'number': card.get('number', i),
-                    'front': card.get('front', ''),
-                    'back': card.get('back', '')
-                }
-                if flashcard['front'] and flashcard['back']:  # Only add if both front and back exist
-                    flashcards.append(flashcard)
-                    logger.info(f"Added flashcard {i}: front='{flashcard['front'][:50]}...', back='{flashcard['back'][:50]}...'")
-                else:
-                    logger.warning(f"Skipped flashcard {i}: missing front or back content")
-        
-        logger.info(f"Returning {len(flashcards)} valid flashcards")
-        return flashcards
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
-        logger.error(f"Failed to parse response: {response[:200]}...")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error in parse_flashcards: {e}")
-        return []
+            skipped.append(i)
+
+    # One summary record per response; item content is never logged here
+    if not result.found:
+        level, outcome = logging.ERROR, f"no {RESPONSE_KEYS[material_type]} array found"
+    elif not result.complete:
+        level, outcome = logging.WARNING, "malformed or truncated, salvaged"
+    else:
+        level, outcome = (logging.WARNING if skipped else logging.INFO), "complete"
+    logger.log(
+        level,
+        "Parsed %s response (%s): %d valid, %d skipped", material_type, outcome, len(items), len(skipped),
+        extra={
+            "material_type": material_type,
+            "response_chars": len(response),
+            "complete": result.complete,
+            "elements": len(result.items),
+            "valid_items": len(items),
+            "skipped_items": skipped,
+        },
+    )
+    return items, result
+
+def parse_flashcards(response: str) -> List[dict]:
+    """Parse flashcard response from JSON format."""
+    return parse_response(response, "flashcards")[0]
 
 def parse_quiz_questions(response: str) -> List[dict]:
     """Parse quiz response from JSON format."""
-    try:
-        # Clean up the response - remove markdown code blocks if present
-        clean_response = response.strip()
-        if clean_response.startswith('```json'):
-            clean_response = clean_response[7:]
-        if clean_response.endswith('```'):
-            clean_response = clean_response[:-3]
-        clean_response = clean_response.strip()
-        
-        data = json.loads(clean_response)
-        quiz_questions = []
-        
-        if 'quiz_questions' in data:
-            raw_questions = data['quiz_questions']
-        else:
-            raw_questions = []
-        
-        # Ensure each quiz question has the required fields
-        for i, question in enumerate(raw_questions, 1):
-            if isinstance(question, dict):
-                quiz_question = {
-                    'number': question.get('number', i),
-                    'type': question.get('type', 'multiple_choice'),
-                    'difficulty': question.get('difficulty', 'medium'),
-                    'question': question.get('question', ''),
-                    'options': question.get('options', []) if question.get('options') else [],
-                    'answer': question.get('answer', ''),
-                    'explanation': question.get('explanation', '')
-                }
-                if quiz_question['question'] and quiz_question['answer']:  # Only add if question and answer exist
-                    quiz_questions.append(quiz_question)
-        
-        return quiz_questions
-    except json.JSONDecodeError:
-        return []
+    return parse_response(response, "quiz")[0]
 
-async def generate_study_materials(content: str, material_type: str, session_id: str, num_items: int) -> str:
-    """Generate study materials using the StudyWithAI agent."""
-    try:
-        app_name = "studywithai_api"
-        user_id = "api_user"
-        
-        # Create or get session
-        try:
-            session = session_service.get_session(app_name, user_id, session_id)
-        except:
-            session = session_service.create_session(
-                app_name=app_name,
-                user_id=user_id,
-                session_id=session_id,
-                state={}
-            )
-        
-        # Create the prompt based on material type
-        if material_type.lower() == "flashcards":
-            prompt = f"Create {num_items} flashcards from this educational content:\n\n{content}"
-        elif material_type.lower() == "quiz":
-            prompt = f"Create a quiz with {num_items} questions from this educational content:\n\n{content}"
-        
-        # Create a runner for the agent
-        runner = Runner(
-            agent=root_agent,
-            app_name=app_name,
-            session_service=session_service,
+def prepare_run(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str, tier: Optional[ModelTier] = None) -> Tuple[Runner, types.Content, str]:
+    """Create the session and pick the runner and user message for a generation.
+
+    In direct mode flashcard and quiz requests go straight to the matching
+    sub-agent; routed mode and free-form requests go through the root agent.
+    The runners of ``tier`` are used when one is given.
+    Returns the runner, the message and the dispatch mode actually used.
+    """
+    tier_set = tier_runners[tier.name] if tier is not None else runners
+    # Create or get session
+    session = session_service.get_session(app_name=APP_NAME, user_id=API_USER_ID, session_id=session_id)
+    if session is None:
+        session = session_service.create_session(
+            app_name=APP_NAME,
+            user_id=API_USER_ID,
+            session_id=session_id,
+            state={}
         )
-        
-        # Format message to the agent
-        content_obj = types.Content(role="user", parts=[types.Part(text=prompt)])
+    
+    # Create the prompt based on material type
+    if material_type.lower() == "flashcards":
+        prompt = f"Create {num_items} flashcards from this educational content:\n\n{content}"
+    elif material_type.lower() == "quiz":
+        prompt = f"Create a quiz with {num_items} questions from this educational content:\n\n{content}"
+    else:
+        prompt = content
+    
+    # Pick the runner for the entry agent
+    if dispatch_mode == DIRECT and material_type.lower() in tier_set:
+        runner = tier_set[material_type.lower()]
+    else:
+        dispatch_mode = ROUTED
+        runner = tier_set[ROUTED]
+    
+    # Format message to the agent
+    content_obj = types.Content(role="user", parts=[types.Part(text=prompt)])
+    return runner, content_obj, dispatch_mode
+
+def release_session(session_id: str):
+    """Drop a one-shot session once its response has been built."""
+    if SESSION_DROP_AFTER_RESPONSE:
+        session_service.delete_session(app_name=APP_NAME, user_id=API_USER_ID, session_id=session_id)
+
+def record_generation_metrics(event_count: int, prompt_chars: int, output_chars: int, usage: Optional[Tuple[int, int]]):
+    """Record event and token counts for one model generation.
+
+    Token counts come from the model's usage metadata when the events carry
+    it and are estimated from the text otherwise.
+    """
+    if usage is None:
+        usage = (estimate_tokens(prompt_chars), estimate_tokens(output_chars))
+    prompt_tokens, output_tokens = usage
+    metrics.EVENTS_PER_GENERATION.observe(event_count)
+    metrics.TOKENS.inc(prompt_tokens, "prompt")
+    metrics.TOKENS.inc(output_tokens, "output")
+    metrics.TOKENS_PER_GENERATION.observe(prompt_tokens + output_tokens)
+
+def event_usage(event) -> Optional[Tuple[int, int]]:
+    """Return (prompt, output) token counts reported on an event, if any."""
+    usage = getattr(event, "usage_metadata", None)
+    if usage is None:
+        return None
+    return usage.prompt_token_count or 0, usage.candidates_token_count or 0
+
+async def run_generation(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str, tier: Optional[ModelTier] = None) -> str:
+    """Run the agents of ``tier`` once and return the final response text."""
+    try:
+        runner, content_obj, dispatch_mode = prepare_run(content, material_type, session_id, num_items, dispatch_mode, tier)
         final_response = None
+        start = time.perf_counter()
+        root_done_at = None
+        routing_hop_ms = None
+        event_count = 0
+        usage = None
         
         # Process the agent's response
         async for event in runner.run_async(
-            user_id=user_id,
+            user_id=API_USER_ID,
             session_id=session_id,
             new_message=content_obj
         ):
+            event_count += 1
+            metrics.ADK_EVENTS.inc(1, event.author)
+            usage = event_usage(event) or usage
+            # The routing hop is everything the root agent does before a sub-agent takes over
+            if dispatch_mode == ROUTED and routing_hop_ms is None:
+                if event.author == root_agent.name:
+                    root_done_at = time.perf_counter()
+                elif root_done_at is not None:
+                    routing_hop_ms = (root_done_at - start) * 1000
             if event.is_final_response():
                 final_response = event
         
+        elapsed = time.perf_counter() - start
+        dispatch_stats.record(dispatch_mode, elapsed * 1000, routing_hop_ms)
+        if tier is not None:
+            tier_router.observe(tier, elapsed)
+        routing_hop = (routing_hop_ms or 0) / 1000
+        if routing_hop_ms is not None:
+            record_stage("routing", routing_hop)
+        record_stage("agent", elapsed - routing_hop)
+        
         # Extract the response text
         if final_response and final_response.content and final_response.content.parts:
             response_text = ""
             for part in final_response.content.parts:
-                if hasattr(part, 'text'):
+                if hasattr(part, 'text') and part.text:
                     response_text += part.text
+            record_generation_metrics(event_count, len(content_obj.parts[0].text), len(response_text), usage)
             return response_text
         else:
             raise HTTPException(status_code=500, detail="No response received from agent")
+    finally:
+        release_session(session_id)
+
+def governor_http_error(error: Exception) -> HTTPException:
+    """Map a governor rejection to the status clients should back off on."""
+    if isinstance(error, ModelRateLimited):
+        detail = "Model quota exceeded, please retry shortly"
+        status_code = 429
+    else:
+        detail = "Model capacity is saturated, please retry shortly"
+        status_code = 503
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(error.retry_after)})
+
+async def generate_study_materials(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str = ROUTED) -> str:
+    """Generate study materials using the StudyWithAI agents.
+
+    The model tier is picked from the content size and item count. The call
+    goes through the model call governor, which queues it behind the
+    concurrency and rate limits and retries transient failures with a fresh
+    session. A call that runs out of quota, or an attempt that runs past
+    its tier's timeout, is retried on the next faster tier.
+    """
+    tier, _ = tier_router.select(len(content), num_items)
+    while True:
+        try:
+            result = await model_governor.call(
+                lambda suffix: tier.limit(
+                    run_generation(content, material_type, f"{session_id}{suffix}", num_items, dispatch_mode, tier)
+                )
+            )
+        except ModelRateLimited as e:
+            metrics.MODEL_TIER_CALLS.inc(1, tier.name, QUOTA)
+            tier_router.mark_quota_exhausted(tier)
+            fallback = tier_router.fallback(tier, QUOTA)
+            if fallback is None:
+                raise governor_http_error(e)
+        except TierTimeout:
+            metrics.MODEL_TIER_CALLS.inc(1, tier.name, TIMEOUT)
+            fallback = tier_router.fallback(tier, TIMEOUT)
+            if fallback is None:
+                raise HTTPException(status_code=504, detail=f"Model call timed out after {tier.timeout}s")
+        except GovernorSaturated as e:
+            raise governor_http_error(e)
+        except HTTPException:
+            metrics.MODEL_TIER_CALLS.inc(1, tier.name, "error")
+            raise
+        except Exception as e:
+            metrics.MODEL_TIER_CALLS.inc(1, tier.name, "error")
+            raise HTTPException(status_code=500, detail=f"Error generating study materials: {str(e)}")
+        else:
+            metrics.MODEL_TIER_CALLS.inc(1, tier.name, "ok")
+            record_tier_use(tier)
+            return result
+        tier = fallback
+        session_id = f"{session_id}-{tier.name}"
+
+def renumber(items: List[dict]) -> List[dict]:
+    """Number merged items sequentially from 1."""
+    for number, item in enumerate(items, 1):
+        item['number'] = number
+    return items
+
+async def generate_and_parse(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str, stats: Optional[Counter] = None, complete_truncated: bool = True) -> List[dict]:
+    """Run one generation and parse its items.
+
+    When the response was cut off, the complete items are kept and one
+    follow-up generation asks for just the missing remainder. Salvage
+    counts are added to ``stats`` when it is given.
+    """
+    response = await generate_study_materials(content, material_type, session_id, num_items, dispatch_mode)
+    with timed_stage("parse"):
+        items, result = parse_response(response, material_type)
+    metrics.GENERATIONS.inc(1, material_type)
+    if not items:
+        metrics.EMPTY_RESULTS.inc(1, material_type)
+    if not result.truncated or not items:
+        return items
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating study materials: {str(e)}")
+    metrics.SALVAGED_ITEMS.inc(len(items), material_type)
+    if stats is not None:
+        stats["salvaged_items"] += len(items)
+    missing = num_items - len(items)
+    if complete_truncated and missing > 0:
+        items.extend(await generate_remainder(content, material_type, session_id, items, missing, dispatch_mode, stats))
+    return renumber(items[:num_items])
+
+async def generate_remainder(content: str, material_type: str, session_id: str, existing: List[dict], missing: int, dispatch_mode: str, stats: Optional[Counter] = None) -> List[dict]:
+    """Generate the ``missing`` items a truncated response did not deliver.
+
+    The prompt lists the items already recovered so they are not repeated.
+    A failed follow-up is logged and yields no items.
+    """
+    try:
+        extra = await generate_and_parse(
+            topup_content(content, existing, material_type), material_type, f"{session_id}-rest", missing,
+            dispatch_mode, stats, complete_truncated=False
+        )
+    except HTTPException as e:
+        logger.warning("Remainder %s generation failed: %s", material_type, e.detail, extra={"material_type": material_type})
+        return []
+    if stats is not None:
+        stats["remainder_items"] += len(extra)
+    return extra[:missing]
+
+def plan_generation(content: str, num_items: int, chunks: Optional[List[str]] = None) -> List[Tuple[str, int]]:
+    """Split a request into sub-generation prompts paired with their share of the items.
+
+    Content larger than CHUNKING_THRESHOLD_CHARS is split into chunks, and
+    requests for more than FANOUT_THRESHOLD_ITEMS items are fanned out so no
+    single generation has to produce more than FANOUT_BATCH_ITEMS. Parts that
+    are allocated no items are left out. ``chunks`` are the precomputed
+    chunks of the file contents, reused when the prompt fits in the shared
+    header.
+    """
+    if len(content) > CHUNKING_THRESHOLD_CHARS:
+        header, body = split_header(content)
+        if chunks is None or not header:
+            chunks = chunk_text(body)
+        allocation = allocate_items([len(chunk) for chunk in chunks], num_items)
+        planned = [
+            (f"{header}\n\n(Part {i + 1} of {len(chunks)} of the material)\n\n{chunk}".strip(), count)
+            for i, (chunk, count) in enumerate(zip(chunks, allocation))
+        ]
+    else:
+        planned = [(content, num_items)]
+    if num_items > FANOUT_THRESHOLD_ITEMS:
+        planned = [part for part_content, count in planned for part in fan_out(part_content, count)]
+    return [(part_content, count) for part_content, count in planned if count > 0]
+
+def needs_split(content: str, num_items: int) -> bool:
+    return len(content) > CHUNKING_THRESHOLD_CHARS or num_items > FANOUT_THRESHOLD_ITEMS
+
+def split_concurrency(num_items: int) -> int:
+    """Concurrent sub-generations allowed for one request."""
+    return FANOUT_CONCURRENCY if num_items > FANOUT_THRESHOLD_ITEMS else CHUNK_CONCURRENCY
+
+async def generate_chunked(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str, chunks: Optional[List[str]] = None) -> Tuple[List[dict], dict]:
+    """Map-reduce generation for large documents and large item counts.
+
+    The request is planned into sub-generations (chunks of the document,
+    fan-out batches, or both), which run concurrently under the request's
+    concurrency cap and are merged in plan order. Parts that fail are
+    retried once as long as at least one part succeeded.
+    """
+    planned = plan_generation(content, num_items, chunks)
+    semaphore = asyncio.Semaphore(split_concurrency(num_items))
+    stats = Counter()
+    
+    async def generate_chunk(index: int, chunk_content: str, count: int, session_suffix: str = "") -> List[dict]:
+        async with semaphore:
+            return await generate_and_parse(chunk_content, material_type, f"{session_id}-{index}{session_suffix}", count, dispatch_mode, stats)
+    
+    results = await asyncio.gather(
+        *[generate_chunk(i, chunk_content, count) for i, (chunk_content, count) in enumerate(planned)],
+        return_exceptions=True
+    )
+    
+    failed = [i for i, result in enumerate(results) if isinstance(result, BaseException)]
+    retried = 0
+    if failed and len(failed) < len(planned):
+        retried = len(failed)
+        retry_results = await asyncio.gather(
+            *[generate_chunk(i, *planned[i], session_suffix="-retry") for i in failed],
+            return_exceptions=True
+        )
+        for i, result in zip(failed, retry_results):
+            results[i] = result
+    
+    items = []
+    failures = [result for result in results if isinstance(result, BaseException)]
+    for result in results:
+        if not isinstance(result, BaseException):
+            items.extend(result)
+    if failures and not items:
+        raise failures[0]
+    if failures:
+        logger.warning("%d of %d chunks failed during %s generation", len(failures), len(planned), material_type, extra={"material_type": material_type})
+    
+    metadata = {"chunks": len(planned), "failed_chunks": len(failures), "retried_chunks": retried, **stats}
+    return renumber(items[:num_items]), metadata
+
+# Existing items listed in a top-up prompt, and how much of each is shown
+TOPUP_MAX_LISTED = 50
+TOPUP_LISTED_CHARS = 100
+
+def topup_content(content: str, existing: List[dict], material_type: str) -> str:
+    """Append the items already generated to the content so a follow-up generation avoids them."""
+    field = DEDUP_FIELDS[material_type]
+    listed = "\n".join(f"- {item.get(field, '')[:TOPUP_LISTED_CHARS]}" for item in existing[:TOPUP_MAX_LISTED])
+    return f"{content}\n\nThese are already covered. Do not repeat or rephrase them; cover different points:\n{listed}"
+
+async def top_up(content: str, material_type: str, session_id: str, existing: List[dict], missing: int, index: NearDuplicateIndex, dispatch_mode: str) -> List[dict]:
+    """Generate up to ``missing`` more items that are not near-duplicates of those in ``index``.
+
+    A failed follow-up generation is logged and yields no items, since the
+    original items are still a usable result.
+    """
+    try:
+        extra = await generate_and_parse(
+            topup_content(content, existing, material_type), material_type, f"{session_id}-topup", missing, dispatch_mode
+        )
+    except HTTPException as e:
+        logger.warning("Top-up %s generation failed: %s", material_type, e.detail, extra={"material_type": material_type})
+        return []
+    extra, _ = dedup_items(extra, material_type, index)
+    return extra[:missing]
+
+async def dedup_and_top_up(items: List[dict], content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str) -> Tuple[List[dict], dict]:
+    """Drop near-duplicate items and, when that leaves too few, generate replacements once."""
+    with timed_stage("dedup"):
+        kept, index = dedup_items(items, material_type)
+    removed = len(items) - len(kept)
+    topped_up = 0
+    if removed:
+        metrics.DUPLICATES_REMOVED.inc(removed, material_type)
+        missing = num_items - len(kept)
+        if DEDUP_TOPUP and missing > 0:
+            extra = await top_up(content, material_type, session_id, kept, missing, index, dispatch_mode)
+            kept.extend(extra)
+            topped_up = len(extra)
+        logger.info("Removed %d duplicate %s items, topped up %d", removed, material_type, topped_up, extra={"material_type": material_type})
+    return renumber(kept), {"duplicates_removed": removed, "topped_up": topped_up}
+
+async def generate_items(content: str, material_type: str, session_id: str, num_items: int, use_cache: bool = True, dispatch_mode: Optional[str] = None, chunks: Optional[List[str]] = None) -> Tuple[List[dict], bool, dict]:
+    """Generate and parse study items, serving repeated requests from the generation cache.
+
+    Identical requests that arrive while a generation is in flight join it
+    instead of starting their own model call. Documents larger than
+    CHUNKING_THRESHOLD_CHARS and requests for more than FANOUT_THRESHOLD_ITEMS
+    items are split into concurrent sub-generations. Near-duplicate items
+    are dropped and replaced by a follow-up generation. Returns the parsed
+    items, whether they were served from the cache, and generation metadata.
+    """
+    try:
+        mode = resolve_dispatch_mode(dispatch_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    key = generation_key(content, material_type, num_items)
+    if generation_cache is not None and use_cache:
+        items = await generation_cache.get(key)
+        if items is not None:
+            return items, True, {}
+    
+    async def generate_uncached() -> Tuple[List[dict], dict]:
+        tier_usage = track_tier_usage()
+        if needs_split(content, num_items):
+            items, metadata = await generate_chunked(content, material_type, session_id, num_items, mode, chunks)
+        else:
+            stats = Counter()
+            items = await generate_and_parse(content, material_type, session_id, num_items, mode, stats)
+            metadata = dict(stats)
+        if DEDUP_ENABLED and items:
+            items, dedup_metadata = await dedup_and_top_up(items, content, material_type, session_id, num_items, mode)
+            metadata.update(dedup_metadata)
+        # Only cache useful results so a failed parse is retried on the next request
+        if generation_cache is not None and items:
+            await generation_cache.set(key, items)
+        metadata["dispatch_mode"] = mode
+        metadata["model_tiers"] = dict(tier_usage)
+        if mode == DIRECT:
+            metadata["latency_saved_ms"] = dispatch_stats.estimated_saving_ms()
+        return items, metadata
+    
+    (items, metadata), _ = await inflight_generations.do(key, generate_uncached)
+    return items, False, dict(metadata)
+
+async def stream_generation(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str, tier: Optional[ModelTier] = None) -> AsyncIterator[str]:
+    """Run the agents of ``tier`` once, yielding output text as the model produces it."""
+    runner, content_obj, dispatch_mode = prepare_run(content, material_type, session_id, num_items, dispatch_mode, tier)
+    saw_partial = False
+    start = time.perf_counter()
+    event_count = 0
+    usage = None
+    output_chars = 0
+    try:
+        async for event in runner.run_async(
+            user_id=API_USER_ID,
+            session_id=session_id,
+            new_message=content_obj,
+            run_config=RunConfig(streaming_mode=StreamingMode.SSE)
+        ):
+            event_count += 1
+            metrics.ADK_EVENTS.inc(1, event.author)
+            if not event.partial:
+                usage = event_usage(event) or usage
+            if not (event.content and event.content.parts):
+                continue
+            text = "".join(part.text for part in event.content.parts if part.text)
+            # Partial events carry deltas; the aggregated final event repeats them
+            if event.partial:
+                saw_partial = True
+                output_chars += len(text)
+                yield text
+            elif event.is_final_response() and not saw_partial:
+                output_chars += len(text)
+                yield text
+        if tier is not None:
+            tier_router.observe(tier, time.perf_counter() - start)
+    finally:
+        record_stage("agent", time.perf_counter() - start)
+        record_generation_metrics(event_count, len(content_obj.parts[0].text), output_chars, usage)
+        release_session(session_id)
+
+async def stream_study_materials(content: str, material_type: str, session_id: str, num_items: int, dispatch_mode: str) -> AsyncIterator[str]:
+    """Yield the agent's output text incrementally as the model produces it.
+
+    The stream holds a model call governor slot while it runs. Transient
+    failures before any text has been produced are retried with a fresh
+    session, and quota exhaustion moves the stream to the next faster model
+    tier; once text has been sent the error is raised.
+    """
+    tier, _ = tier_router.select(len(content), num_items)
+    attempt = 0
+    while True:
+        produced = False
+        try:
+            async with model_governor.slot():
+                suffix = f"-retry{attempt}" if attempt else ""
+                async for text in stream_generation(content, material_type, f"{session_id}{suffix}", num_items, dispatch_mode, tier):
+                    produced = True
+                    yield text
+                model_governor.limiter.on_success()
+                metrics.MODEL_TIER_CALLS.inc(1, tier.name, "ok")
+                record_tier_use(tier)
+                return
+        except GovernorSaturated as e:
+            raise governor_http_error(e)
+        except Exception as e:
+            if produced:
+                raise
+            try:
+                delay = model_governor.retry_delay(e, attempt)
+            except ModelRateLimited as limited:
+                metrics.MODEL_TIER_CALLS.inc(1, tier.name, QUOTA)
+                tier_router.mark_quota_exhausted(tier)
+                fallback = tier_router.fallback(tier, QUOTA)
+                if fallback is None:
+                    raise governor_http_error(limited)
+                tier, attempt = fallback, 0
+                session_id = f"{session_id}-{tier.name}"
+                continue
+            if delay is None:
+                metrics.MODEL_TIER_CALLS.inc(1, tier.name, "error")
+                raise
+        attempt += 1
+        await asyncio.sleep(delay)
+
+async def stream_items(content: str, material_type: str, session_id: str, num_items: int, use_cache: bool, dispatch_mode: str, metadata: dict, chunks: Optional[List[str]] = None) -> AsyncIterator[dict]:
+    """Yield normalized study items as soon as each one is complete.
+
+    Cached results are replayed immediately. Large documents and large item
+    counts are split into sub-generations, and each one's items are yielded
+    as it finishes.
+    Generation details are recorded in ``metadata`` as the stream progresses.
+    """
+    key = generation_key(content, material_type, num_items)
+    metadata["cached"] = False
+    if generation_cache is not None and use_cache:
+        cached_items = await generation_cache.get(key)
+        if cached_items is not None:
+            metadata["cached"] = True
+            for item in cached_items:
+                yield item
+            return
+    
+    normalize = normalize_flashcard if material_type == "flashcards" else normalize_quiz_question
+    items: List[dict] = []
+    duplicate_index = NearDuplicateIndex() if DEDUP_ENABLED else None
+    tier_usage = track_tier_usage()
+    field = DEDUP_FIELDS[material_type]
+    stats = Counter()
+    
+    def accept(item: dict) -> bool:
+        return duplicate_index is None or duplicate_index.add(item.get(field, ""))
+    
+    if needs_split(content, num_items):
+        semaphore = asyncio.Semaphore(split_concurrency(num_items))
+        
+        async def generate_chunk(index: int, chunk_content: str, count: int) -> List[dict]:
+            async with semaphore:
+                return await generate_and_parse(chunk_content, material_type, f"{session_id}-{index}", count, dispatch_mode, stats)
+        
+        tasks = [
+            asyncio.ensure_future(generate_chunk(i, chunk_content, count))
+            for i, (chunk_content, count) in enumerate(plan_generation(content, num_items, chunks))
+        ]
+        metadata["chunks"] = len(tasks)
+        try:
+            for next_chunk in asyncio.as_completed(tasks):
+                try:
+                    chunk_items = await next_chunk
+                except HTTPException as e:
+                    logger.warning("Chunk failed during streamed %s generation: %s", material_type, e.detail, extra={"material_type": material_type})
+                    continue
+                for item in chunk_items:
+                    if len(items) >= num_items or not accept(item):
+                        continue
+                    item['number'] = len(items) + 1
+                    items.append(item)
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+    else:
+        parser = IncrementalArrayParser(RESPONSE_KEYS[material_type])
+        async for text in stream_study_materials(content, material_type, session_id, num_items, dispatch_mode):
+            for raw_item in parser.feed(text):
+                item = normalize(raw_item, len(items) + 1)
+                if item is None or len(items) >= num_items or not accept(item):
+                    continue
+                item['number'] = len(items) + 1
+                items.append(item)
+                yield item
+        metrics.GENERATIONS.inc(1, material_type)
+        if not items:
+            metrics.EMPTY_RESULTS.inc(1, material_type)
+        if not parser.done:
+            metrics.PARSE_FAILURES.inc(1, material_type)
+        if parser.started and not parser.done and items:
+            # The output was cut off: keep what streamed and ask only for the rest
+            metrics.SALVAGED_ITEMS.inc(len(items), material_type)
+            stats["salvaged_items"] += len(items)
+            missing = num_items - len(items)
+            if missing > 0:
+                for item in await generate_remainder(content, material_type, session_id, items, missing, dispatch_mode, stats):
+                    if not accept(item):
+                        continue
+                    item['number'] = len(items) + 1
+                    items.append(item)
+                    yield item
+    metadata.update(stats)
+
+    if duplicate_index is not None and duplicate_index.duplicates:
+        metrics.DUPLICATES_REMOVED.inc(duplicate_index.duplicates, material_type)
+        metadata["duplicates_removed"] = duplicate_index.duplicates
+        metadata["topped_up"] = 0
+        missing = num_items - len(items)
+        if DEDUP_TOPUP and items and missing > 0:
+            for item in await top_up(content, material_type, session_id, items, missing, duplicate_index, dispatch_mode):
+                item['number'] = len(items) + 1
+                items.append(item)
+                metadata["topped_up"] += 1
+                yield item
+
+    metadata["model_tiers"] = dict(tier_usage)
+    if generation_cache is not None and items:
+        await generation_cache.set(key, items)
+
+STREAM_FORMATS = ("ndjson", "sse")
+
+def format_stream_event(event: str, data: dict, stream_format: str) -> str:
+    """Encode one stream event as an NDJSON line or a Server-Sent Event."""
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+    return dumps({"event": event, "data": data}).decode() + "\n"
+
+async def streaming_generation_response(content: str, material_type: str, num_items: int, use_cache: bool, dispatch_mode: Optional[str], stream_format: str, content_metadata: Optional[Dict[str, Any]] = None, chunks: Optional[List[str]] = None) -> StreamingResponse:
+    """Build the streaming response for a flashcard or quiz generation.
+
+    ``content_metadata`` is reported in the ``done`` event's metadata.
+    """
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"stream_format must be one of {', '.join(STREAM_FORMATS)}")
+    try:
+        mode = resolve_dispatch_mode(dispatch_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    session_id = str(uuid.uuid4())
+    item_event = "flashcard" if material_type == "flashcards" else "quiz_question"
+    
+    async def events() -> AsyncIterator[str]:
+        count = 0
+        metadata = {**(content_metadata or {}), "dispatch_mode": mode}
+        try:
+            async for item in stream_items(content, material_type, session_id, num_items, use_cache, mode, metadata, chunks):
+                count += 1
+                yield format_stream_event(item_event, item, stream_format)
+            yield format_stream_event(
+                "done",
+                {"success": True, "session_id": session_id, "count": count, "cached": metadata.pop("cached"), "metadata": metadata},
+                stream_format
+            )
+        except Exception as e:
+            message = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error("Streamed %s generation failed: %s", material_type, message, extra={"material_type": material_type})
+            yield format_stream_event("error", {"success": False, "message": message, "count": count}, stream_format)
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+# Material types generated by the combined study set endpoints
+STUDY_SET_PARTS = ("flashcards", "quiz")
+
+async def generate_part(content: str, material_type: str, session_id: str, num_items: int, use_cache: bool, dispatch_mode: Optional[str], chunks: Optional[List[str]] = None) -> Tuple[List[dict], dict]:
+    """Generate one part of a study set and time it.
+
+    Returns the items (empty on failure) and the part's metadata, which
+    carries the error message when the part failed.
+    """
+    start = time.perf_counter()
+    try:
+        items, cached, metadata = await generate_items(content, material_type, f"{session_id}-{material_type}", num_items, use_cache, dispatch_mode, chunks)
+    except HTTPException as e:
+        logger.warning("Study set %s part failed: %s", material_type, e.detail, extra={"material_type": material_type})
+        return [], {"error": e.detail, "status_code": e.status_code, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+    return items, {"cached": cached, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1), **metadata}
+
+async def interleave(streams: Dict[str, AsyncIterator[dict]]) -> AsyncIterator[Tuple[str, Optional[dict], Optional[BaseException]]]:
+    """Merge several item streams, yielding ``(name, item, None)`` in arrival order.
+
+    When a stream ends, ``(name, None, None)`` is yielded, or
+    ``(name, None, error)`` if it raised. The other streams keep going.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def pump(name: str, stream: AsyncIterator[dict]):
+        try:
+            async for item in stream:
+                await queue.put((name, item, None))
+        except Exception as e:
+            await queue.put((name, None, e))
+        else:
+            await queue.put((name, None, None))
+    
+    tasks = [asyncio.ensure_future(pump(name, stream)) for name, stream in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            name, item, error = await queue.get()
+            if item is None:
+                remaining -= 1
+            yield name, item, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def streaming_study_set_response(content: str, counts: Dict[str, int], use_cache: bool, dispatch_mode: Optional[str], stream_format: str, content_metadata: Dict[str, Any], chunks: Optional[List[str]] = None) -> StreamingResponse:
+    """Build the interleaved streaming response for a combined study set.
+
+    Flashcard and quiz events are emitted as each item completes in either
+    generation. Each part ends with a ``part_done`` or ``part_error`` event
+    carrying its timing, and a final ``done`` event reports both counts.
+    """
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"stream_format must be one of {', '.join(STREAM_FORMATS)}")
+    try:
+        mode = resolve_dispatch_mode(dispatch_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    session_id = str(uuid.uuid4())
+    
+    async def events() -> AsyncIterator[str]:
+        start = time.perf_counter()
+        part_metadata = {material_type: {"dispatch_mode": mode} for material_type in STUDY_SET_PARTS}
+        item_counts = {material_type: 0 for material_type in STUDY_SET_PARTS}
+        first_item_ms: Dict[str, float] = {}
+        streams = {
+            material_type: stream_items(content, material_type, f"{session_id}-{material_type}", counts[material_type], use_cache, mode, part_metadata[material_type], chunks)
+            for material_type in STUDY_SET_PARTS
+        }
+        async for material_type, item, error in interleave(streams):
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            if item is not None:
+                item_counts[material_type] += 1
+                first_item_ms.setdefault(material_type, elapsed_ms)
+                yield format_stream_event("flashcard" if material_type == "flashcards" else "quiz_question", item, stream_format)
+                continue
+            timing = {"elapsed_ms": elapsed_ms, "first_item_ms": first_item_ms.get(material_type)}
+            part_metadata[material_type].update(timing)
+            if error is not None:
+                message = error.detail if isinstance(error, HTTPException) else str(error)
+                logger.error("Streamed study set %s part failed: %s", material_type, message, extra={"material_type": material_type})
+                part_metadata[material_type]["error"] = message
+                yield format_stream_event("part_error", {"part": material_type, "message": message, "count": item_counts[material_type], **timing}, stream_format)
+            else:
+                yield format_stream_event("part_done", {"part": material_type, "count": item_counts[material_type], **timing}, stream_format)
+        
+        failed = all("error" in part_metadata[material_type] for material_type in STUDY_SET_PARTS)
+        yield format_stream_event(
+            "done",
+            {
+                "success": not failed,
+                "session_id": session_id,
+                "counts": item_counts,
+                "metadata": {**content_metadata, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1), "parts": part_metadata},
+            },
+            stream_format
+        )
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+async def run_job(job: Job) -> Tuple[List[dict], bool, dict]:
+    """Job handler: generate the job's study items."""
+    session_id = f"job-{job.id}"
+    token = set_request_id(session_id)
+    try:
+        return await generate_items(job.content, job.material_type, session_id, job.num_items, job.use_cache, job.dispatch_mode)
+    finally:
+        reset_request_id(token)
+
+# Initialize job queue and workers (started with the app)
+job_manager = JobManager(create_job_queue(), run_job)
+
+def job_response(job: Job, status_code: int = 200) -> FastJSONResponse:
+    """Build the API representation of a job (the JobResponse schema)."""
+    return FastJSONResponse({
+        "success": job.status != FAILED,
+        "job_id": job.id,
+        "status": job.status,
+        "material_type": job.material_type,
+        "priority": job.priority,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "cached": job.cached,
+        "metadata": job.metadata,
+        "error": job.error,
+        "flashcards": job.items if job.material_type == "flashcards" else None,
+        "quiz_questions": job.items if job.material_type != "flashcards" else None
+    }, status_code=status_code)
+
+# Export component statistics on /metrics
+metrics.registry.gauge("studywithai_pdf_extraction_in_flight", "PDF extractions queued or running", lambda: pdf_pool.stats()["in_flight"])
+metrics.registry.callback_counter("studywithai_pdf_extraction_rejected_total", "PDF extractions rejected because the pool was saturated", lambda: pdf_pool.stats()["rejected"])
+metrics.registry.callback_counter("studywithai_pdf_text_cache_hits_total", "PDF text cache hits", lambda: pdf_text_cache.hits)
+metrics.registry.callback_counter("studywithai_pdf_text_cache_misses_total", "PDF text cache misses", lambda: pdf_text_cache.misses)
+metrics.registry.callback_counter("studywithai_generation_cache_hits_total", "Generation cache hits", lambda: generation_cache.hits if generation_cache is not None else None)
+metrics.registry.callback_counter("studywithai_generation_cache_misses_total", "Generation cache misses", lambda: generation_cache.misses if generation_cache is not None else None)
+metrics.registry.gauge("studywithai_inflight_generations", "Distinct generations currently running", lambda: inflight_generations.stats()["in_flight"])
+metrics.registry.gauge("studywithai_job_queue_depth", "Jobs waiting in the queue", job_manager.queue.depth)
+metrics.registry.gauge("studywithai_jobs_running", "Jobs currently running", lambda: job_manager.running)
+metrics.registry.gauge("studywithai_live_sessions", "Sessions held by the session service", lambda: session_service.stats()["live_sessions"])
+metrics.registry.callback_counter("studywithai_log_records_dropped_total", "Log records dropped because the log queue was full", lambda: log_pipeline.handler.dropped)
+metrics.registry.gauge("studywithai_session_bytes", "Approximate memory held by sessions", lambda: session_service.current_bytes)
+metrics.registry.gauge("studywithai_documents", "Documents held by the document store", lambda: len(document_store))
+metrics.registry.gauge("studywithai_document_bytes", "Approximate memory held by stored documents", lambda: document_store.current_bytes)
+metrics.registry.callback_counter("studywithai_document_evictions_total", "Documents evicted to stay within the store limits", lambda: document_store.evictions)
+metrics.registry.gauge("studywithai_model_calls_in_flight", "Model calls holding a governor slot", lambda: model_governor.in_flight)
+metrics.registry.gauge("studywithai_model_calls_waiting", "Model calls queued for a governor slot", lambda: model_governor.waiting)
+metrics.registry.gauge("studywithai_model_call_rate", "Current model call rate limit in calls per second", lambda: model_governor.limiter.rate)
+metrics.registry.callback_counter("studywithai_model_call_retries_total", "Model call retries after transient errors", lambda: model_governor.counters["retries"])
+metrics.registry.callback_counter("studywithai_model_call_throttled_total", "Model calls that received a quota error (429)", lambda: model_governor.counters["throttled"])
+metrics.registry.callback_counter("studywithai_model_call_rejected_total", "Model calls rejected after waiting past the queue timeout", lambda: model_governor.counters["rejected"])
+metrics.registry.callback_counter("studywithai_model_call_hedges_total", "Hedged duplicate model calls", lambda: model_governor.counters["hedges"])
+
+async def warm_up_runners():
+    """Generate from each model tier's sub-agent runners once with the warm-up stub model.
+
+    This loads the code paths a first request would otherwise pay for
+    (runner, session service, event handling and parsing) without calling
+    Gemini. The agents' models are restored afterwards.
+    """
+    warmed = set()
+    for tier in model_tiers:
+        # Tiers on the default model share one set of runners
+        if id(tier_runners[tier.name]) in warmed:
+            continue
+        warmed.add(id(tier_runners[tier.name]))
+        _, tier_flashcard_agent, tier_quiz_agent = tier_agents[tier.name]
+        for material_type, agent in (("flashcards", tier_flashcard_agent), ("quiz", tier_quiz_agent)):
+            await warm_up_runner(tier, material_type, agent)
+
+async def warm_up_runner(tier: ModelTier, material_type: str, agent):
+    """Run one stubbed generation through ``agent``'s runner in ``tier``."""
+    model = agent.model
+    agent.model = WarmupModel(model=f"warmup-{material_type}", material_type=material_type)
+    session_id = f"warmup-{uuid.uuid4()}"
+    try:
+        runner, message, _ = prepare_run("Warm-up", material_type, session_id, 1, DIRECT, tier)
+        text = ""
+        async for event in runner.run_async(user_id=API_USER_ID, session_id=session_id, new_message=message):
+            if event.is_final_response() and event.content and event.content.parts:
+                text = "".join(part.text or "" for part in event.content.parts)
+        items, _ = parse_response(text, material_type)
+        if not items:
+            raise RuntimeError(f"{material_type} warm-up produced no items")
+    finally:
+        agent.model = model
+        session_service.delete_session(app_name=APP_NAME, user_id=API_USER_ID, session_id=session_id)
+
+# Application lifecycle
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the generation job workers."""
+    job_manager.start()
+
+@app.on_event("startup")
+async def warm_up():
+    """Run a stubbed generation through each direct runner, then report ready."""
+    if WARMUP_ENABLED:
+        start = time.perf_counter()
+        try:
+            await warm_up_runners()
+        except Exception as e:
+            lifecycle.warmup_error = str(e)
+            logger.warning("Warm-up generation failed: %s", e)
+        lifecycle.warmup_seconds = round(time.perf_counter() - start, 3)
+    lifecycle.mark_ready()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Let running jobs finish (up to SHUTDOWN_DRAIN_TIMEOUT), then stop the job workers."""
+    lifecycle.start_draining()
+    await job_manager.drain(SHUTDOWN_DRAIN_TIMEOUT)
+
+@app.on_event("shutdown")
+async def shutdown_pdf_pool():
+    """Stop the PDF extraction worker processes."""
+    pdf_pool.shutdown()
 
 # API Endpoints
 @app.get("/")
@@ -295,7 +1369,20 @@ async def root():
         "endpoints": {
             "POST /generate-flashcards": "Generate flashcards from prompt and optional files",
             "POST /generate-quiz": "Generate quiz from prompt and optional files",
+            "POST /generate-study-set": "Generate flashcards and a quiz together from one prompt and one upload",
+            "POST /generate-study-set/stream": "Stream flashcards and quiz questions interleaved as NDJSON or SSE",
+            "POST /documents": "Upload PDF files once and get a doc_id to generate from",
+            "GET /documents/{doc_id}": "Describe a stored document",
+            "DELETE /documents/{doc_id}": "Remove a stored document",
+            "POST /jobs": "Queue a flashcard or quiz generation and return a job id",
+            "POST /batch": "Generate study materials for many prompts/documents, streaming results as NDJSON",
+            "GET /jobs/{job_id}": "Poll (or long-poll with ?wait=) for a job's status and results",
+            "POST /generate-flashcards/stream": "Stream flashcards as NDJSON or SSE as they are generated",
+            "POST /generate-quiz/stream": "Stream quiz questions as NDJSON or SSE as they are generated",
             "GET /health": "Health check endpoint",
+            "GET /ready": "Readiness probe (warmed up and not draining)",
+            "GET /stats": "Cache and worker pool statistics",
+            "GET /metrics": "Prometheus metrics: per-stage latency histograms and counters",
             "GET /docs": "API documentation"
         }
     }
@@ -305,10 +1392,86 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": "StudyWithAI API"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once this worker is warmed up, 503 before that and while draining."""
+    status_code = 200 if lifecycle.ready else 503
+    return FastJSONResponse({"status": "ready" if lifecycle.ready else "not ready", **lifecycle.stats()}, status_code=status_code)
+
+@app.get("/stats")
+async def stats():
+    """Cache, worker pool and model call statistics."""
+    return {
+        "pdf_extraction_pool": pdf_pool.stats(),
+        "pdf_text_cache": pdf_text_cache.stats(),
+        "generation_cache": generation_cache.stats() if generation_cache is not None else None,
+        "inflight_generations": inflight_generations.stats(),
+        "dispatch": dispatch_stats.stats(),
+        "jobs": job_manager.stats(),
+        "sessions": session_service.stats(),
+        "documents": document_store.stats(),
+        "model_tiers": tier_router.stats(),
+        "lifecycle": lifecycle.stats(),
+        "logging": log_pipeline.stats(),
+        "model_governor": model_governor.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/documents", status_code=201)
+async def upload_document(
+    files: List[UploadFile] = File(...),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+):
+    """
+    Upload PDF files once and keep their extracted text for later requests.
+    
+    Returns a `doc_id` to pass to the generation endpoints instead of the
+    files. The text is extracted, condensed and chunked once; documents
+    expire after DOCUMENT_TTL seconds without use.
+    
+    - **files**: PDF files to upload and process
+    - **page_ranges**: Optional pages to read, for every file or per filename
+    """
+    names, texts, extraction_metadata = await extract_files(files, page_ranges)
+    texts, content_metadata = await condense_file_texts(texts)
+    content_metadata = {**extraction_metadata, **content_metadata}
+    body = file_sections(names, texts)
+    chunks = None
+    if len(body) > CHUNKING_THRESHOLD_CHARS - MAX_SHARED_HEADER_CHARS:
+        chunks = chunk_text(body.strip())
+    document = Document(names, body, chunks, content_metadata)
+    if not await call_document_store(document_store.add, document):
+        raise HTTPException(status_code=413, detail=f"Document too large to store ({document.size} bytes, limit {document_store.max_bytes})")
+    logger.info("Stored document %s (%d files, %d chars)", document.id, len(names), len(body), extra={"doc_id": document.id})
+    return document.info(document_store.ttl)
+
+@app.get("/documents/{doc_id}")
+async def get_document_info(doc_id: str):
+    """Describe a stored document without extending its lifetime."""
+    document = await call_document_store(document_store.peek, doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found or expired")
+    return document.info(document_store.ttl)
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """Remove a stored document."""
+    if not await call_document_store(document_store.delete, doc_id):
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found or expired")
+    return {"success": True, "doc_id": doc_id}
+
 @app.post("/generate-flashcards", response_model=FlashcardResponse)
 async def generate_flashcards(
     prompt: str = Form(...),
     num_flashcards: int = Form(10, description="Number of flashcards to generate (default: 10)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
     files: Optional[List[UploadFile]] = File(None)
 ):
     """
@@ -316,37 +1479,31 @@ async def generate_flashcards(
     
     - **prompt**: The educational prompt or content to process
     - **num_flashcards**: Number of flashcards to generate (default: 10)
+    - **use_cache**: Set to false to bypass the generation cache
+    - **dispatch_mode**: Override the deployment's dispatch mode (direct or routed)
+    - **doc_id**: Optional previously uploaded document to generate from
+    - **page_ranges**: Optional pages to read, for every file or per filename
     - **files**: Optional PDF files to upload and process
     """
     try:
-        # Start with the prompt content
-        content = prompt
-        
-        # Process uploaded files if any
-        if files:
-            for file in files:
-                if file.filename.endswith('.pdf'):
-                    pdf_content = await file.read()
-                    file_text = extract_text_from_pdf(pdf_content)
-                    content += f"\n\nContent from {file.filename}:\n{file_text}"
-                else:
-                    raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+        # Combine the prompt with any uploaded PDF content
+        content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
         
         # Generate session ID
         session_id = str(uuid.uuid4())
         
-        # Generate flashcards with specified number
-        response = await generate_study_materials(content, "flashcards", session_id, num_flashcards)
+        # Generate and parse flashcards with specified number
+        flashcards, cached, metadata = await generate_items(content, "flashcards", session_id, num_flashcards, use_cache, dispatch_mode, chunks)
         
-        # Parse the response
-        flashcards = parse_flashcards(response)
-        
-        return FlashcardResponse(
-            success=True,
-            message=f"Generated {len(flashcards)} flashcards successfully",
-            session_id=session_id,
-            flashcards=[Flashcard(**card) for card in flashcards]
-        )
+        # Items were normalized when parsed, so the response model is not re-validated
+        return FastJSONResponse({
+            "success": True,
+            "message": f"Generated {len(flashcards)} flashcards successfully",
+            "session_id": session_id,
+            "cached": cached,
+            "metadata": {**content_metadata, **metadata},
+            "flashcards": flashcards
+        })
         
     except HTTPException:
         raise
@@ -357,6 +1514,10 @@ async def generate_flashcards(
 async def generate_quiz(
     prompt: str = Form(...),
     num_questions: int = Form(5, description="Number of quiz questions to generate (default: 5)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
     files: Optional[List[UploadFile]] = File(None)
 ):
     """
@@ -364,43 +1525,274 @@ async def generate_quiz(
     
     - **prompt**: The educational prompt or content to process
     - **num_questions**: Number of quiz questions to generate (default: 5)
+    - **use_cache**: Set to false to bypass the generation cache
+    - **dispatch_mode**: Override the deployment's dispatch mode (direct or routed)
+    - **doc_id**: Optional previously uploaded document to generate from
+    - **page_ranges**: Optional pages to read, for every file or per filename
     - **files**: Optional PDF files to upload and process
     """
     try:
-        # Start with the prompt content
-        content = prompt
-        
-        # Process uploaded files if any
-        if files:
-            for file in files:
-                if file.filename.endswith('.pdf'):
-                    pdf_content = await file.read()
-                    file_text = extract_text_from_pdf(pdf_content)
-                    content += f"\n\nContent from {file.filename}:\n{file_text}"
-                else:
-                    raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+        # Combine the prompt with any uploaded PDF content
+        content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
         
         # Generate session ID
         session_id = str(uuid.uuid4())
         
-        # Generate quiz with specified number of questions
-        response = await generate_study_materials(content, "quiz", session_id, num_questions)
+        # Generate and parse quiz with specified number of questions
+        quiz_questions, cached, metadata = await generate_items(content, "quiz", session_id, num_questions, use_cache, dispatch_mode, chunks)
         
-        # Parse the response
-        quiz_questions = parse_quiz_questions(response)
-        
-        return QuizResponse(
-            success=True,
-            message=f"Generated {len(quiz_questions)} quiz questions successfully",
-            session_id=session_id,
-            quiz_questions=[QuizQuestion(**question) for question in quiz_questions]
-        )
+        # Items were normalized when parsed, so the response model is not re-validated
+        return FastJSONResponse({
+            "success": True,
+            "message": f"Generated {len(quiz_questions)} quiz questions successfully",
+            "session_id": session_id,
+            "cached": cached,
+            "metadata": {**content_metadata, **metadata},
+            "quiz_questions": quiz_questions
+        })
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-flashcards/stream")
+async def generate_flashcards_stream(
+    prompt: str = Form(...),
+    num_flashcards: int = Form(10, description="Number of flashcards to generate (default: 10)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    stream_format: str = Form("ndjson", description="'ndjson' or 'sse'"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Stream flashcards as soon as each one is complete in the model output.
+    
+    Emits one `flashcard` event per card followed by a `done` event, or an
+    `error` event if generation fails part-way.
+    
+    - **stream_format**: `ndjson` (default) or `sse`
+    """
+    content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
+    return await streaming_generation_response(content, "flashcards", num_flashcards, use_cache, dispatch_mode, stream_format, content_metadata, chunks)
+
+@app.post("/generate-quiz/stream")
+async def generate_quiz_stream(
+    prompt: str = Form(...),
+    num_questions: int = Form(5, description="Number of quiz questions to generate (default: 5)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    stream_format: str = Form("ndjson", description="'ndjson' or 'sse'"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Stream quiz questions as soon as each one is complete in the model output.
+    
+    Emits one `quiz_question` event per question followed by a `done` event,
+    or an `error` event if generation fails part-way.
+    
+    - **stream_format**: `ndjson` (default) or `sse`
+    """
+    content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
+    return await streaming_generation_response(content, "quiz", num_questions, use_cache, dispatch_mode, stream_format, content_metadata, chunks)
+
+@app.post("/generate-study-set", response_model=StudySetResponse)
+async def generate_study_set(
+    prompt: str = Form(...),
+    num_flashcards: int = Form(10, description="Number of flashcards to generate (default: 10)"),
+    num_questions: int = Form(5, description="Number of quiz questions to generate (default: 5)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Generate flashcards and a quiz from one prompt and one set of files.
+    
+    The files are uploaded and extracted once, and both generations run
+    concurrently over the shared content. If one part fails, the other is
+    still returned and `metadata.parts` reports the error.
+    
+    - **num_flashcards**: Number of flashcards to generate (default: 10)
+    - **num_questions**: Number of quiz questions to generate (default: 5)
+    """
+    start = time.perf_counter()
+    content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
+    session_id = str(uuid.uuid4())
+    
+    (flashcards, flashcard_metadata), (quiz_questions, quiz_metadata) = await asyncio.gather(
+        generate_part(content, "flashcards", session_id, num_flashcards, use_cache, dispatch_mode, chunks),
+        generate_part(content, "quiz", session_id, num_questions, use_cache, dispatch_mode, chunks),
+    )
+    if "error" in flashcard_metadata and "error" in quiz_metadata:
+        raise HTTPException(status_code=flashcard_metadata["status_code"], detail=flashcard_metadata["error"])
+    
+    return FastJSONResponse({
+        "success": True,
+        "message": f"Generated {len(flashcards)} flashcards and {len(quiz_questions)} quiz questions",
+        "session_id": session_id,
+        "metadata": {
+            **content_metadata,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "parts": {"flashcards": flashcard_metadata, "quiz": quiz_metadata},
+        },
+        "flashcards": flashcards,
+        "quiz_questions": quiz_questions
+    })
+
+@app.post("/generate-study-set/stream")
+async def generate_study_set_stream(
+    prompt: str = Form(...),
+    num_flashcards: int = Form(10, description="Number of flashcards to generate (default: 10)"),
+    num_questions: int = Form(5, description="Number of quiz questions to generate (default: 5)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    stream_format: str = Form("ndjson", description="'ndjson' or 'sse'"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Stream flashcards and quiz questions interleaved as each one completes.
+    
+    Emits `flashcard` and `quiz_question` events, a `part_done` (or
+    `part_error`) event with timings when each part finishes, and a final
+    `done` event.
+    
+    - **stream_format**: `ndjson` (default) or `sse`
+    """
+    content, content_metadata, chunks = await collect_content(prompt, files, doc_id, page_ranges)
+    counts = {"flashcards": num_flashcards, "quiz": num_questions}
+    return await streaming_study_set_response(content, counts, use_cache, dispatch_mode, stream_format, content_metadata, chunks)
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(
+    prompt: str = Form(...),
+    material_type: str = Form("flashcards", description="'flashcards' or 'quiz'"),
+    num_items: int = Form(10, description="Number of flashcards or quiz questions to generate (default: 10)"),
+    priority: int = Form(0, description="Higher priorities are processed first (default: 0)"),
+    use_cache: bool = Form(True, description="Serve identical recent requests from the generation cache"),
+    dispatch_mode: Optional[str] = Form(None, description="'direct' to call the sub-agent directly or 'routed' to go through the root agent"),
+    doc_id: Optional[str] = Form(None, description="Id of a document uploaded with POST /documents"),
+    page_ranges: Optional[str] = Form(None, description='Pages to read, e.g. "1-3,7,10-", or a JSON object mapping filenames to page ranges'),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Queue a generation job and return its id immediately.
+    
+    Poll `GET /jobs/{job_id}` for the status and results.
+    
+    - **material_type**: `flashcards` or `quiz`
+    - **num_items**: Number of items to generate
+    - **priority**: Higher priorities are processed first
+    """
+    if material_type not in ("flashcards", "quiz"):
+        raise HTTPException(status_code=400, detail="material_type must be 'flashcards' or 'quiz'")
+    
+    content, content_metadata, _ = await collect_content(prompt, files, doc_id, page_ranges)
+    try:
+        job = await job_manager.submit(material_type, content, num_items, priority, use_cache, dispatch_mode, content_metadata)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return job_response(job, status_code=202)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Seconds to wait for the job to finish (long-poll)")
+):
+    """
+    Return a job's status, and its results once it has finished.
+    
+    - **wait**: Hold the request open up to this many seconds until the job finishes
+    """
+    job = await job_manager.get(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job_response(job)
+
+@app.post("/batch")
+async def generate_batch(
+    items: str = Form(..., description="JSON array of batch items"),
+    concurrency: int = Form(BATCH_CONCURRENCY, ge=1, description="Maximum number of items generated at once"),
+    files: Optional[List[UploadFile]] = File(None)
+):
+    """
+    Generate study materials for many prompts or documents in one request.
+    
+    Results are streamed back as NDJSON, one `result` event per item in
+    completion order, followed by a `done` event.
+    
+    - **items**: JSON array of objects with `prompt`, `material_type`
+      (`flashcards` or `quiz`), `num_items`, optional `id`, `files`
+      (filenames of uploads in this request), `use_cache` and `dispatch_mode`
+    - **concurrency**: Maximum number of items generated at once (capped by BATCH_CONCURRENCY)
+    - **files**: PDF files referenced by the items
+    """
+    try:
+        batch_items = TypeAdapter(List[BatchItem]).validate_json(items)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch items: {e.errors()[0]['msg']}")
+    if not batch_items:
+        raise HTTPException(status_code=400, detail="Batch contains no items")
+    if len(batch_items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+    for item in batch_items:
+        if item.material_type not in ("flashcards", "quiz"):
+            raise HTTPException(status_code=400, detail="material_type must be 'flashcards' or 'quiz'")
+    
+    file_texts = await extract_batch_files(files)
+    missing = {name for item in batch_items for name in item.files} - file_texts.keys()
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Batch items reference missing files: {', '.join(sorted(missing))}")
+    
+    # All items share the module-level runners; sessions are namespaced per batch
+    batch_id = str(uuid.uuid4())
+    semaphore = asyncio.Semaphore(min(concurrency, BATCH_CONCURRENCY))
+    
+    async def run_item(index: int, item: BatchItem) -> dict:
+        result = {"index": index, "id": item.id, "material_type": item.material_type}
+        try:
+            for name in item.files:
+                if isinstance(file_texts[name], HTTPException):
+                    raise file_texts[name]
+            texts, content_metadata = await condense_file_texts([file_texts[name] for name in item.files])
+            content = "".join([item.prompt] + [f"\n\nContent from {name}:\n{text}" for name, text in zip(item.files, texts)])
+            async with semaphore:
+                generated, cached, metadata = await generate_items(
+                    content, item.material_type, f"batch-{batch_id}-{index}", item.num_items,
+                    item.use_cache, item.dispatch_mode
+                )
+            result.update(success=True, cached=cached, metadata={**content_metadata, **metadata})
+            result["flashcards" if item.material_type == "flashcards" else "quiz_questions"] = generated
+        except Exception as e:
+            result.update(success=False, error=e.detail if isinstance(e, HTTPException) else str(e))
+        return result
+    
+    async def events() -> AsyncIterator[str]:
+        tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(batch_items)]
+        succeeded = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                succeeded += result["success"]
+                yield format_stream_event("result", result, "ndjson")
+            yield format_stream_event(
+                "done",
+                {"batch_id": batch_id, "total": len(tasks), "succeeded": succeeded, "failed": len(tasks) - succeeded},
+                "ndjson"
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -411,7 +1803,8 @@ async def http_exception_handler(request, exc):
             "success": False,
             "message": exc.detail,
             "error": f"HTTP {exc.status_code}"
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -0,0 +1,78 @@
+"""
+Auth
+
+API key check as a plain ASGI middleware. Unlike a ``@app.middleware("http")``
+function it adds no per-request task or response wrapping, so streamed
+responses pass straight through, and keys are compared in constant time.
+Several keys can be accepted so that each client has its own identity.
+"""
+
+import hmac
+import json
+from typing import Callable, Iterable, Optional
+
+API_KEY_HEADER = b"x-api-key"
+PUBLIC_PATHS = ("/", "/health", "/ready", "/docs", "/redoc", "/openapi.json")
+
+_UNAUTHORIZED_BODY = json.dumps({
+    "success": False,
+    "message": "Invalid or missing API key",
+    "error": "Unauthorized access",
+}).encode()
+
+
+class ApiKeyMiddleware:
+    """ASGI middleware that rejects requests without a valid ``X-API-Key`` with 401.
+
+    ``api_key`` and any ``client_keys`` are accepted. Paths in
+    ``public_paths`` are let through without a key. ``is_public`` can open
+    further paths at request time. ``on_authorized`` is called with the key
+    of every accepted request, in the request's context.
+    """
+
+    def __init__(self, app, api_key: str, client_keys: Iterable[str] = (),
+                 public_paths: Iterable[str] = PUBLIC_PATHS,
+                 is_public: Optional[Callable[[str], bool]] = None,
+                 on_authorized: Optional[Callable[[str], None]] = None):
+        self.app = app
+        self.api_keys = tuple(dict.fromkeys(key.encode() for key in (api_key, *client_keys)))
+        self.public_paths = frozenset(public_paths)
+        self.is_public = is_public
+        self.on_authorized = on_authorized
+
+    def _is_valid(self, provided: bytes) -> bool:
+        # Compare against every key so the time taken does not reveal which one matched
+        valid = False
+        for key in self.api_keys:
+            valid |= hmac.compare_digest(provided, key)
+        return valid
+
+    async def _reject(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 401,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(_UNAUTHORIZED_BODY)).encode())],
+        })
+        await send({"type": "http.response.body", "body": _UNAUTHORIZED_BODY})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if path in self.public_paths or (self.is_public is not None and self.is_public(path)):
+            await self.app(scope, receive, send)
+            return
+
+        provided = b""
+        for name, value in scope["headers"]:
+            if name == API_KEY_HEADER:
+                provided = value
+                break
+        if not provided or not self._is_valid(provided):
+            await self._reject(send)
+            return
+
+        if self.on_authorized is not None:
+            self.on_authorized(provided.decode("latin-1"))
+        await self.app(scope, receive, send)
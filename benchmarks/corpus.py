@@ -0,0 +1,108 @@
+"""
+Synthetic PDF Corpus
+
+Generates text PDFs of different sizes for benchmarks without any PDF
+library: pages are written as plain Helvetica text objects, which PyPDF2
+extracts like a real lecture handout.
+"""
+
+import random
+from typing import Dict, List
+
+# Named corpus sizes: (pages, paragraphs per page)
+CORPUS_SIZES = {
+    "small": (2, 3),
+    "medium": (20, 4),
+    "large": (120, 4),
+}
+
+_WORDS = (
+    "cell membrane protein energy enzyme reaction molecule structure function process "
+    "system theory model evidence experiment variable result analysis concept principle "
+    "equation force mass velocity gradient transport signal pathway network organism "
+    "population history economy policy market supply demand culture language society"
+).split()
+
+_LINE_CHARS = 90
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Build a minimal PDF with one text page per string (newlines start new lines)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_ref = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        lines = " ".join(f"({_escape(line)}) '" for line in text.split("\n"))
+        stream = f"BT /F1 10 Tf 40 760 Td 12 TL {lines} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_ref} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(output)
+
+
+def _wrap(text: str) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > _LINE_CHARS:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def synthetic_pages(num_pages: int, paragraphs_per_page: int, seed: int = 0) -> List[str]:
+    """Generate lecture-like pages with a heading and several paragraphs each."""
+    rng = random.Random(seed)
+    pages = []
+    for page in range(1, num_pages + 1):
+        lines = [f"Section {page}. {rng.choice(_WORDS).title()} and {rng.choice(_WORDS)}", ""]
+        for _ in range(paragraphs_per_page):
+            sentences = [
+                " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+                for _ in range(rng.randint(3, 5))
+            ]
+            lines.extend(_wrap(" ".join(sentences)))
+            lines.append("")
+        lines.append(f"Page {page}")
+        pages.append("\n".join(lines))
+    return pages
+
+
+def build_corpus(sizes: List[str], variants: int = 1) -> Dict[str, List[bytes]]:
+    """Build ``variants`` distinct PDFs for each named size.
+
+    Distinct variants keep the PDF text and generation caches from turning
+    every request after the first into a cache hit.
+    """
+    corpus = {}
+    for size in sizes:
+        if size not in CORPUS_SIZES:
+            raise ValueError(f"Unknown corpus size: {size} (expected one of {', '.join(CORPUS_SIZES)})")
+        num_pages, paragraphs = CORPUS_SIZES[size]
+        corpus[size] = [
+            make_pdf(synthetic_pages(num_pages, paragraphs, seed=variant))
+            for variant in range(variants)
+        ]
+    return corpus
@@ -0,0 +1,193 @@
+"""
+Fake Gemini
+
+A local stand-in for the Gemini model behind the StudyWithAI agents. It
+answers with canned flashcard or quiz JSON after a configurable delay so the
+API can be benchmarked offline without spending quota. Quota errors (429)
+and slow responses can be injected at a given rate to exercise retries,
+rate adaptation and hedging.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+from collections import Counter, deque
+from typing import AsyncGenerator, Dict, List, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import errors, types
+
+# Agent roles
+ROUTER = "router"
+FLASHCARDS = "flashcards"
+QUIZ = "quiz"
+
+# Role of every model call made, for counting calls in benchmark reports
+CALLS: List[str] = []
+# Injected faults by kind ("429", "quota", "slow")
+FAULTS: Counter = Counter()
+# Calls per fake model name, e.g. "fake-fast-flashcards", for checking tier routing
+MODEL_CALLS: Counter = Counter()
+# Start times of recent calls, shared by every role like a project-wide quota
+_RECENT_CALLS: deque = deque()
+
+
+def _over_quota(quota_rps: float) -> bool:
+    """Record a call and report whether more than ``quota_rps`` started in the last second."""
+    now = time.monotonic()
+    while _RECENT_CALLS and now - _RECENT_CALLS[0] > 1.0:
+        _RECENT_CALLS.popleft()
+    if len(_RECENT_CALLS) >= quota_rps:
+        return True
+    _RECENT_CALLS.append(now)
+    return False
+
+
+def _first_text(llm_request: LlmRequest) -> str:
+    """Return the first user text of the request (the generation prompt)."""
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                return part.text
+    return ""
+
+
+def _requested_count(prompt: str, default: int = 10) -> int:
+    match = re.search(r"\d+", prompt)
+    return int(match.group()) if match else default
+
+
+def canned_flashcards(count: int, seed: str) -> dict:
+    return {
+        "flashcards": [
+            {"number": i, "front": f"Term {i} {seed}", "back": f"Definition of term {i}."}
+            for i in range(1, count + 1)
+        ]
+    }
+
+
+def canned_quiz(count: int, seed: str) -> dict:
+    return {
+        "quiz_questions": [
+            {
+                "number": i,
+                "type": "Multiple Choice",
+                "difficulty": "Medium",
+                "question": f"Which statement about topic {i} {seed} is correct?",
+                "options": ["A) First", "B) Second", "C) Third", "D) Fourth"],
+                "answer": "A) First",
+                "explanation": f"Topic {i} is described first in the material.",
+            }
+            for i in range(1, count + 1)
+        ]
+    }
+
+
+class FakeGemini(BaseLlm):
+    """Model that returns canned responses for one agent role.
+
+    ``latency`` seconds (plus up to ``jitter`` seconds) are spent per call.
+    In streaming mode the response is delivered in ``stream_chunk_chars``
+    pieces spread over the same total latency. A fraction ``error_rate`` of
+    calls fail with a 429 quota error, calls beyond ``quota_rps`` per second
+    (across all roles) are rejected with 429, and a fraction ``slow_rate``
+    take ``slow_latency`` extra seconds.
+    """
+
+    role: str = FLASHCARDS
+    latency: float = 0.5
+    jitter: float = 0.0
+    stream_chunk_chars: int = 64
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    quota_rps: float = 0.0
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"fake-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        CALLS.append(self.role)
+        MODEL_CALLS[self.model] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        prompt = _first_text(llm_request)
+        over_quota = self.quota_rps > 0 and _over_quota(self.quota_rps)
+        if over_quota or random.random() < self.error_rate:
+            FAULTS["quota" if over_quota else "429"] += 1
+            await asyncio.sleep(delay / 10)
+            raise errors.ClientError(429, {"error": {
+                "code": 429, "message": "Resource has been exhausted (fake)", "status": "RESOURCE_EXHAUSTED",
+            }})
+        if random.random() < self.slow_rate:
+            FAULTS["slow"] += 1
+            delay += self.slow_latency
+
+        if self.role == ROUTER:
+            await asyncio.sleep(delay)
+            target = "quiz_agent" if "quiz" in prompt.lower() else "flashcard_agent"
+            call = types.FunctionCall(name="transfer_to_agent", args={"agent_name": target})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            return
+
+        # Vary the output with the prompt so distinct documents get distinct items
+        seed = f"#{zlib.crc32(prompt.encode()) % 10000}"
+        count = _requested_count(prompt)
+        body = canned_quiz(count, seed) if self.role == QUIZ else canned_flashcards(count, seed)
+        text = "```json\n" + json.dumps(body, indent=2) + "\n```"
+
+        if not stream:
+            await asyncio.sleep(delay)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+            return
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=piece)]), partial=True)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def install_fake_model(agent_module, latency: float = 0.5, jitter: float = 0.0,
+                       router_latency: Optional[float] = None, error_rate: float = 0.0,
+                       slow_rate: float = 0.0, slow_latency: float = 0.0, quota_rps: float = 0.0):
+    """Replace the model of the root, flashcard and quiz agents with fakes.
+
+    ``agent_module`` is the loaded ``studywithai-agent/agent.py`` module
+    (``api.agent_module``). Calls are recorded in ``CALLS`` and injected
+    faults in ``FAULTS``.
+    """
+    roles = (
+        (agent_module.root_agent, ROUTER, latency if router_latency is None else router_latency),
+        (agent_module.flashcard_agent, FLASHCARDS, latency),
+        (agent_module.quiz_agent, QUIZ, latency),
+    )
+    for agent, role, role_latency in roles:
+        agent.model = FakeGemini(
+            model=f"fake-{role}", role=role, latency=role_latency, jitter=jitter,
+            error_rate=error_rate, slow_rate=slow_rate, slow_latency=slow_latency, quota_rps=quota_rps,
+        )
+
+
+def install_fake_tier_models(tier_agents: Dict[str, tuple], latencies: Dict[str, float],
+                             error_rates: Optional[Dict[str, float]] = None):
+    """Replace the models of every model tier's agents with fakes.
+
+    ``tier_agents`` maps tier names to their root, flashcard and quiz agents
+    (``api.tier_agents``). Each tier answers after its entry in ``latencies``
+    and fails with 429s at its ``error_rates`` entry. Calls are counted per
+    tier in ``MODEL_CALLS`` under ``fake-<tier>-<role>``.
+    """
+    error_rates = error_rates or {}
+    for tier, agents in tier_agents.items():
+        for agent, role in zip(agents, (ROUTER, FLASHCARDS, QUIZ)):
+            agent.model = FakeGemini(
+                model=f"fake-{tier}-{role}", role=role, latency=latencies[tier],
+                error_rate=error_rates.get(tier, 0.0),
+            )
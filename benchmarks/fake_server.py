@@ -0,0 +1,50 @@
+"""
+Fake Server
+
+Runs the StudyWithAI API under uvicorn with the fake Gemini model behind
+every agent, for load tests against a real HTTP server:
+
+    python -m benchmarks.fake_server --port 8000 --latency 0.5
+    python -m benchmarks.load_test --url http://localhost:8000 --server-pid <pid>
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import uvicorn
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API with a fake Gemini model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random fake model latency (seconds)")
+    parser.add_argument("--router-latency", type=float, default=None, help="Fake root agent latency (defaults to --latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake model calls that fail with 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of fake model calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra latency of slow fake model calls (seconds)")
+    parser.add_argument("--quota-rps", type=float, default=0.0, help="Fake model calls per second before 429s (0 = no quota)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("API_SECRET_KEY", "benchmark")
+    sys.path.insert(0, str(REPO_ROOT))
+    import api
+    from benchmarks.fake_gemini import install_fake_model
+
+    install_fake_model(
+        api.agent_module, latency=args.latency, jitter=args.jitter, router_latency=args.router_latency,
+        error_rate=args.error_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        quota_rps=args.quota_rps,
+    )
+    print(f"Serving with fake model (pid {os.getpid()}, X-API-Key {os.environ['API_SECRET_KEY']})")
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Load Test
+
+Drives /generate-flashcards and /generate-quiz at a fixed concurrency with a
+synthetic PDF corpus and reports throughput, latency percentiles and peak
+RSS as JSON.
+
+By default the API runs in this process with the fake Gemini model, so runs
+are offline and repeatable. Pass --url to load-test a running server instead
+(for example one started with ``python -m benchmarks.fake_server``).
+
+    python -m benchmarks.load_test --requests 200 --concurrency 16 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import psutil
+
+from benchmarks.corpus import CORPUS_SIZES, build_corpus
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ENDPOINTS = {
+    "flashcards": ("/generate-flashcards", "num_flashcards"),
+    "quiz": ("/generate-quiz", "num_questions"),
+}
+TEXT_ONLY = "text"
+TEXT_PROMPT = (
+    "Photosynthesis converts light energy into chemical energy. Chlorophyll absorbs light, "
+    "water is split to release oxygen, and the Calvin cycle fixes carbon dioxide into sugars."
+)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    values = sorted(latency * 1000 for latency in latencies)
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(percentile(values, 0.50), 1),
+        "p95": round(percentile(values, 0.95), 1),
+        "p99": round(percentile(values, 0.99), 1),
+        "max": round(values[-1], 1),
+    }
+
+
+class RssSampler:
+    """Samples the RSS of a process and its children from a background thread."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        total = 0
+        for process in [self.process] + self.process.children(recursive=True):
+            try:
+                total += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_workload(endpoints: List[str], sizes: List[str], variants: int) -> List[Tuple[str, str, Optional[bytes]]]:
+    """Return the (endpoint, size, pdf) combinations requests cycle through."""
+    corpus = build_corpus([size for size in sizes if size != TEXT_ONLY], variants)
+    workload = []
+    for variant in range(variants):
+        for endpoint in endpoints:
+            for size in sizes:
+                pdf = None if size == TEXT_ONLY else corpus[size][variant]
+                workload.append((endpoint, size, pdf))
+    return workload
+
+
+async def send_request(client: httpx.AsyncClient, index: int, endpoint: str, pdf: Optional[bytes],
+                       num_items: int, unique_prompts: bool, api_key: str) -> int:
+    path, count_field = ENDPOINTS[endpoint]
+    prompt = TEXT_PROMPT if pdf is None else "Create study material from the attached lecture notes."
+    if unique_prompts:
+        prompt += f" (request {index})"
+    files = [("files", (f"lecture-{index}.pdf", pdf, "application/pdf"))] if pdf is not None else None
+    response = await client.post(
+        path,
+        data={"prompt": prompt, count_field: str(num_items)},
+        files=files,
+        headers={"X-API-Key": api_key},
+    )
+    return response.status_code
+
+
+async def run_load(client: httpx.AsyncClient, workload, args) -> dict:
+    """Send the warm-up and measured requests and collect per-request results."""
+    for index in range(args.warmup):
+        endpoint, _, pdf = workload[index % len(workload)]
+        await send_request(client, -index - 1, endpoint, pdf, args.num_items, args.unique_prompts, args.api_key)
+
+    indices = iter(range(args.requests))
+    results: List[Tuple[str, float, Optional[int], Optional[str]]] = []
+
+    async def worker():
+        for index in indices:
+            endpoint, size, pdf = workload[index % len(workload)]
+            start = time.perf_counter()
+            status, error = None, None
+            try:
+                status = await send_request(client, index, endpoint, pdf, args.num_items, args.unique_prompts, args.api_key)
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            results.append((f"{endpoint}/{size}", time.perf_counter() - start, status, error))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    duration = time.perf_counter() - start
+
+    by_workload: Dict[str, List[float]] = defaultdict(list)
+    errors_by_workload: Counter = Counter()
+    statuses: Counter = Counter()
+    latencies = []
+    for name, latency, status, error in results:
+        statuses[str(status) if status is not None else error] += 1
+        if status == 200:
+            latencies.append(latency)
+            by_workload[name].append(latency)
+        else:
+            errors_by_workload[name] += 1
+
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(latencies),
+        "status_codes": dict(statuses),
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(len(latencies) / duration, 2) if duration else None,
+        "latency_ms": latency_summary(latencies),
+        "by_workload": {
+            name: {
+                "requests": len(by_workload[name]) + errors_by_workload[name],
+                "errors": errors_by_workload[name],
+                "latency_ms": latency_summary(by_workload[name]),
+            }
+            for name in sorted(set(by_workload) | set(errors_by_workload))
+        },
+    }
+
+
+async def run_in_process(args, workload) -> dict:
+    """Run the API in this process with the fake model behind every agent."""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("API_SECRET_KEY", args.api_key)
+    args.api_key = os.environ["API_SECRET_KEY"]
+    sys.path.insert(0, str(REPO_ROOT))
+    import api
+    from benchmarks.fake_gemini import CALLS, FAULTS, install_fake_model
+
+    install_fake_model(
+        api.agent_module, latency=args.latency, jitter=args.jitter, router_latency=args.router_latency,
+        error_rate=args.error_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        quota_rps=args.quota_rps,
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=api.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+            with RssSampler(os.getpid()) as sampler:
+                report = await run_load(client, workload, args)
+    finally:
+        api.pdf_pool.shutdown()
+    report["peak_rss_bytes"] = sampler.peak
+    report["model_calls"] = dict(Counter(CALLS))
+    report["injected_faults"] = dict(FAULTS)
+    report["model_governor"] = api.model_governor.stats()
+    return report
+
+
+async def run_against_url(args, workload) -> dict:
+    """Load-test a running server; RSS is sampled only when --server-pid is given."""
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        if args.server_pid:
+            with RssSampler(args.server_pid) as sampler:
+                report = await run_load(client, workload, args)
+            report["peak_rss_bytes"] = sampler.peak
+        else:
+            report = await run_load(client, workload, args)
+            report["peak_rss_bytes"] = None
+    return report
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the StudyWithAI generation endpoints")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests sent first")
+    parser.add_argument("--endpoints", default="flashcards,quiz", help="Comma-separated: flashcards, quiz")
+    parser.add_argument("--sizes", default="text,small,medium",
+                        help=f"Comma-separated corpus sizes: {TEXT_ONLY} (no PDF), {', '.join(CORPUS_SIZES)}")
+    parser.add_argument("--variants", type=int, default=4, help="Distinct PDFs per size")
+    parser.add_argument("--num-items", type=int, default=10, help="Flashcards or questions per request")
+    parser.add_argument("--repeat-prompts", dest="unique_prompts", action="store_false",
+                        help="Send identical prompts so repeated requests can hit the generation cache")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random fake model latency (seconds)")
+    parser.add_argument("--router-latency", type=float, default=None, help="Fake root agent latency (defaults to --latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake model calls that fail with 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of fake model calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra latency of slow fake model calls (seconds)")
+    parser.add_argument("--quota-rps", type=float, default=0.0, help="Fake model calls per second before 429s (0 = no quota)")
+    parser.add_argument("--url", help="Base URL of a running server instead of the in-process app")
+    parser.add_argument("--api-key", default=os.getenv("API_SECRET_KEY", "benchmark"), help="X-API-Key to send")
+    parser.add_argument("--server-pid", type=int, help="PID of the server to sample RSS from in --url mode")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout (seconds)")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    args = parser.parse_args(argv)
+
+    args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    args.sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    for endpoint in args.endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"Unknown endpoint: {endpoint}")
+    for size in args.sizes:
+        if size != TEXT_ONLY and size not in CORPUS_SIZES:
+            parser.error(f"Unknown corpus size: {size}")
+    if args.requests < 1 or args.concurrency < 1 or args.variants < 1:
+        parser.error("--requests, --concurrency and --variants must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workload = build_workload(args.endpoints, args.sizes, args.variants)
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ("api_key", "output")
+    }
+    if args.url:
+        report = asyncio.run(run_against_url(args, workload))
+    else:
+        report = asyncio.run(run_in_process(args, workload))
+
+    peak = report["peak_rss_bytes"]
+    report["peak_rss_mb"] = round(peak / (1024 * 1024), 1) if peak else None
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "mode": "url" if args.url else "in-process",
+        "config": config,
+        **report,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Overhead
+
+Micro-benchmark of the per-request cost of the API's request/response path,
+without any model or PDF work. The same canned flashcard deck is served by
+two minimal apps:
+
+- ``legacy``: the API key and request metrics checks as ``@app.middleware("http")``
+  functions, and the response built from Pydantic items and re-validated
+  against ``response_model``;
+- ``lean``: the plain ASGI ``ApiKeyMiddleware``, ``RequestMetricsMiddleware``
+  and ``CompressionMiddleware`` the API uses, with the deck encoded
+  directly by ``FastJSONResponse``.
+
+Requests go through httpx's in-process ASGI transport, one at a time, and
+the report gives per-request latency in microseconds:
+
+    python -m benchmarks.overhead --requests 2000 --items 10,100
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import metrics
+from auth import ApiKeyMiddleware
+from benchmarks.load_test import git_commit, percentile
+from serialization import CompressionMiddleware, FastJSONResponse, brotli, orjson
+
+API_KEY = "benchmark"
+
+
+class Flashcard(BaseModel):
+    number: int
+    front: str
+    back: str
+
+
+class FlashcardResponse(BaseModel):
+    success: bool
+    message: str
+    session_id: str
+    cached: bool = False
+    metadata: Dict[str, Any] = {}
+    flashcards: List[Flashcard]
+
+
+def build_deck(num_items: int) -> List[dict]:
+    return [
+        {"number": i, "front": f"What is term {i} in the chapter?", "back": f"Term {i} is the definition given in section {i % 7 + 1}, with an example."}
+        for i in range(1, num_items + 1)
+    ]
+
+
+def legacy_app(decks: Dict[int, List[dict]]) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def validate_api_key(request: Request, call_next):
+        api_key = request.headers.get("X-API-Key")
+        if not api_key or api_key != API_KEY:
+            return JSONResponse(status_code=401, content={"success": False, "message": "Invalid or missing API key"})
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        timings, token = metrics.start_request_timings()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            path = getattr(request.scope.get("route"), "path", "unmatched")
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, path, str(status))
+            metrics.finish_request_timings(token)
+
+    @app.get("/deck/{num_items}", response_model=FlashcardResponse)
+    async def deck(num_items: int):
+        cards = decks[num_items]
+        return FlashcardResponse(
+            success=True, message=f"Generated {len(cards)} flashcards successfully", session_id="benchmark",
+            metadata={"dispatch_mode": "direct"}, flashcards=[Flashcard(**card) for card in cards]
+        )
+
+    return app
+
+
+def lean_app(decks: Dict[int, List[dict]]) -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(ApiKeyMiddleware, api_key=API_KEY)
+    app.add_middleware(metrics.RequestMetricsMiddleware)
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/deck/{num_items}", response_model=FlashcardResponse)
+    async def deck(num_items: int):
+        cards = decks[num_items]
+        return FastJSONResponse({
+            "success": True, "message": f"Generated {len(cards)} flashcards successfully", "session_id": "benchmark",
+            "cached": False, "metadata": {"dispatch_mode": "direct"}, "flashcards": cards
+        })
+
+    return app
+
+
+async def measure(app: FastAPI, num_items: int, requests: int, warmup: int, accept_encoding: str) -> dict:
+    headers = {"X-API-Key": API_KEY, "Accept-Encoding": accept_encoding}
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    response_bytes = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for i in range(warmup + requests):
+            start = time.perf_counter()
+            response = await client.get(f"/deck/{num_items}", headers=headers)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            if i >= warmup:
+                latencies.append(elapsed)
+                response_bytes = len(response.content) if "content-encoding" not in response.headers else int(response.headers["content-length"])
+    values = sorted(latency * 1_000_000 for latency in latencies)
+    return {
+        "mean_us": round(sum(values) / len(values), 1),
+        "p50_us": round(percentile(values, 0.50), 1),
+        "p99_us": round(percentile(values, 0.99), 1),
+        "response_bytes": response_bytes,
+    }
+
+
+async def run(args) -> dict:
+    decks = {num_items: build_deck(num_items) for num_items in args.items}
+    apps = {"legacy": legacy_app(decks), "lean": lean_app(decks)}
+    results = {}
+    for num_items in args.items:
+        row = {}
+        for name, app in apps.items():
+            row[name] = await measure(app, num_items, args.requests, args.warmup, args.accept_encoding)
+        row["saved_us"] = round(row["legacy"]["mean_us"] - row["lean"]["mean_us"], 1)
+        results[f"{num_items}_items"] = row
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the per-request overhead of the API's request/response path")
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per app and deck size")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests sent first")
+    parser.add_argument("--items", default="10,100", help="Comma-separated deck sizes")
+    parser.add_argument("--accept-encoding", default="identity", help="Accept-Encoding to send (e.g. 'gzip, br')")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout")
+    args = parser.parse_args(argv)
+    args.items = [int(size) for size in args.items.split(",") if size.strip()]
+    if args.requests < 1 or not args.items:
+        parser.error("--requests and --items must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "orjson": orjson is not None,
+        "brotli": brotli is not None,
+        "results": asyncio.run(run(args)),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Caching
+
+Content-addressed caches used by the API. Entries live in an in-memory LRU
+tier bounded by total size, optionally backed by an on-disk tier (a local
+directory or a SQLite database) that survives restarts.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional
+
+logger = logging.getLogger("studywithai.caching")
+
+# --- Configuration ---
+PDF_TEXT_CACHE_MAX_BYTES = int(os.getenv("PDF_TEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PDF_TEXT_CACHE_BACKEND = os.getenv("PDF_TEXT_CACHE_BACKEND", "none").lower()
+PDF_TEXT_CACHE_PATH = os.getenv("PDF_TEXT_CACHE_PATH", ".cache/pdf_text")
+PDF_TEXT_CACHE_DISK_MAX_BYTES = int(os.getenv("PDF_TEXT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+GENERATION_CACHE_BACKEND = os.getenv("GENERATION_CACHE_BACKEND", "none").lower()
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", "3600"))
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", ".cache/generation.sqlite")
+
+
+class LRUCache:
+    """In-memory LRU mapping bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            # Never let a single oversized entry flush the whole cache
+            return
+        self.delete(key)
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+
+class DirectoryStore:
+    """On-disk cache tier storing one file per key."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._current_bytes = sum(f.stat().st_size for f in self.path.glob("*.bin"))
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            data = self._file(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        # Touch the file so pruning evicts the least recently used entries
+        os.utime(self._file(key))
+        return data
+
+    def set(self, key: str, value: bytes):
+        target = self._file(key)
+        tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(value)
+        with self._lock:
+            old_size = target.stat().st_size if target.exists() else 0
+            os.replace(tmp, target)
+            self._current_bytes += len(value) - old_size
+            if self._current_bytes > self.max_bytes:
+                self._prune()
+
+    def _prune(self):
+        files = sorted(self.path.glob("*.bin"), key=lambda f: f.stat().st_mtime)
+        for f in files:
+            if self._current_bytes <= self.max_bytes:
+                break
+            size = f.stat().st_size
+            f.unlink(missing_ok=True)
+            self._current_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"backend": "directory", "bytes": self._current_bytes, "evictions": self.evictions}
+
+
+class SQLiteStore:
+    """On-disk cache tier backed by a single SQLite database file."""
+
+    def __init__(self, path: str, max_bytes: int, table: str = "cache"):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    f"SELECT key, size FROM {self.table} ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        return {"backend": "sqlite", "bytes": total, "evictions": self.evictions}
+
+
+def create_disk_store(backend: str, path: str, max_bytes: int, table: str = "cache"):
+    """Build the on-disk tier for a backend name, or None when disabled."""
+    if backend in ("", "none", "memory"):
+        return None
+    if backend == "directory":
+        return DirectoryStore(path, max_bytes)
+    if backend == "sqlite":
+        return SQLiteStore(path, max_bytes, table=table)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+class PdfTextCache:
+    """Two-tier cache of extracted PDF text keyed by the digest of the PDF bytes."""
+
+    def __init__(self, max_bytes: int, disk_store=None):
+        self.memory = LRUCache(max_bytes)
+        self.disk = disk_store
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self.memory.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        if self.disk is not None:
+            data = await asyncio.to_thread(self.disk.get, key)
+            if data is not None:
+                self.disk_hits += 1
+                text = data.decode("utf-8")
+                self.memory.set(key, text, len(data))
+                return text
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, text: str):
+        data = text.encode("utf-8")
+        self.memory.set(key, text, len(data))
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, data)
+            except Exception as e:
+                logger.warning("Failed to write PDF text cache entry to disk: %s", e)
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters for cache sizing."""
+        stats = {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self.memory),
+            "bytes": self.memory.current_bytes,
+            "max_bytes": self.memory.max_bytes,
+            "evictions": self.memory.evictions,
+        }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def create_pdf_text_cache() -> PdfTextCache:
+    """Build the PDF text cache from environment configuration."""
+    disk_store = create_disk_store(
+        PDF_TEXT_CACHE_BACKEND, PDF_TEXT_CACHE_PATH, PDF_TEXT_CACHE_DISK_MAX_BYTES, table="pdf_text"
+    )
+    logger.info("PDF text cache: %d bytes in memory, disk tier: %s", PDF_TEXT_CACHE_MAX_BYTES, PDF_TEXT_CACHE_BACKEND)
+    return PdfTextCache(PDF_TEXT_CACHE_MAX_BYTES, disk_store)
+
+
+# Generation result cache
+def normalize_content(content: str) -> str:
+    """Normalize text so that formatting-only differences map to the same cache key."""
+    content = unicodedata.normalize("NFC", content)
+    return re.sub(r"\s+", " ", content).strip()
+
+
+def generation_key(content: str, material_type: str, num_items: int) -> str:
+    """Build the key identifying a generation request by content and parameters."""
+    digest = hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+    return f"{material_type.lower()}:{num_items}:{digest}"
+
+
+class GenerationCacheBackend:
+    """Storage interface for the generation cache.
+
+    Values are JSON strings; expired entries must never be returned.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: int):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryGenerationBackend(GenerationCacheBackend):
+    """In-process generation cache backend with TTL and size-based LRU eviction."""
+
+    def __init__(self, max_bytes: int):
+        self.lru = LRUCache(max_bytes)
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.lru.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            self.lru.delete(key)
+            self.expirations += 1
+            return None
+        return value
+
+    def set(self, key: str, value: str, ttl: int):
+        self.lru.set(key, (value, time.time() + ttl), len(value))
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self.lru),
+            "bytes": self.lru.current_bytes,
+            "max_bytes": self.lru.max_bytes,
+            "evictions": self.lru.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteGenerationBackend(GenerationCacheBackend):
+    """Generation cache backend persisted in a local SQLite file."""
+
+    def __init__(self, path: str, max_bytes: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM generation WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM generation WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                return None
+            self._conn.execute("UPDATE generation SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: int):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generation (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now),
+            )
+            self.expirations += self._conn.execute("DELETE FROM generation WHERE expires <= ?", (now,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM generation").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute("SELECT key, size FROM generation ORDER BY accessed LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM generation WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generation"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class GenerationCache:
+    """Cache of parsed generation results keyed by normalized content and request parameters."""
+
+    def __init__(self, backend: GenerationCacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # SQLite calls block, so they run in a worker thread
+        self._threaded = not isinstance(backend, MemoryGenerationBackend)
+
+    async def get(self, key: str) -> Optional[List[dict]]:
+        if self._threaded:
+            value = await asyncio.to_thread(self.backend.get, key)
+        else:
+            value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, items: List[dict]):
+        value = json.dumps(items)
+        try:
+            if self._threaded:
+                await asyncio.to_thread(self.backend.set, key, value, self.ttl)
+            else:
+                self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning("Failed to store generation cache entry: %s", e)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters together with backend statistics."""
+        return {"hits": self.hits, "misses": self.misses, "ttl": self.ttl, **self.backend.stats()}
+
+
+def create_generation_cache() -> Optional[GenerationCache]:
+    """Build the generation cache from environment configuration, or None when disabled."""
+    if GENERATION_CACHE_BACKEND in ("", "none", "off"):
+        return None
+    if GENERATION_CACHE_BACKEND == "memory":
+        backend = MemoryGenerationBackend(GENERATION_CACHE_MAX_BYTES)
+    elif GENERATION_CACHE_BACKEND == "sqlite":
+        backend = SQLiteGenerationBackend(GENERATION_CACHE_PATH, GENERATION_CACHE_MAX_BYTES)
+    else:
+        raise ValueError(f"Unknown generation cache backend: {GENERATION_CACHE_BACKEND}")
+    logger.info("Generation cache enabled: backend=%s, ttl=%ds", GENERATION_CACHE_BACKEND, GENERATION_CACHE_TTL)
+    return GenerationCache(backend, GENERATION_CACHE_TTL)
@@ -0,0 +1,184 @@
+"""
+Chunking
+
+Splits large documents into section-aware chunks and allocates the requested
+number of study items across them, so generation can run per chunk
+concurrently and be merged afterwards. Requests for many items are fanned
+out the same way into smaller generations, each with its own focus.
+"""
+
+import os
+import re
+from typing import List, Tuple
+
+# --- Configuration ---
+CHUNKING_THRESHOLD_CHARS = int(os.getenv("CHUNKING_THRESHOLD_CHARS", "24000"))
+CHUNK_TARGET_CHARS = int(os.getenv("CHUNK_TARGET_CHARS", "12000"))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+FANOUT_THRESHOLD_ITEMS = int(os.getenv("FANOUT_THRESHOLD_ITEMS", "15"))
+FANOUT_BATCH_ITEMS = int(os.getenv("FANOUT_BATCH_ITEMS", "10"))
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+
+# Instructions before the first file are repeated in every chunk when short enough
+MAX_SHARED_HEADER_CHARS = 2000
+
+FILE_MARKER = "\n\nContent from "
+
+_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S"                                               # Markdown headings
+    r"|(?i:chapter|section|part|unit|lesson|module)\s+[\dIVXLC]+\b"    # Chapter 3, Section IV
+    r"|\d+(?:\.\d+)*\.?\s+[A-Z][^.]{0,80}$)"                          # 3.2 Cell Division
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Focus areas for fan-out batches when the content has too few headings to divide
+FOCUS_ASPECTS = (
+    "key terms and definitions",
+    "processes and how things work",
+    "causes, effects and relationships between ideas",
+    "examples and applications",
+    "comparisons and distinctions",
+    "facts, figures, names and dates",
+)
+
+
+def split_header(content: str) -> Tuple[str, str]:
+    """Separate the user's prompt from the file contents appended after it.
+
+    Returns the shared header (empty when there are no files or the prompt is
+    too long to repeat) and the remaining body.
+    """
+    index = content.find(FILE_MARKER)
+    if index == -1:
+        return "", content
+    header = content[:index].strip()
+    if len(header) > MAX_SHARED_HEADER_CHARS:
+        return "", content
+    return header, content[index:].strip()
+
+
+def is_heading(line: str) -> bool:
+    """Whether a line looks like a file boundary or a section heading."""
+    stripped = line.strip()
+    if not stripped or len(stripped) > 100:
+        return False
+    if stripped.startswith("Content from ") and stripped.endswith(":"):
+        return True
+    if stripped.isupper() and 4 <= len(stripped) <= 80:
+        return True
+    return bool(_HEADING_RE.match(stripped))
+
+
+def split_sections(text: str) -> List[str]:
+    """Split text into sections starting at file boundaries and heading-like lines."""
+    sections: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if is_heading(line) and any(part.strip() for part in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(part.strip() for part in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _split_oversized(section: str, target_chars: int) -> List[str]:
+    """Split a section larger than the target on paragraph, then sentence boundaries."""
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", section):
+        if len(paragraph) <= target_chars:
+            pieces.append(paragraph)
+            continue
+        sentence_run: List[str] = []
+        run_len = 0
+        for sentence in _SENTENCE_END_RE.split(paragraph):
+            # Hard-split text without sentence boundaries
+            while len(sentence) > target_chars:
+                pieces.append(sentence[:target_chars])
+                sentence = sentence[target_chars:]
+            if run_len + len(sentence) > target_chars and sentence_run:
+                pieces.append(" ".join(sentence_run))
+                sentence_run, run_len = [], 0
+            sentence_run.append(sentence)
+            run_len += len(sentence) + 1
+        if sentence_run:
+            pieces.append(" ".join(sentence_run))
+    return pieces
+
+
+def chunk_text(text: str, target_chars: int = CHUNK_TARGET_CHARS) -> List[str]:
+    """Pack consecutive sections into chunks of roughly ``target_chars`` characters."""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for section in split_sections(text):
+        parts = [section] if len(section) <= target_chars else _split_oversized(section, target_chars)
+        for part in parts:
+            if current and current_len + len(part) > target_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(part)
+            current_len += len(part) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def allocate_items(sizes: List[int], total: int) -> List[int]:
+    """Distribute ``total`` items across chunks in proportion to their sizes.
+
+    Uses the largest-remainder method so the allocation always sums to
+    ``total``. Chunks may receive zero items when ``total`` is smaller than
+    the number of chunks.
+    """
+    size_sum = sum(sizes)
+    if not sizes or total <= 0 or size_sum == 0:
+        return [0] * len(sizes)
+    quotas = [total * size / size_sum for size in sizes]
+    allocation = [int(quota) for quota in quotas]
+    by_remainder = sorted(range(len(sizes)), key=lambda i: quotas[i] - allocation[i], reverse=True)
+    for i in by_remainder[:total - sum(allocation)]:
+        allocation[i] += 1
+    return allocation
+
+
+def focus_hints(text: str, parts: int) -> List[str]:
+    """Describe a distinct focus for each of ``parts`` generations over ``text``.
+
+    Consecutive runs of section headings are assigned to each part when the
+    text has enough of them; otherwise each part gets a different aspect
+    from FOCUS_ASPECTS.
+    """
+    headings = [
+        line.strip() for line in text.splitlines()
+        if is_heading(line) and not line.strip().startswith("Content from ")
+    ]
+    if len(headings) < parts:
+        return [FOCUS_ASPECTS[i % len(FOCUS_ASPECTS)] for i in range(parts)]
+    hints = []
+    start = 0
+    for size in allocate_items([1] * parts, len(headings)):
+        group = headings[start:start + size]
+        start += size
+        if size == 1:
+            hints.append(f'the section "{group[0]}"')
+        else:
+            hints.append(f'the sections from "{group[0]}" to "{group[-1]}"')
+    return hints
+
+
+def fan_out(content: str, count: int, batch_items: int = FANOUT_BATCH_ITEMS) -> List[Tuple[str, int]]:
+    """Split a generation of ``count`` items into batches of at most ``batch_items``.
+
+    Every batch sees the whole content with a note naming its focus, so the
+    batches can run concurrently without covering the same ground.
+    """
+    parts = -(-count // batch_items)
+    if parts <= 1:
+        return [(content, count)]
+    hints = focus_hints(content, parts)
+    return [
+        (f"{content}\n\n(Batch {i + 1} of {parts}: concentrate on {hint}. The other batches cover the rest of the material.)", n)
+        for i, (hint, n) in enumerate(zip(hints, allocate_items([1] * parts, count)))
+    ]
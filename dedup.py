@@ -0,0 +1,174 @@
+"""
+Dedup
+
+Near-duplicate detection for generated flashcards and quiz questions.
+Card fronts and question stems are normalized (question scaffolding such as
+"What is" or "Define" and stopwords are removed, words are lightly stemmed)
+and compared with MinHash signatures bucketed by locality-sensitive hashing,
+so each new item is checked against only a handful of candidates. Words that
+set a question's polarity ("correct", "not", "least", ...) are kept, and a
+negated stem never duplicates its positive counterpart.
+"""
+
+import os
+import random
+import re
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+# --- Configuration ---
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+DEDUP_TOPUP = os.getenv("DEDUP_TOPUP", "true").lower() == "true"
+
+NUM_PERMUTATIONS = 64
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1234)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+# Field compared for each material type
+DEDUP_FIELDS = {"flashcards": "front", "quiz": "question"}
+
+_SCAFFOLDING_RE = re.compile(
+    r"^(?:what\s+(?:is|are|was|were|does|do)(?:\s+meant\s+by)?|define|definition\s+of|describe|explain|"
+    r"which\s+of\s+the\s+following(?:\s+(?:is|are|best\s+describes))?|name|identify|state|give|list|"
+    r"true\s+or\s+false:?|how\s+(?:is|are|does|do))\b",
+)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an the of in on at to for by with from and or is are was were be been that this these those "
+    "it its as which what who whom how why when where do does did has have term concept meaning "
+    # Quiz stem template that says nothing about the topic
+    "about following statement statements".split()
+)
+# Words that flip what a question asks for: "...is correct?" and "...is incorrect?" are different questions
+_NEGATIONS = frozenset("not no never incorrect false untrue except least".split())
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "es", "ed", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Reduce a front or stem to its content words."""
+    text = text.lower().strip()
+    text = _SCAFFOLDING_RE.sub("", text)
+    return [_stem(word) for word in _WORD_RE.findall(text) if word not in _STOPWORDS]
+
+
+def polarity(tokens: List[str]) -> bool:
+    """Whether normalized tokens ask a negated question (an odd number of negations)."""
+    return sum(token in _NEGATIONS for token in tokens) % 2 == 1
+
+
+def shingles(tokens: List[str]) -> Set[str]:
+    """Word shingles. Fronts and stems are short, so single words match
+    paraphrases better than n-grams that also encode word order."""
+    return set(tokens)
+
+
+def minhash(shingle_set: Set[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingle_set]
+    prime = _MERSENNE_PRIME
+    return tuple([min([(a * h + b) % prime for h in hashes]) for a, b in _PERMUTATIONS])
+
+
+def _band_layout(threshold: float) -> Tuple[int, int]:
+    """Choose (bands, rows) so the LSH S-curve sits comfortably below the threshold.
+
+    Items are only compared when they share a band, so the candidate
+    threshold (1/bands)^(1/rows) must be lower than the similarity threshold
+    for good recall; among the layouts that satisfy that, the most selective
+    one is used.
+    """
+    layouts = [(32, 2), (16, 4), (8, 8)]
+    best = layouts[0]
+    for bands, rows in layouts:
+        if (1 / bands) ** (1 / rows) <= threshold - 0.15:
+            best = (bands, rows)
+    return best
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """Incremental near-duplicate index over short texts.
+
+    ``add`` returns False for a text whose shingles have a Jaccard
+    similarity of at least ``threshold`` with a text added before. LSH
+    candidates are verified with the exact Jaccard similarity.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.bands, self.rows = _band_layout(threshold)
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(self.bands)]
+        self._shingles: List[Set[str]] = []
+        self._polarity: List[bool] = []
+        self._exact: Set[str] = set()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def _find(self, shingle_set: Set[str], signature: Tuple[int, ...], negated: bool) -> Optional[int]:
+        checked = set()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows]
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if self._polarity[candidate] != negated:
+                    continue
+                if jaccard(shingle_set, self._shingles[candidate]) >= self.threshold:
+                    return candidate
+        return None
+
+    def add(self, text: str) -> bool:
+        """Index ``text`` unless it duplicates an earlier one; return whether it was new."""
+        tokens = normalize_tokens(text)
+        exact_key = " ".join(tokens) or text.strip().lower()
+        if exact_key in self._exact:
+            self.duplicates += 1
+            return False
+        shingle_set = shingles(tokens)
+        if not shingle_set:
+            self._exact.add(exact_key)
+            return True
+        signature = minhash(shingle_set)
+        negated = polarity(tokens)
+        if self._find(shingle_set, signature, negated) is not None:
+            self.duplicates += 1
+            return False
+        index = len(self._shingles)
+        self._shingles.append(shingle_set)
+        self._polarity.append(negated)
+        self._exact.add(exact_key)
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(signature[band * self.rows:(band + 1) * self.rows], []).append(index)
+        return True
+
+
+def dedup_items(items: List[dict], material_type: str, index: Optional[NearDuplicateIndex] = None) -> Tuple[List[dict], NearDuplicateIndex]:
+    """Drop items whose front or question duplicates an earlier one.
+
+    Pass an existing ``index`` to also drop items that duplicate previously
+    accepted ones. Returns the kept items and the index.
+    """
+    field = DEDUP_FIELDS[material_type]
+    if index is None:
+        index = NearDuplicateIndex()
+    kept = [item for item in items if index.add(item.get(field, ""))]
+    return kept, index
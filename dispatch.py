@@ -0,0 +1,86 @@
+"""
+Dispatch
+
+Selects how a generation request reaches the model. In "routed" mode the
+prompt goes to the root agent, which spends one LLM call choosing a
+sub-agent; in "direct" mode the API calls the right sub-agent itself.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+logger = logging.getLogger("studywithai.dispatch")
+
+# --- Constants ---
+DIRECT = "direct"
+ROUTED = "routed"
+DISPATCH_MODES = (DIRECT, ROUTED)
+
+# --- Configuration ---
+# Routed keeps the root agent's choice of sub-agent; direct is opt-in
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", ROUTED).lower()
+if DISPATCH_MODE not in DISPATCH_MODES:
+    raise ValueError(f"DISPATCH_MODE must be one of {', '.join(DISPATCH_MODES)}")
+
+# Weight of the newest sample in the moving averages
+_EWMA_ALPHA = 0.2
+
+
+def resolve_dispatch_mode(requested: Optional[str]) -> str:
+    """Return the dispatch mode for a request, falling back to the deployment default."""
+    if not requested:
+        return DISPATCH_MODE
+    mode = requested.lower()
+    if mode not in DISPATCH_MODES:
+        raise ValueError(f"dispatch_mode must be one of {', '.join(DISPATCH_MODES)}")
+    return mode
+
+
+class DispatchStats:
+    """Moving averages of generation latency per mode and of the routing hop itself."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency_ms = {mode: None for mode in DISPATCH_MODES}
+        self.requests = {mode: 0 for mode in DISPATCH_MODES}
+        self.routing_hop_ms: Optional[float] = None
+
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + _EWMA_ALPHA * (sample - current)
+
+    def record(self, mode: str, latency_ms: float, routing_hop_ms: Optional[float] = None):
+        """Record one generation; routed generations also report how long routing took."""
+        with self._lock:
+            self.requests[mode] += 1
+            self.latency_ms[mode] = self._ewma(self.latency_ms[mode], latency_ms)
+            if routing_hop_ms is not None:
+                self.routing_hop_ms = self._ewma(self.routing_hop_ms, routing_hop_ms)
+
+    def estimated_saving_ms(self) -> Optional[float]:
+        """Estimate the latency a direct dispatch saves, or None before any measurement.
+
+        The routing hop measured on routed requests is preferred; otherwise the
+        difference between the per-mode averages is used.
+        """
+        if self.routing_hop_ms is not None:
+            return round(self.routing_hop_ms, 1)
+        routed, direct = self.latency_ms[ROUTED], self.latency_ms[DIRECT]
+        if routed is not None and direct is not None:
+            return round(max(routed - direct, 0.0), 1)
+        return None
+
+    def stats(self) -> dict:
+        """Return per-mode request counts and latency averages."""
+        return {
+            "default_mode": DISPATCH_MODE,
+            "requests": dict(self.requests),
+            "avg_latency_ms": {
+                mode: round(value, 1) if value is not None else None
+                for mode, value in self.latency_ms.items()
+            },
+            "avg_routing_hop_ms": round(self.routing_hop_ms, 1) if self.routing_hop_ms is not None else None,
+            "estimated_saving_ms": self.estimated_saving_ms(),
+        }
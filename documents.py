@@ -0,0 +1,327 @@
+"""
+Documents
+
+Upload-once document handles. The extracted and condensed text of a set of
+uploaded PDFs is kept under a ``doc_id`` together with its chunking, so
+follow-up generations from the same material skip the upload, extraction
+and condensation. Documents expire after a period without use and are
+evicted least recently used first when the store is over its entry or byte
+limits. The default store lives in process memory; the SQLite store is
+shared by every worker process using the same file.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("studywithai.documents")
+
+# --- Configuration ---
+DOCUMENT_TTL = int(os.getenv("DOCUMENT_TTL", "3600"))
+DOCUMENT_MAX_ENTRIES = int(os.getenv("DOCUMENT_MAX_ENTRIES", "1000"))
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(256 * 1024 * 1024)))
+DOCUMENT_BACKEND = os.getenv("DOCUMENT_BACKEND", "memory").lower()
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", ".cache/documents.sqlite")
+
+
+class Document:
+    """Extracted file content ready to be appended to a prompt.
+
+    ``body`` is the files' condensed text with the same "Content from"
+    markers a direct upload produces, and ``chunks`` is its split for
+    chunked generation (None when the body is below the chunking
+    threshold).
+    """
+
+    def __init__(self, files: List[str], body: str, chunks: Optional[List[str]], metadata: Dict[str, Any]):
+        self.id = str(uuid.uuid4())
+        self.files = files
+        self.body = body
+        self.chunks = chunks
+        self.metadata = metadata
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+        self.uses = 0
+        self.size = sys.getsizeof(body) + sum(sys.getsizeof(chunk) for chunk in chunks or ())
+
+    def info(self, ttl: int) -> dict:
+        """Describe the document without its text."""
+        return {
+            "doc_id": self.id,
+            "files": self.files,
+            "chars": len(self.body),
+            "chunks": len(self.chunks) if self.chunks else 0,
+            "bytes": self.size,
+            "created_at": self.created_at,
+            "last_used_at": self.last_used_at,
+            "expires_at": self.last_used_at + ttl,
+            "uses": self.uses,
+            "metadata": self.metadata,
+        }
+
+    def dump(self) -> str:
+        """Serialize the document's content for a shared store."""
+        return json.dumps({
+            "id": self.id,
+            "files": self.files,
+            "body": self.body,
+            "chunks": self.chunks,
+            "metadata": self.metadata,
+            "created_at": self.created_at,
+        })
+
+    @classmethod
+    def load(cls, payload: str, last_used_at: float, uses: int) -> "Document":
+        data = json.loads(payload)
+        document = cls(data["files"], data["body"], data["chunks"], data["metadata"])
+        document.id = data["id"]
+        document.created_at = data["created_at"]
+        document.last_used_at = last_used_at
+        document.uses = uses
+        return document
+
+
+class DocumentStore:
+    """In-memory document store with idle TTL, max-entry and max-byte eviction."""
+
+    # Calls return without blocking, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, ttl: int = DOCUMENT_TTL, max_entries: int = DOCUMENT_MAX_ENTRIES, max_bytes: int = DOCUMENT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+        self.hits = 0
+        self.misses = 0
+        # doc_id -> Document, least recently used first
+        self._documents: "OrderedDict[str, Document]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._documents:
+            doc_id, document = next(iter(self._documents.items()))
+            if document.last_used_at > cutoff:
+                break
+            self._remove(doc_id)
+            self.expirations += 1
+
+    def _remove(self, doc_id: str) -> Optional[Document]:
+        document = self._documents.pop(doc_id, None)
+        if document is not None:
+            self.current_bytes -= document.size
+        return document
+
+    def add(self, document: Document) -> bool:
+        """Store a document, evicting older ones to make room.
+
+        Returns False without storing it when the document alone is larger
+        than the byte limit.
+        """
+        if document.size > self.max_bytes:
+            self.rejected += 1
+            return False
+        self._expire()
+        self._documents[document.id] = document
+        self.current_bytes += document.size
+        while len(self._documents) > self.max_entries or self.current_bytes > self.max_bytes:
+            doc_id, _ = next(iter(self._documents.items()))
+            self._remove(doc_id)
+            self.evictions += 1
+            logger.info("Evicted document %s", doc_id)
+        return True
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        """Return a live document and mark it as used."""
+        self._expire()
+        document = self._documents.get(doc_id)
+        if document is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        document.uses += 1
+        document.last_used_at = time.time()
+        self._documents.move_to_end(doc_id)
+        return document
+
+    def peek(self, doc_id: str) -> Optional[Document]:
+        """Return a live document without marking it as used."""
+        self._expire()
+        return self._documents.get(doc_id)
+
+    def delete(self, doc_id: str) -> bool:
+        return self._remove(doc_id) is not None
+
+    def stats(self) -> dict:
+        """Return occupancy and eviction counters."""
+        self._expire()
+        return {
+            "backend": "memory",
+            "documents": len(self._documents),
+            "bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+        }
+
+
+class SQLiteDocumentStore:
+    """Document store persisted in a local SQLite file, with the same limits as DocumentStore.
+
+    Every process using the file sees the same documents, so a ``doc_id``
+    works on whichever worker a request lands. Hit, miss, eviction,
+    expiration and rejection counters are per process, and ``stats``
+    reports them under ``worker`` with this process's pid.
+    """
+
+    # Calls block on SQLite, so callers run them in a worker thread
+    blocking = True
+
+    def __init__(self, path: str = DOCUMENT_STORE_PATH, ttl: int = DOCUMENT_TTL,
+                 max_entries: int = DOCUMENT_MAX_ENTRIES, max_bytes: int = DOCUMENT_MAX_BYTES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents "
+            "(id TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used_at REAL NOT NULL, "
+            "uses INTEGER NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_lru ON documents (last_used_at)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @property
+    def current_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+
+    def _expire(self):
+        self.expirations += self._conn.execute(
+            "DELETE FROM documents WHERE last_used_at <= ?", (time.time() - self.ttl,)
+        ).rowcount
+
+    def add(self, document: Document) -> bool:
+        """Store a document, evicting older ones to make room.
+
+        Returns False without storing it when the document alone is larger
+        than the byte limit.
+        """
+        if document.size > self.max_bytes:
+            self.rejected += 1
+            return False
+        with self._lock:
+            self._expire()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (id, size, last_used_at, uses, payload) VALUES (?, ?, ?, ?, ?)",
+                (document.id, document.size, document.last_used_at, document.uses, document.dump()),
+            )
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                row = self._conn.execute("SELECT id, size FROM documents ORDER BY last_used_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+                count -= 1
+                total -= row[1]
+                self.evictions += 1
+                logger.info("Evicted document %s", row[0])
+            self._conn.commit()
+        return True
+
+    def _read(self, doc_id: str, touch: bool) -> Optional[Document]:
+        with self._lock:
+            self._expire()
+            row = self._conn.execute(
+                "SELECT payload, last_used_at, uses FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if row is not None and touch:
+                row = (row[0], time.time(), row[2] + 1)
+                self._conn.execute(
+                    "UPDATE documents SET last_used_at = ?, uses = ? WHERE id = ?", (row[1], row[2], doc_id)
+                )
+            self._conn.commit()
+        return Document.load(*row) if row is not None else None
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        """Return a live document and mark it as used."""
+        document = self._read(doc_id, touch=True)
+        if document is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return document
+
+    def peek(self, doc_id: str) -> Optional[Document]:
+        """Return a live document without marking it as used."""
+        return self._read(doc_id, touch=False)
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def stats(self) -> dict:
+        """Return occupancy and eviction counters."""
+        with self._lock:
+            self._expire()
+            self._conn.commit()
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        return {
+            "backend": "sqlite",
+            "documents": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            # Other workers sharing the file keep their own counters
+            "worker": {
+                "pid": os.getpid(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejected": self.rejected,
+            },
+        }
+
+
+def create_document_store():
+    """Build the document store from environment configuration."""
+    if DOCUMENT_BACKEND == "memory":
+        return DocumentStore()
+    if DOCUMENT_BACKEND == "sqlite":
+        return SQLiteDocumentStore()
+    raise ValueError(f"Unknown document store backend: {DOCUMENT_BACKEND}")
@@ -0,0 +1,372 @@
+"""
+Governor
+
+Admission control for model calls. Every call waits for a global slot, a
+slot for its caller (the API key it authenticated with) and a token from a rate limiter that halves its rate when the model reports
+quota errors (429) and recovers additively after successful calls. Transient failures are retried with jittered
+exponential backoff, and a call that runs past the recent p95 latency can
+be hedged with a duplicate whose result is used if it finishes first.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from resources import worker_rate_share, worker_share
+
+logger = logging.getLogger("studywithai.governor")
+
+# --- Configuration ---
+# Limits are server-wide; each serve.py worker process gets its share
+GOVERNOR_MAX_CONCURRENCY = worker_share(int(os.getenv("GOVERNOR_MAX_CONCURRENCY", "32")))
+# Per API key; unset means half the global limit when several keys are configured
+GOVERNOR_MAX_PER_KEY = worker_share(int(os.environ["GOVERNOR_MAX_PER_KEY"])) if os.getenv("GOVERNOR_MAX_PER_KEY") else None
+GOVERNOR_RATE = worker_rate_share(float(os.getenv("GOVERNOR_RATE", "20")))
+GOVERNOR_MIN_RATE = worker_rate_share(float(os.getenv("GOVERNOR_MIN_RATE", "0.5")))
+GOVERNOR_BURST = worker_share(int(os.getenv("GOVERNOR_BURST", "20")))
+GOVERNOR_QUEUE_TIMEOUT = float(os.getenv("GOVERNOR_QUEUE_TIMEOUT", "30"))
+GOVERNOR_MAX_RETRIES = int(os.getenv("GOVERNOR_MAX_RETRIES", "3"))
+GOVERNOR_BACKOFF_BASE = float(os.getenv("GOVERNOR_BACKOFF_BASE", "0.5"))
+GOVERNOR_BACKOFF_MAX = float(os.getenv("GOVERNOR_BACKOFF_MAX", "8"))
+GOVERNOR_HEDGE = os.getenv("GOVERNOR_HEDGE", "false").lower() == "true"
+
+# Calls per second added back to the rate after each successful call
+RATE_INCREASE = 0.2
+# Minimum seconds between two rate decreases, so a burst of 429s halves the rate once
+DECREASE_INTERVAL = 1.0
+# Successful call durations kept for the p95 estimate, and how many are needed to hedge
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# google.genai errors render as "<code> <STATUS>. <details>"
+_STATUS_PREFIX_RE = re.compile(r"^(\d{3}) [A-Z_]+\b")
+# gRPC-style status names reported instead of an HTTP code
+_STATUS_NAMES = {"RESOURCE_EXHAUSTED": 429, "INTERNAL": 500, "UNAVAILABLE": 503, "DEADLINE_EXCEEDED": 504}
+
+_caller_key: contextvars.ContextVar[str] = contextvars.ContextVar("governor_caller_key", default="default")
+
+
+def set_caller_key(api_key: str):
+    """Attribute model calls made in the current context to ``api_key``."""
+    _caller_key.set(hashlib.sha256(api_key.encode()).hexdigest()[:16])
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of an upstream error, or of the error it was raised from.
+
+    The status is read from the error's ``code``/``status_code``/``status``
+    attributes, or from the "NNN STATUS" prefix of google.genai error
+    messages; numbers elsewhere in a message are ignored.
+    """
+    while error is not None:
+        for attr in ("code", "status_code"):
+            value = getattr(error, attr, None)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+        status = getattr(error, "status", None)
+        if isinstance(status, str) and status in _STATUS_NAMES:
+            return _STATUS_NAMES[status]
+        match = _STATUS_PREFIX_RE.match(str(error))
+        if match is not None:
+            return int(match.group(1))
+        error = error.__cause__
+    return None
+
+
+class GovernorSaturated(Exception):
+    """Raised when a call waited longer than the queue timeout for a slot."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Model calls are saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ModelRateLimited(Exception):
+    """Raised when the model still reports quota errors after every retry."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Model quota exceeded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate follows additive-increase/multiplicative-decrease.
+
+    The configured rate is the ceiling. Each quota error halves the rate
+    (at most once per DECREASE_INTERVAL) down to ``min_rate``, and each
+    successful call adds RATE_INCREASE back.
+    """
+
+    def __init__(self, rate: float = GOVERNOR_RATE, burst: int = GOVERNOR_BURST, min_rate: float = GOVERNOR_MIN_RATE):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+        self.decreases = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available without waiting."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, deadline: float):
+        """Wait for a token in FIFO order; raise TimeoutError if none arrives before ``deadline``."""
+        async with self._lock:
+            while not self.try_acquire():
+                wait = (1 - self._tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise asyncio.TimeoutError
+                await asyncio.sleep(wait)
+
+    def on_success(self):
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_INTERVAL:
+            return
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._last_decrease = now
+        self.decreases += 1
+        logger.warning("Model quota error, rate lowered to %.2f calls/s", self.rate)
+
+
+class ModelCallGovernor:
+    """Concurrency caps, adaptive rate limiting, retries and hedging for model calls.
+
+    ``callers`` is the number of API keys that can reach the governor. When
+    ``max_per_key`` is None each key may use the whole global limit if it is
+    the only one, and half of it otherwise. ``observe_wait`` is called with
+    the queue wait of every admitted call.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = GOVERNOR_MAX_CONCURRENCY,
+        max_per_key: Optional[int] = GOVERNOR_MAX_PER_KEY,
+        callers: int = 1,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+        queue_timeout: float = GOVERNOR_QUEUE_TIMEOUT,
+        max_retries: int = GOVERNOR_MAX_RETRIES,
+        backoff_base: float = GOVERNOR_BACKOFF_BASE,
+        backoff_max: float = GOVERNOR_BACKOFF_MAX,
+        hedge: bool = GOVERNOR_HEDGE,
+        observe_wait: Optional[Callable[[float], None]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        if max_per_key is None:
+            max_per_key = max_concurrency if callers <= 1 else max(1, max_concurrency // 2)
+        self.max_per_key = max_per_key
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.observe_wait = observe_wait
+        self._global = asyncio.Semaphore(max_concurrency)
+        # Semaphores of keys with calls held or waiting, and how many each has
+        self._per_key: Dict[str, asyncio.Semaphore] = {}
+        self._key_users: Counter = Counter()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.counters = Counter()
+        self.waiting = 0
+        self.in_flight = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds a rejected caller should wait, from the queue length and current rate."""
+        return max(1, math.ceil((self.waiting + 1) / self.limiter.rate))
+
+    def p95_latency(self) -> Optional[float]:
+        """p95 of recent successful call durations in seconds, or None before enough calls."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @asynccontextmanager
+    async def slot(self, key: Optional[str] = None) -> AsyncIterator[float]:
+        """Hold a per-key slot, a global slot and a rate token for one call.
+
+        Yields the time spent waiting. Raises GovernorSaturated when they are
+        not all available within the queue timeout.
+        """
+        key = key or _caller_key.get()
+        key_semaphore = self._per_key.get(key)
+        if key_semaphore is None:
+            key_semaphore = self._per_key[key] = asyncio.Semaphore(self.max_per_key)
+        self._key_users[key] += 1
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            start = time.perf_counter()
+            acquired = []
+            self.waiting += 1
+            try:
+                for semaphore in (key_semaphore, self._global):
+                    await asyncio.wait_for(semaphore.acquire(), max(deadline - time.monotonic(), 0.001))
+                    acquired.append(semaphore)
+                await self.limiter.acquire(deadline)
+            except asyncio.TimeoutError:
+                for semaphore in acquired:
+                    semaphore.release()
+                self.counters["rejected"] += 1
+                raise GovernorSaturated(self.retry_after())
+            except BaseException:
+                for semaphore in acquired:
+                    semaphore.release()
+                raise
+            finally:
+                self.waiting -= 1
+
+            wait = time.perf_counter() - start
+            self.counters["calls"] += 1
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+            if self.observe_wait is not None:
+                self.observe_wait(wait)
+            self.in_flight += 1
+            try:
+                yield wait
+            finally:
+                self.in_flight -= 1
+                for semaphore in acquired:
+                    semaphore.release()
+        finally:
+            # Drop the key's semaphore once nothing holds or waits on it
+            self._key_users[key] -= 1
+            if self._key_users[key] <= 0:
+                del self._key_users[key]
+                del self._per_key[key]
+
+    def record_success(self, seconds: float):
+        self._latencies.append(seconds)
+        self.limiter.on_success()
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Account for a failed attempt and return the backoff before the next one.
+
+        Returns None when the error is not transient or the retries are used
+        up; a quota error that is not retried is raised as ModelRateLimited.
+        """
+        status = error_status(error)
+        if status == 429:
+            self.counters["throttled"] += 1
+            self.limiter.on_throttle()
+        transient = status in RETRYABLE_STATUSES or isinstance(error, (asyncio.TimeoutError, ConnectionError))
+        if not transient or attempt >= self.max_retries:
+            self.counters["failures"] += 1
+            if status == 429:
+                raise ModelRateLimited(self.retry_after()) from error
+            return None
+        self.counters["retries"] += 1
+        # Full jitter keeps retries from a burst of failures from lining up
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        logger.warning("Model call failed (%s), retry %d in %.2fs", status or type(error).__name__, attempt + 1, delay)
+        return delay
+
+    async def call(self, run: Callable[[str], Awaitable[Any]], key: Optional[str] = None) -> Any:
+        """Run a model call under the governor.
+
+        ``run`` receives a session suffix: empty for the first attempt and
+        distinct for every retry and hedge, so each one can use a fresh
+        session.
+        """
+        attempt = 0
+        while True:
+            async with self.slot(key):
+                start = time.perf_counter()
+                try:
+                    suffix = f"-retry{attempt}" if attempt else ""
+                    p95 = self.p95_latency() if self.hedge else None
+                    if p95 is None:
+                        result = await run(suffix)
+                    else:
+                        result = await self._hedged(run, suffix, p95)
+                except Exception as e:
+                    delay = self.retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.record_success(time.perf_counter() - start)
+                    return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, run: Callable[[str], Awaitable[Any]], suffix: str, delay: float) -> Any:
+        """Start a duplicate call if the first is still running after ``delay`` seconds.
+
+        The first successful result wins and the other call is cancelled.
+        The duplicate needs a rate token but not a concurrency slot, and is
+        skipped when no token is free.
+        """
+        primary = asyncio.ensure_future(run(suffix))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.limiter.try_acquire():
+                return await primary
+            self.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(run(f"{suffix}-hedge"))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+            return primary.result()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    def stats(self) -> dict:
+        """Return admission, retry and hedging counters."""
+        calls = self.counters["calls"]
+        p95 = self.p95_latency()
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_key": self.max_per_key,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rate": round(self.limiter.rate, 2),
+            "max_rate": self.limiter.max_rate,
+            "rate_decreases": self.limiter.decreases,
+            "calls": calls,
+            "retries": self.counters["retries"],
+            "throttled": self.counters["throttled"],
+            "failures": self.counters["failures"],
+            "rejected": self.counters["rejected"],
+            "hedges": self.counters["hedges"],
+            "hedge_wins": self.counters["hedge_wins"],
+            "avg_queue_wait_ms": round(self.queue_wait_total / calls * 1000, 1) if calls else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 1),
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
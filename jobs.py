@@ -0,0 +1,431 @@
+"""
+Jobs
+
+Asynchronous generation jobs. Submitting a job returns immediately with a
+job id; a pool of async workers drains a priority queue and clients poll
+(or long-poll) for the result. The default queue lives in process memory;
+the SQLite queue keeps queued jobs and results across restarts.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from resources import serve_worker_count
+
+logger = logging.getLogger("studywithai.jobs")
+
+# --- Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "1000"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", ".cache/jobs.sqlite")
+
+# --- Job states ---
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED_STATES = (COMPLETED, FAILED)
+
+
+class Job(BaseModel):
+    id: str
+    material_type: str
+    content: str
+    num_items: int
+    priority: int = 0
+    use_cache: bool = True
+    dispatch_mode: Optional[str] = None
+    status: str = QUEUED
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    items: Optional[List[dict]] = None
+    cached: bool = False
+    metadata: Dict[str, Any] = {}
+    error: Optional[str] = None
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted to a full queue."""
+
+
+class JobQueue:
+    """Storage interface for jobs.
+
+    ``get`` blocks until a queued job is available and must hand each job to
+    exactly one worker, highest priority first and FIFO within a priority.
+    """
+
+    async def put(self, job: Job):
+        raise NotImplementedError
+
+    async def get(self) -> Job:
+        raise NotImplementedError
+
+    async def update(self, job: Job):
+        raise NotImplementedError
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+
+class InMemoryJobQueue(JobQueue):
+    """Process-local job queue; jobs are lost on restart."""
+
+    def __init__(self, result_ttl: int = JOB_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._jobs: Dict[str, Job] = {}
+        self._sequence = itertools.count()
+
+    async def put(self, job: Job):
+        self._expire()
+        self._jobs[job.id] = job
+        self._queue.put_nowait((-job.priority, next(self._sequence), job.id))
+
+    async def get(self) -> Job:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == QUEUED:
+                return job
+
+    async def update(self, job: Job):
+        self._jobs[job.id] = job
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def _connect_job_db(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs "
+        "(id TEXT PRIMARY KEY, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+        "created_at REAL NOT NULL, finished_at REAL, payload TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)")
+    conn.commit()
+    return conn
+
+
+def requeue_interrupted_jobs(path: str = JOB_QUEUE_PATH) -> int:
+    """Put jobs left running by the last shutdown back on the queue; returns how many.
+
+    Only safe while no process is working on the queue: serve.py calls it
+    once before starting its workers.
+    """
+    conn = _connect_job_db(path)
+    try:
+        requeued = conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if requeued:
+        logger.info("Re-queued %d jobs interrupted by the last shutdown", requeued)
+    return requeued
+
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue persisted in a local SQLite file.
+
+    Jobs that were running when the server stopped are re-queued on start.
+    Workers in this process are woken on submit; other processes sharing the
+    file pick up work by polling. ``depth`` reports the count of queued jobs
+    taken at this process's last write or claim, so it never touches the
+    database on the event loop.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, result_ttl: int = JOB_RESULT_TTL, poll_interval: float = 1.0):
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        # Under serve.py other workers may be running jobs: the parent re-queued before forking
+        if serve_worker_count() == 1:
+            requeue_interrupted_jobs(path)
+        self._conn = _connect_job_db(path)
+        self._depth = self._count_queued()
+
+    def _count_queued(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def _write(self, job: Job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, priority, status, created_at, finished_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.priority, job.status, job.created_at, job.finished_at, job.model_dump_json()),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - self.result_ttl,),
+            )
+            self._conn.commit()
+            self._depth = self._count_queued()
+
+    def _claim(self) -> Optional[Job]:
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is None:
+                    self._depth = 0
+                    return None
+                # The status guard keeps two processes from claiming the same job
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (RUNNING, row[0], QUEUED)
+                ).rowcount
+                self._conn.commit()
+                if claimed:
+                    self._depth = self._count_queued()
+                    return Job.model_validate_json(row[1])
+
+    def _release(self, claim: "asyncio.Future[Optional[Job]]"):
+        """Put back a job claimed for a worker that was cancelled meanwhile."""
+        if claim.cancelled() or claim.exception() is not None or claim.result() is None:
+            return
+        job_id = claim.result().id
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (QUEUED, job_id, RUNNING))
+            self._conn.commit()
+            self._depth = self._count_queued()
+        self._wakeup.set()
+
+    def _read(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.model_validate_json(row[0]) if row else None
+
+    async def put(self, job: Job):
+        await asyncio.to_thread(self._write, job)
+        self._wakeup.set()
+
+    async def get(self) -> Job:
+        while True:
+            # The claim thread runs on after a cancellation; re-queue what it claimed
+            claim = asyncio.ensure_future(asyncio.to_thread(self._claim))
+            try:
+                job = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                claim.add_done_callback(self._release)
+                raise
+            if job is not None:
+                return job
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def update(self, job: Job):
+        await asyncio.to_thread(self._write, job)
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._read, job_id)
+
+    def depth(self) -> int:
+        return self._depth
+
+
+def create_job_queue() -> JobQueue:
+    """Build the job queue from environment configuration."""
+    if JOB_QUEUE_BACKEND == "memory":
+        return InMemoryJobQueue()
+    if JOB_QUEUE_BACKEND == "sqlite":
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown job queue backend: {JOB_QUEUE_BACKEND}")
+
+
+JobHandler = Callable[[Job], Awaitable[Tuple[List[dict], bool, dict]]]
+
+
+class JobManager:
+    """Runs a pool of async workers that drain the job queue through a handler."""
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE):
+        self.queue = queue
+        self.handler = handler
+        self.num_workers = max(1, workers)
+        self.max_queue = max_queue
+        self._workers: List[asyncio.Task] = []
+        # Workers currently running a job
+        self._busy: Set[asyncio.Task] = set()
+        self._draining = False
+        self._finished: Dict[str, asyncio.Event] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def start(self):
+        """Start the worker tasks."""
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._worker(i)) for i in range(self.num_workers)]
+            logger.info("Started %d job workers", self.num_workers)
+
+    async def stop(self):
+        """Cancel the worker tasks."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop taking jobs and give running jobs up to ``timeout`` seconds to finish.
+
+        Idle workers stop at once. Workers still running after the timeout
+        are cancelled, which leaves their jobs for the next start. Returns
+        whether every running job finished.
+        """
+        self._draining = True
+        for worker in self._workers:
+            if worker not in self._busy:
+                worker.cancel()
+        busy = [worker for worker in self._workers if worker in self._busy]
+        if busy:
+            logger.info("Draining %d running jobs", len(busy))
+            _, pending = await asyncio.wait(busy, timeout=timeout)
+        else:
+            pending = set()
+        if pending:
+            logger.warning("%d jobs still running after %gs drain", len(pending), timeout)
+        await self.stop()
+        return not pending
+
+    async def submit(self, material_type: str, content: str, num_items: int, priority: int = 0,
+                     use_cache: bool = True, dispatch_mode: Optional[str] = None,
+                     metadata: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue a generation job and return it immediately.
+
+        ``metadata`` is reported with the job and merged with the generation metadata.
+        """
+        if self.queue.depth() >= self.max_queue:
+            raise QueueFull(f"Job queue is full ({self.max_queue} jobs)")
+        job = Job(
+            id=str(uuid.uuid4()),
+            material_type=material_type,
+            content=content,
+            num_items=num_items,
+            priority=priority,
+            use_cache=use_cache,
+            dispatch_mode=dispatch_mode,
+            metadata=metadata or {},
+            created_at=time.time(),
+        )
+        self._finished[job.id] = asyncio.Event()
+        await self.queue.put(job)
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[Job]:
+        """Return a job, waiting up to ``wait`` seconds for it to finish."""
+        job = await self.queue.load(job_id)
+        if job is None or job.status in FINISHED_STATES or wait <= 0:
+            return job
+        event = self._finished.get(job_id)
+        deadline = time.monotonic() + wait
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # Job submitted by another process: poll the shared queue
+            while time.monotonic() < deadline:
+                await asyncio.sleep(min(0.5, deadline - time.monotonic()))
+                job = await self.queue.load(job_id)
+                if job is None or job.status in FINISHED_STATES:
+                    return job
+        return await self.queue.load(job_id)
+
+    async def _worker(self, index: int):
+        while not self._draining:
+            job = await self.queue.get()
+            self._busy.add(asyncio.current_task())
+            try:
+                await self._run(job)
+            finally:
+                self._busy.discard(asyncio.current_task())
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        await self.queue.update(job)
+        self.running += 1
+        wait_time = job.started_at - job.created_at
+        self._wait_total += wait_time
+        self._wait_max = max(self._wait_max, wait_time)
+        try:
+            job.items, job.cached, metadata = await self.handler(job)
+            job.metadata = {**job.metadata, **metadata}
+            job.status = COMPLETED
+            self.completed += 1
+        except asyncio.CancelledError:
+            # Leave the job for the next start (SQLite re-queues running jobs)
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = getattr(e, "detail", None) or str(e)
+            self.failed += 1
+            logger.error("Job %s failed: %s", job.id, job.error)
+        finally:
+            self.running -= 1
+        job.finished_at = time.time()
+        self._run_total += job.finished_at - job.started_at
+        # The content is not needed once the job is done
+        job.content = ""
+        await self.queue.update(job)
+        event = self._finished.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    def stats(self) -> dict:
+        """Return queue depth, wait-time and throughput metrics."""
+        started = self.completed + self.failed + self.running
+        finished = self.completed + self.failed
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self.queue.depth(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_seconds": round(self._wait_total / started, 3) if started else None,
+            "max_wait_seconds": round(self._wait_max, 3),
+            "avg_run_seconds": round(self._run_total / finished, 3) if finished else None,
+        }
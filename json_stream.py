@@ -0,0 +1,195 @@
+"""
+JSON Stream
+
+Incremental parser for the ``{"flashcards": [...]}`` and
+``{"quiz_questions": [...]}`` documents produced by the sub-agents. Text is
+fed as it arrives from the model and every array element is returned as
+soon as its closing brace has been seen. ``parse_array`` applies the same
+parser to complete responses, so prose around the JSON, stray fences,
+trailing commas and truncated documents still yield every complete element.
+"""
+
+import json
+import logging
+from typing import List, NamedTuple
+
+logger = logging.getLogger("studywithai.json_stream")
+
+# Parser states
+_SEEK_KEY = 0
+_SEEK_ARRAY = 1
+_IN_ARRAY = 2
+_IN_ELEMENT = 3
+_DONE = 4
+
+
+class IncrementalArrayParser:
+    """Extracts complete elements of the array stored under ``key`` from streamed text.
+
+    Text before the key (markdown fences, prose) is ignored, as is anything
+    after the array closes. Only object elements are returned; scalars and
+    elements that fail to decode are skipped.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._needle = f'"{key}"'
+        self._buffer = ""
+        self._pos = 0
+        self._state = _SEEK_KEY
+        # Element scanning state, kept across feeds
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._is_object = False
+        self.skipped = 0
+
+    @property
+    def done(self) -> bool:
+        """Whether the array has been closed."""
+        return self._state == _DONE
+
+    @property
+    def started(self) -> bool:
+        """Whether the array has been opened."""
+        return self._state >= _IN_ARRAY
+
+    def feed(self, text: str) -> List[dict]:
+        """Consume more text and return the elements completed by it."""
+        if self._state == _DONE or not text:
+            return []
+        self._buffer += text
+        items: List[dict] = []
+        buffer = self._buffer
+        pos = self._pos
+        length = len(buffer)
+
+        while pos < length and self._state != _DONE:
+            if self._state == _SEEK_KEY:
+                index = buffer.find(self._needle, pos)
+                if index == -1:
+                    # Keep enough of the tail to match a key split across feeds
+                    pos = max(pos, length - len(self._needle) + 1)
+                    break
+                pos = index + len(self._needle)
+                self._state = _SEEK_ARRAY
+            elif self._state == _SEEK_ARRAY:
+                char = buffer[pos]
+                pos += 1
+                if char == "[":
+                    self._state = _IN_ARRAY
+                elif char not in " \t\r\n:":
+                    # The key was mentioned but not followed by an array
+                    self._state = _SEEK_KEY
+            elif self._state == _IN_ARRAY:
+                char = buffer[pos]
+                if char == "]":
+                    self._state = _DONE
+                    pos += 1
+                elif char in " \t\r\n,":
+                    pos += 1
+                else:
+                    self._state = _IN_ELEMENT
+                    self._start = pos
+                    self._depth = 0
+                    self._in_string = False
+                    self._escaped = False
+                    self._is_object = char == "{"
+            else:
+                pos, complete = self._scan_element(buffer, pos, length)
+                if complete is not None:
+                    if complete:
+                        item = self._decode(buffer[self._start:pos])
+                        if item is not None:
+                            items.append(item)
+                    self._state = _IN_ARRAY
+
+        # Drop consumed text so the buffer does not grow with the document
+        keep_from = self._start if self._state == _IN_ELEMENT else pos
+        self._buffer = buffer[keep_from:]
+        self._start -= keep_from
+        self._pos = pos - keep_from
+        return items
+
+    def _scan_element(self, buffer: str, pos: int, length: int):
+        """Advance through the current element.
+
+        Returns the new position and None while the element is incomplete,
+        True once an object element closes, or False for a finished scalar.
+        """
+        while pos < length:
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the enclosing array after a scalar element
+                    self.skipped += 1
+                    return pos, False
+                self._depth -= 1
+                if self._depth == 0 and self._is_object:
+                    return pos + 1, True
+            elif char == "," and self._depth == 0:
+                self.skipped += 1
+                return pos, False
+            pos += 1
+        return pos, None
+
+    def _decode(self, text: str):
+        try:
+            item = json.loads(text, strict=False)
+        except json.JSONDecodeError:
+            self.skipped += 1
+            logger.warning("Skipped undecodable %s element", self.key)
+            return None
+        return item if isinstance(item, dict) else None
+
+
+class ArrayParseResult(NamedTuple):
+    """Elements recovered from a response and how much of the array was seen."""
+    items: List[dict]
+    found: bool
+    complete: bool
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the array was opened but never closed."""
+        return self.found and not self.complete
+
+
+def _locate_object(text: str) -> str:
+    """Return the text from the first opening brace to the last closing brace."""
+    start = text.find("{")
+    end = text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else ""
+
+
+def parse_array(text: str, key: str) -> ArrayParseResult:
+    """Recover the object elements of the array under ``key`` anywhere in ``text``.
+
+    A well-formed payload is decoded in one ``json.loads`` call. Otherwise
+    the text is scanned with IncrementalArrayParser, which skips
+    surrounding prose and malformed elements and keeps every element that
+    closed before the text ended.
+    """
+    payload = _locate_object(text)
+    if payload:
+        try:
+            data = json.loads(payload, strict=False)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get(key), list):
+            return ArrayParseResult([item for item in data[key] if isinstance(item, dict)], True, True)
+    parser = IncrementalArrayParser(key)
+    items = parser.feed(text)
+    return ArrayParseResult(items, parser.started, parser.done)
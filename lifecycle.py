@@ -0,0 +1,87 @@
+"""
+Lifecycle
+
+Readiness and drain state of a serving worker, and the stub model used to
+warm up the agent runners at startup. A worker reports ready on ``/ready``
+only after its warm-up generation has run, and stops reporting ready as
+soon as it starts draining for shutdown.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import AsyncGenerator, List, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+logger = logging.getLogger("studywithai.lifecycle")
+
+# --- Configuration ---
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+# Canned output of the warm-up model for each material type
+WARMUP_RESPONSES = {
+    "flashcards": {"flashcards": [{"number": 1, "front": "Warm-up", "back": "Warm-up"}]},
+    "quiz": {"quiz_questions": [{
+        "number": 1, "type": "Multiple Choice", "difficulty": "Easy", "question": "Warm-up?",
+        "options": ["A) Yes", "B) No"], "answer": "A) Yes", "explanation": "Warm-up",
+    }]},
+}
+
+
+class WarmupModel(BaseLlm):
+    """Stub model that instantly answers with one canned item, so a warm-up
+    generation exercises the runner, session and parsing code paths without
+    calling Gemini."""
+
+    material_type: str = "flashcards"
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"warmup-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        text = json.dumps(WARMUP_RESPONSES[self.material_type])
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class Lifecycle:
+    """Tracks whether this worker is warmed up and whether it is draining."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+        self.draining = False
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None and not self.draining
+
+    def mark_ready(self):
+        self.ready_at = time.time()
+        logger.info("Worker %d ready %.2fs after import", os.getpid(), self.ready_at - self.started_at)
+
+    def start_draining(self):
+        if not self.draining:
+            self.draining = True
+            logger.info("Worker %d draining", os.getpid())
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "ready": self.ready,
+            "draining": self.draining,
+            "started_at": self.started_at,
+            "startup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_error": self.warmup_error,
+        }
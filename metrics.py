@@ -0,0 +1,271 @@
+"""
+Metrics
+
+Minimal in-process metrics with Prometheus text exposition: counters,
+histograms, and gauges read from callbacks. Per-request stage timings are
+collected through a context variable so they can also be returned as a
+``Server-Timing`` header.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# --- Configuration ---
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "false").lower() == "true"
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets and optional labels."""
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose value is read from a callback at scrape time.
+
+    Used to export values that other components already track, such as
+    cache hit counts and queue depths.
+    """
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], Optional[float]], metric_type: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}", f"{self.name} {value}"]
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets, labelnames))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], Optional[float]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, callback))
+
+    def callback_counter(self, name: str, help_text: str, callback: Callable[[], Optional[float]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, callback, "counter"))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- Hot-path metrics ---
+REQUEST_SECONDS = registry.histogram(
+    "studywithai_request_seconds", "HTTP request latency", labelnames=("method", "path", "status")
+)
+STAGE_SECONDS = registry.histogram(
+    "studywithai_stage_seconds", "Latency of request processing stages", labelnames=("stage",)
+)
+ADK_EVENTS = registry.counter(
+    "studywithai_adk_events_total", "ADK events received from agents", labelnames=("author",)
+)
+EVENTS_PER_GENERATION = registry.histogram(
+    "studywithai_adk_events_per_generation", "ADK events per model generation", buckets=COUNT_BUCKETS
+)
+TOKENS = registry.counter(
+    "studywithai_tokens_total",
+    "Model tokens by direction (usage metadata when available, otherwise estimated at 4 characters per token)",
+    labelnames=("direction",),
+)
+TOKENS_PER_GENERATION = registry.histogram(
+    "studywithai_tokens_per_generation", "Prompt plus output tokens per model generation", buckets=TOKEN_BUCKETS
+)
+GENERATIONS = registry.counter(
+    "studywithai_generations_total", "Parsed model generations", labelnames=("material_type",)
+)
+PARSE_FAILURES = registry.counter(
+    "studywithai_parse_failures_total", "Model responses that could not be parsed as JSON", labelnames=("material_type",)
+)
+EMPTY_RESULTS = registry.counter(
+    "studywithai_empty_results_total", "Model generations that produced no valid items", labelnames=("material_type",)
+)
+SALVAGED_ITEMS = registry.counter(
+    "studywithai_salvaged_items_total", "Items recovered from truncated or malformed model output", labelnames=("material_type",)
+)
+MODEL_TIER_CALLS = registry.counter(
+    "studywithai_model_tier_calls_total", "Model calls by tier and outcome (ok, quota, timeout, error)", labelnames=("tier", "outcome")
+)
+DUPLICATES_REMOVED = registry.counter(
+    "studywithai_duplicates_removed_total", "Generated items dropped as near-duplicates", labelnames=("material_type",)
+)
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def estimate_tokens(num_chars: int) -> int:
+    """Rough token estimate for text of ``num_chars`` characters, used when
+    the model reports no usage metadata."""
+    return num_chars // 4
+
+
+def record_stage(stage: str, seconds: float):
+    """Record a stage duration globally and for the current request."""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a named stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def start_request_timings() -> Tuple[Dict[str, float], contextvars.Token]:
+    """Begin collecting stage timings for the current request."""
+    timings: Dict[str, float] = {}
+    return timings, _request_timings.set(timings)
+
+
+def finish_request_timings(token: contextvars.Token):
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """Format stage timings as a Server-Timing header value (milliseconds)."""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware that records request latency by method, route and status.
+
+    Latency is measured to the start of the response, so streamed responses
+    report their time to first byte. With METRICS_TIMING_HEADERS the stage
+    timings finished by then are returned in a ``Server-Timing`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings, token = start_request_timings()
+        start = time.perf_counter()
+        started = False
+
+        def observe(status: int, elapsed: float):
+            # Label by route template to keep path cardinality bounded
+            path = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, scope["method"], path, str(status))
+
+        async def timed_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                elapsed = time.perf_counter() - start
+                if METRICS_TIMING_HEADERS:
+                    header = (b"server-timing", server_timing_header(timings, elapsed).encode())
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+                observe(message["status"], elapsed)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not started:
+                observe(500, time.perf_counter() - start)
+            finish_request_timings(token)
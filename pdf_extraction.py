@@ -0,0 +1,254 @@
+"""
+PDF Extraction
+
+Runs PyPDF2 text extraction in a bounded process pool so that parsing large
+PDFs never blocks the API event loop. Pages of a single document are split
+into batches and extracted in parallel across the pool's worker processes.
+Pages are produced in order and only as far ahead as the pool can run, so a
+page selection or a character budget leaves the rest of the document
+unread. Documents can be passed as bytes or as the path of a spooled upload, in
+which case workers read the file themselves instead of receiving a copy.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+from resources import available_cpus, worker_share
+
+logger = logging.getLogger("studywithai.pdf_extraction")
+
+# --- Configuration ---
+# Server-wide; each serve.py worker process gets its share
+PDF_EXTRACTION_WORKERS = worker_share(int(os.getenv("PDF_EXTRACTION_WORKERS", str(available_cpus()))))
+PDF_EXTRACTION_MAX_QUEUE = int(os.getenv("PDF_EXTRACTION_MAX_QUEUE", str(PDF_EXTRACTION_WORKERS * 4)))
+PDF_EXTRACTION_PAGES_PER_TASK = int(os.getenv("PDF_EXTRACTION_PAGES_PER_TASK", "16"))
+PDF_EXTRACTION_RETRY_AFTER = int(os.getenv("PDF_EXTRACTION_RETRY_AFTER", "5"))
+# Stop extracting a request's PDFs once this many characters are collected (0 = no limit)
+PDF_EXTRACTION_MAX_CHARS = int(os.getenv("PDF_EXTRACTION_MAX_CHARS", "0"))
+
+# Separates pages in extracted text, so condensation can tell where each page starts and ends
+PAGE_BREAK = "\f"
+
+
+class PdfExtractionError(Exception):
+    """Raised when a PDF cannot be read."""
+
+
+class ExtractionPoolSaturated(Exception):
+    """Raised when the extraction queue is full and the caller should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"PDF extraction queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# A PDF as bytes or as the path of a file on disk
+PdfSource = Union[bytes, str]
+
+# Page ranges as 0-based [start, stop) pairs; stop None means to the last page
+PageRanges = List[Tuple[int, Optional[int]]]
+
+
+def parse_page_ranges(spec: str) -> PageRanges:
+    """Parse a page selection such as ``"1-3,7,10-"`` (1-based, inclusive).
+
+    Raises ValueError for malformed selections.
+    """
+    ranges: PageRanges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        try:
+            start = int(first)
+            stop = (int(last) if last.strip() else None) if dash else start
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part!r}")
+        if start < 1 or (stop is not None and stop < start):
+            raise ValueError(f"Invalid page range: {part!r}")
+        ranges.append((start - 1, stop))
+    if not ranges:
+        raise ValueError("Empty page range")
+    return ranges
+
+
+def select_pages(ranges: Optional[PageRanges], num_pages: int) -> List[int]:
+    """Indices of the selected pages that exist, in document order."""
+    if ranges is None:
+        return list(range(num_pages))
+    selected = set()
+    for start, stop in ranges:
+        selected.update(range(start, num_pages if stop is None else min(stop, num_pages)))
+    return sorted(selected)
+
+
+def _first_pages(ranges: Optional[PageRanges], limit: int) -> List[int]:
+    """The first ``limit`` selected page indices, before the page count is known."""
+    if ranges is None:
+        return list(range(limit))
+    return select_pages(ranges, max((start for start, _ in ranges), default=0) + limit)[:limit]
+
+
+class PdfExtraction:
+    """Text of the extracted pages of one PDF, with per-page statistics."""
+
+    def __init__(self, total_pages: int, pages: List[Tuple[int, str]], selected_pages: int, stopped_early: bool):
+        self.total_pages = total_pages
+        self.pages = pages
+        self.selected_pages = selected_pages
+        self.stopped_early = stopped_early
+
+    @property
+    def text(self) -> str:
+        return PAGE_BREAK.join(text.strip() for _, text in self.pages).strip()
+
+    def stats(self) -> dict:
+        page_chars = {str(index + 1): len(text) for index, text in self.pages}
+        return {
+            "total_pages": self.total_pages,
+            "selected_pages": self.selected_pages,
+            "extracted_pages": len(self.pages),
+            "empty_pages": [int(page) for page, chars in page_chars.items() if chars == 0],
+            "chars": sum(page_chars.values()),
+            "stopped_early": self.stopped_early,
+            "page_chars": page_chars,
+        }
+
+
+# Worker functions (executed in the pool processes)
+def _extract_pages(stream, indices: List[int]) -> Tuple[int, List[Tuple[int, str]]]:
+    pdf_reader = PyPDF2.PdfReader(stream)
+    num_pages = len(pdf_reader.pages)
+    return num_pages, [(i, pdf_reader.pages[i].extract_text()) for i in indices if i < num_pages]
+
+
+def extract_pages(source: PdfSource, indices: List[int]) -> Tuple[int, List[Tuple[int, str]]]:
+    """Extract the text of the given pages and return it with the total page count.
+
+    Indices past the end of the document are skipped.
+    """
+    try:
+        if isinstance(source, str):
+            # PyPDF2 seeks through the file handle, reading only what it parses
+            with open(source, "rb") as stream:
+                return _extract_pages(stream, indices)
+        return _extract_pages(io.BytesIO(source), indices)
+    except Exception as e:
+        # Re-raise as a plain exception so it pickles cleanly back to the parent
+        raise PdfExtractionError(str(e))
+
+
+class PdfExtractionPool:
+    """Process pool for PDF text extraction with a bounded queue depth."""
+
+    def __init__(
+        self,
+        max_workers: int = PDF_EXTRACTION_WORKERS,
+        max_queue: int = PDF_EXTRACTION_MAX_QUEUE,
+        pages_per_task: int = PDF_EXTRACTION_PAGES_PER_TASK,
+        retry_after: int = PDF_EXTRACTION_RETRY_AFTER,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self.pages_per_task = max(1, pages_per_task)
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._stopped_early = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn rather than fork: the API process runs an event loop and SDK threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Started PDF extraction pool with %d workers", self.max_workers)
+        return self._executor
+
+    async def iter_pages(self, source: PdfSource, ranges: Optional[PageRanges] = None) -> AsyncIterator[Tuple[int, int, str]]:
+        """Yield ``(total_pages, page_index, text)`` for the selected pages in document order.
+
+        Pages are extracted in batches of ``pages_per_task`` with at most one
+        batch per pool worker running ahead of the consumer, so closing the
+        generator early leaves the rest of the document unread.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        # The first task also reports the page count, so small PDFs need one round trip
+        num_pages, pages = await loop.run_in_executor(
+            executor, extract_pages, source, _first_pages(ranges, self.pages_per_task)
+        )
+        for index, text in pages:
+            yield num_pages, index, text
+        remaining = select_pages(ranges, num_pages)[len(pages):]
+        batches = deque(remaining[i:i + self.pages_per_task] for i in range(0, len(remaining), self.pages_per_task))
+        running: deque = deque()
+        try:
+            while batches or running:
+                while batches and len(running) < self.max_workers:
+                    running.append(loop.run_in_executor(executor, extract_pages, source, batches.popleft()))
+                _, pages = await running.popleft()
+                for index, text in pages:
+                    yield num_pages, index, text
+        finally:
+            for future in running:
+                future.cancel()
+
+    async def extract(self, source: PdfSource, ranges: Optional[PageRanges] = None, max_chars: int = 0) -> PdfExtraction:
+        """Extract the selected pages of a PDF without blocking the event loop.
+
+        Extraction stops after the page that brings the text to ``max_chars``
+        characters (0 for no limit).
+        """
+        if self._in_flight >= self.max_queue:
+            self._rejected += 1
+            raise ExtractionPoolSaturated(self.retry_after)
+
+        self._in_flight += 1
+        try:
+            total_pages, pages, chars, stopped_early = 0, [], 0, False
+            async with aclosing(self.iter_pages(source, ranges)) as page_iter:
+                async for total_pages, index, text in page_iter:
+                    pages.append((index, text))
+                    chars += len(text)
+                    if max_chars and chars >= max_chars:
+                        stopped_early = True
+                        break
+            selected = len(select_pages(ranges, total_pages))
+            stopped_early = stopped_early and len(pages) < selected
+            self._completed += 1
+            self._stopped_early += stopped_early
+            return PdfExtraction(total_pages, pages, selected, stopped_early)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        """Return pool utilisation counters."""
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "stopped_early": self._stopped_early,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,72 @@
+"""
+Resources
+
+CPU and limit sizing for the API processes. The CPU count honours the
+process's CPU affinity and the container's cgroup CPU quota, which
+``os.cpu_count()`` ignores. When serve.py pre-forks several workers it
+exports their number in SERVE_WORKER_COUNT, and server-wide limits are
+split evenly between them.
+"""
+
+import math
+import os
+from typing import Optional
+
+# cgroup v2 and v1 CPU quota files
+_CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+_CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+_CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[int]:
+    """CPUs allowed by the cgroup CPU quota, rounded up, or None without a quota."""
+    cpu_max = _read(_CGROUP_V2_CPU_MAX)
+    if cpu_max is not None:
+        quota, _, period = cpu_max.partition(" ")
+        if quota == "max" or not period:
+            return None
+        quota_us, period_us = int(quota), int(period)
+    else:
+        quota, period = _read(_CGROUP_V1_QUOTA), _read(_CGROUP_V1_PERIOD)
+        if quota is None or period is None:
+            return None
+        quota_us, period_us = int(quota), int(period)
+    if quota_us <= 0 or period_us <= 0:
+        return None
+    return max(1, math.ceil(quota_us / period_us))
+
+
+def available_cpus() -> int:
+    """CPUs this process can actually use: its affinity set, capped by the cgroup quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        limit = cgroup_cpu_limit()
+    except ValueError:
+        limit = None
+    return max(1, min(cpus, limit or cpus))
+
+
+def serve_worker_count() -> int:
+    """Number of API worker processes sharing this server (1 outside serve.py)."""
+    return max(1, int(os.getenv("SERVE_WORKER_COUNT", "1")))
+
+
+def worker_share(total: int) -> int:
+    """This worker's share of a server-wide count limit (at least 1)."""
+    return max(1, total // serve_worker_count())
+
+
+def worker_rate_share(total: float) -> float:
+    """This worker's share of a server-wide rate."""
+    return total / serve_worker_count()
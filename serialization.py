@@ -0,0 +1,136 @@
+"""
+Serialization
+
+Fast JSON encoding for API responses and stream events, and compression of
+large JSON responses. orjson is used when it is installed and brotli
+enables ``br`` encoding; without them the standard library's json and gzip
+are used.
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Configuration ---
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "4096"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with ``dumps``.
+
+    Endpoints return it with plain dicts to skip the response model
+    validation of already-normalized items.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, or None."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses large single-body responses.
+
+    Only responses sent in one body message of at least ``min_bytes`` are
+    compressed. Streamed responses pass through untouched, so their events
+    are never held back in a compressor's buffer.
+    """
+
+    def __init__(self, app, min_bytes: int = RESPONSE_COMPRESSION_MIN_BYTES, enabled: bool = RESPONSE_COMPRESSION):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def compressing_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+            initial, start_message = start_message, None
+            headers = MutableHeaders(scope=initial)
+            body = message.get("body", b"")
+            if (message["type"] == "http.response.body" and not message.get("more_body", False)
+                    and len(body) >= self.min_bytes and "content-encoding" not in headers):
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {"type": "http.response.body", "body": body}
+            await send(initial)
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
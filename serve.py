@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Serve
+
+Production launcher for the StudyWithAI API. The parent process binds the
+listening socket and pre-forks SERVE_WORKERS uvicorn workers that share it.
+Each worker imports the API, builds its agents and runners, runs a stubbed
+warm-up generation and then reports its cold-start time and memory use to
+the parent, which logs a boot report once every worker is up. Crashed
+workers are replaced.
+
+With more than one worker, jobs and uploaded documents are kept in SQLite
+files shared by the workers, since a follow-up request may reach any of
+them. Server-wide PDF extraction and model call limits are split between
+the workers.
+
+On SIGTERM or SIGINT the parent forwards SIGTERM to every worker. A worker
+then reports not ready on /ready, stops accepting connections, lets open
+requests finish and drains running jobs, for up to SHUTDOWN_DRAIN_TIMEOUT
+seconds.
+
+    python serve.py --workers 4 --port 8000
+
+Requires a platform with os.fork (Linux or macOS). Use run_api.py for local
+development with auto-reload.
+"""
+
+import argparse
+import json
+import logging
+import os
+import select
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import psutil
+import uvicorn
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent / ".env"
+if env_path.exists():
+    load_dotenv(env_path)
+
+from lifecycle import SHUTDOWN_DRAIN_TIMEOUT
+from resources import available_cpus
+from structured_logging import setup_logging, stop_logging
+
+logger = logging.getLogger("studywithai.serve")
+
+# --- Configuration ---
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("API_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))  # 0 = one per available CPU
+# Extra time after the drain timeout before workers are killed
+KILL_GRACE_SECONDS = 5
+# State that must be shared between workers, and the backend that shares it
+SHARED_BACKENDS = {"JOB_QUEUE_BACKEND": "sqlite", "DOCUMENT_BACKEND": "sqlite"}
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server for one pre-forked worker.
+
+    Reports to the parent over ``report_fd`` once the app has started, and
+    marks the worker as draining as soon as it is asked to exit.
+    """
+
+    def __init__(self, config: uvicorn.Config, report_fd: int, forked_at: float):
+        super().__init__(config)
+        self.report_fd = report_fd
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.should_exit:
+            return
+        process = psutil.Process()
+        memory = process.memory_full_info()
+        api = sys.modules.get("api")
+        report = {
+            "pid": os.getpid(),
+            "cold_start_seconds": round(time.monotonic() - self.forked_at, 3),
+            "warmup_seconds": api.lifecycle.warmup_seconds if api else None,
+            "rss_bytes": memory.rss,
+            "uss_bytes": getattr(memory, "uss", None),
+        }
+        os.write(self.report_fd, (json.dumps(report) + "\n").encode())
+
+    def handle_exit(self, sig, frame):
+        api = sys.modules.get("api")
+        if api is not None:
+            api.lifecycle.start_draining()
+        super().handle_exit(sig, frame)
+
+
+def run_worker(config: uvicorn.Config, sock, report_fd: int):
+    """Body of a forked worker process; never returns."""
+    forked_at = time.monotonic()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        WorkerServer(config, report_fd, forked_at).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker %d crashed", os.getpid())
+        code = 1
+    finally:
+        stop_logging()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+class Supervisor:
+    """Pre-forks the workers, collects their boot reports and replaces crashed ones."""
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.num_workers = workers
+        self.sock = config.bind_socket()
+        self.report_read, self.report_write = os.pipe()
+        self.workers: Dict[int, Optional[dict]] = {}  # pid -> boot report
+        self.boot_started = time.monotonic()
+        self.booted = False
+        self.stopping = False
+        self._buffer = b""
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            os.close(self.report_read)
+            run_worker(self.config, self.sock, self.report_write)
+        self.workers[pid] = None
+        logger.info("Started worker %d", pid)
+
+    def _on_signal(self, sig, frame):
+        if not self.stopping:
+            logger.info("Received %s, draining %d workers", signal.Signals(sig).name, len(self.workers))
+        self.stopping = True
+
+    def _read_reports(self):
+        self._buffer += os.read(self.report_read, 65536)
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            report = json.loads(line)
+            if report["pid"] in self.workers:
+                self.workers[report["pid"]] = report
+                logger.info(
+                    "Worker %d ready in %.2fs (warm-up %ss, RSS %.1f MB)",
+                    report["pid"], report["cold_start_seconds"], report["warmup_seconds"], report["rss_bytes"] / 2**20,
+                )
+        if not self.booted and self.workers and all(self.workers.values()):
+            self.booted = True
+            self.log_boot_report()
+
+    def log_boot_report(self):
+        reports = list(self.workers.values())
+        boot = {
+            "workers": len(reports),
+            "boot_seconds": round(time.monotonic() - self.boot_started, 3),
+            "cold_start_seconds": {
+                "max": max(r["cold_start_seconds"] for r in reports),
+                "mean": round(sum(r["cold_start_seconds"] for r in reports) / len(reports), 3),
+            },
+            "rss_mb_per_worker": round(sum(r["rss_bytes"] for r in reports) / len(reports) / 2**20, 1),
+            "uss_mb_per_worker": round(sum(r["uss_bytes"] or 0 for r in reports) / len(reports) / 2**20, 1),
+            "per_worker": reports,
+        }
+        logger.info("Boot report: %s", json.dumps(boot))
+
+    def _reap(self) -> bool:
+        """Collect exited workers. Returns False if the server should stop (a worker failed during boot)."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return True
+            if pid == 0:
+                return True
+            if pid not in self.workers:
+                continue
+            report = self.workers.pop(pid)
+            if self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if report is None and not self.booted:
+                logger.error("Worker %d exited with code %d before it was ready", pid, code)
+                return False
+            logger.warning("Worker %d exited with code %d, starting a replacement", pid, code)
+            self.spawn()
+        return True
+
+    def run(self) -> int:
+        for _ in range(self.num_workers):
+            self.spawn()
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        logger.info("Serving on http://%s:%d with %d workers", self.config.host, self.config.port, self.num_workers)
+
+        code = 0
+        while not self.stopping:
+            readable, _, _ = select.select([self.report_read], [], [], 0.5)
+            if readable:
+                self._read_reports()
+            if not self._reap():
+                self.stopping = True
+                code = 1
+        self.shutdown()
+        return code
+
+    def shutdown(self):
+        """Forward SIGTERM to the workers and wait for them to drain."""
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT + KILL_GRACE_SECONDS
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning("Worker %d did not drain in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+        logger.info("All workers stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the StudyWithAI API with pre-forked workers")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes (0 = one per available CPU)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_level)
+    if not hasattr(os, "fork"):
+        parser.error("serve.py needs os.fork; use run_api.py on this platform")
+    workers = args.workers or available_cpus()
+    # Workers import the API after the fork and split server-wide limits by this count
+    os.environ["SERVE_WORKER_COUNT"] = str(workers)
+    if workers > 1:
+        # Jobs and documents are looked up by id on whichever worker a request lands
+        for name, backend in SHARED_BACKENDS.items():
+            configured = os.getenv(name, "").lower()
+            if not configured:
+                os.environ[name] = backend
+                logger.info("Using %s=%s so %d workers share it", name, backend, workers)
+            elif configured != backend:
+                parser.error(f"{name}={configured} is per process; run {workers} workers with {name}={backend} or use --workers 1")
+        # Imported only now: forked workers inherit the module with the backends set above
+        from jobs import requeue_interrupted_jobs
+        requeue_interrupted_jobs()
+
+    config = uvicorn.Config(
+        "api:app",
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level,
+        # uvicorn's own and access records propagate to the structured log queue
+        log_config=None,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_TIMEOUT,
+    )
+    sys.exit(Supervisor(config, workers).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Sessions
+
+A bounded session service for the ADK Runner. It wraps another session
+service (in-memory or SQLite-backed) and evicts sessions by age, count and
+approximate size so that one-shot API sessions cannot accumulate until the
+process runs out of memory.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListEventsResponse, ListSessionsResponse
+
+logger = logging.getLogger("studywithai.sessions")
+
+# --- Configuration ---
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "sqlite:///.cache/sessions.db")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "900"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_DROP_AFTER_RESPONSE = os.getenv("SESSION_DROP_AFTER_RESPONSE", "true").lower() == "true"
+
+# Rough fixed cost of a session and of an event beyond their text
+_SESSION_OVERHEAD_BYTES = 1024
+_EVENT_OVERHEAD_BYTES = 512
+
+SessionKey = Tuple[str, str, str]
+
+
+def estimate_event_bytes(event: Event) -> int:
+    """Approximate the memory held by an event from the size of its text parts."""
+    size = _EVENT_OVERHEAD_BYTES
+    if event.content and event.content.parts:
+        for part in event.content.parts:
+            if part.text:
+                size += len(part.text)
+    return size
+
+
+class BoundedSessionService(BaseSessionService):
+    """Session service wrapper with TTL, max-entry and max-byte eviction.
+
+    Only sessions created through this wrapper are tracked. Sessions are
+    evicted least recently used first by deleting them from the wrapped
+    service.
+    """
+
+    def __init__(
+        self,
+        inner: BaseSessionService,
+        ttl: int = SESSION_TTL,
+        max_entries: int = SESSION_MAX_ENTRIES,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.inner = inner
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        # key -> [last_access, approximate bytes], oldest first
+        self._entries: "OrderedDict[SessionKey, list]" = OrderedDict()
+
+    def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        self._enforce_limits()
+        session = self.inner.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        with self._lock:
+            size = _SESSION_OVERHEAD_BYTES + len(str(state or {}))
+            self._entries[(app_name, user_id, session.id)] = [time.monotonic(), size]
+            self.current_bytes += size
+        return session
+
+    def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and time.monotonic() - entry[0] > self.ttl
+        if expired:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        session = self.inner.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch(key)
+        return session
+
+    def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        return self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._drop((app_name, user_id, session_id))
+
+    def list_events(self, *, app_name: str, user_id: str, session_id: str) -> ListEventsResponse:
+        return self.inner.list_events(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    def close_session(self, *, session: Session):
+        self.inner.close_session(session=session)
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        event = self.inner.append_event(session, event)
+        if not event.partial:
+            key = (session.app_name, session.user_id, session.id)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    size = estimate_event_bytes(event)
+                    entry[0] = time.monotonic()
+                    entry[1] += size
+                    self.current_bytes += size
+                    self._entries.move_to_end(key)
+        return event
+
+    def _touch(self, key: SessionKey):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] = time.monotonic()
+                self._entries.move_to_end(key)
+
+    def _drop(self, key: SessionKey):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+        app_name, user_id, session_id = key
+        try:
+            self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        except Exception as e:
+            logger.warning("Failed to delete session %s: %s", session_id, e)
+
+    def _enforce_limits(self):
+        """Drop expired sessions, then the least recently used ones beyond the limits."""
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for key, (last_access, _) in self._entries.items():
+                if now - last_access <= self.ttl:
+                    break
+                victims.append((key, True))
+            remaining = len(self._entries) - len(victims)
+            remaining_bytes = self.current_bytes - sum(self._entries[key][1] for key, _ in victims)
+            for key, entry in itertools.islice(self._entries.items(), len(victims), None):
+                # Leave room for the session about to be created
+                if remaining < self.max_entries and remaining_bytes <= self.max_bytes:
+                    break
+                victims.append((key, False))
+                remaining -= 1
+                remaining_bytes -= entry[1]
+        # Drop outside the lock: the wrapped service may do I/O
+        for key, expired in victims:
+            self._drop(key)
+            if expired:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Return live session gauges and eviction counters."""
+        return {
+            "backend": SESSION_BACKEND,
+            "live_sessions": len(self._entries),
+            "approx_bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "drop_after_response": SESSION_DROP_AFTER_RESPONSE,
+        }
+
+
+def create_session_service() -> BoundedSessionService:
+    """Build the bounded session service from environment configuration."""
+    if SESSION_BACKEND == "memory":
+        inner = InMemorySessionService()
+    elif SESSION_BACKEND == "sqlite":
+        from google.adk.sessions import DatabaseSessionService
+        if SESSION_DB_URL.startswith("sqlite:///"):
+            Path(SESSION_DB_URL[len("sqlite:///"):]).parent.mkdir(parents=True, exist_ok=True)
+        inner = DatabaseSessionService(db_url=SESSION_DB_URL)
+    else:
+        raise ValueError(f"Unknown session backend: {SESSION_BACKEND}")
+    logger.info(
+        "Initialized %s with TTL %ds, max %d sessions / %d bytes",
+        type(inner).__name__, SESSION_TTL, SESSION_MAX_ENTRIES, SESSION_MAX_BYTES,
+    )
+    return BoundedSessionService(inner)
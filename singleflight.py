@@ -0,0 +1,62 @@
+"""
+Single Flight
+
+Coalesces identical concurrent calls so that only one of them does the work
+and every caller receives the same result.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger("studywithai.singleflight")
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key into one shared task.
+
+    The shared work runs in its own task and every caller awaits it through
+    ``asyncio.shield``, so a caller that is cancelled (for example because its
+    client disconnected) stops waiting without cancelling the work for the
+    others.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``func`` once per key at a time.
+
+        Returns the result and whether it was shared with an earlier caller.
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info("Joined in-flight generation %s", key[:32])
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved in case every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """Return coalescing counters."""
+        return {
+            "in_flight": len(self._tasks),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,252 @@
+"""
+Structured Logging
+
+Non-blocking log output for the API. Records are put on a bounded queue by
+the calling code and formatted and written by a background thread, so a
+slow or blocked stderr never stalls a request. Records are written as one
+JSON object per line (or as plain text with LOG_FORMAT=text). Each record
+carries the id of the request it was logged in. The id is taken from the
+``X-Request-ID`` header or generated, and is returned in the response.
+
+Payload logs (raw model output and similar) are DEBUG records that are
+only emitted for a sampled fraction of calls, so content stays out of the
+logs by default.
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from typing import Optional
+
+from serialization import dumps
+
+# --- Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Longest client-supplied request id that is accepted as is
+MAX_REQUEST_ID_LENGTH = 128
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+# (uvicorn's ANSI-colored copy of its messages is left out too)
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "color_message"}
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    """Set the request id of the current context; reset it with the returned token."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+
+def payload_sampled(logger: logging.Logger) -> bool:
+    """Whether to log the payload of this call, at DEBUG, on ``logger``."""
+    return (
+        LOG_PAYLOAD_SAMPLE_RATE > 0
+        and logger.isEnabledFor(logging.DEBUG)
+        and random.random() < LOG_PAYLOAD_SAMPLE_RATE
+    )
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id of the context they are logged in."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed through ``extra``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        try:
+            return dumps(entry).decode()
+        except (TypeError, ValueError):
+            return dumps({key: value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+                          for key, value in entry.items()}).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.request_id = getattr(record, "request_id", None) or "-"
+        return super().format(record)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks: records are dropped and counted when the queue is full.
+
+    Only the message and traceback are rendered in the calling thread; all
+    other formatting happens in the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """The queue handler installed on the root logger and the background listener that drains it."""
+
+    def __init__(self, output: logging.Handler, queue_size: int = LOG_QUEUE_SIZE):
+        self.output = output
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(RequestIdFilter())
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output, respect_handler_level=True)
+
+    def stats(self) -> dict:
+        return {
+            "format": LOG_FORMAT,
+            "level": LOG_LEVEL,
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "payload_sample_rate": LOG_PAYLOAD_SAMPLE_RATE,
+        }
+
+
+_pipeline: Optional[LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None) -> LogPipeline:
+    """Route the root logger through the background queue (once per process).
+
+    ``level`` overrides LOG_LEVEL for the root logger.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        pipeline = LogPipeline(output)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(pipeline.handler)
+        root.setLevel((level or LOG_LEVEL).upper())
+        pipeline.listener.start()
+        atexit.register(stop_logging)
+        _pipeline = pipeline
+        return pipeline
+
+
+def stop_logging():
+    """Flush queued records and write any later ones synchronously.
+
+    Called at process exit, and by pre-forked workers before they exit
+    without running ``atexit`` handlers.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        pipeline, _pipeline = _pipeline, None
+    if pipeline is None:
+        return
+    pipeline.listener.stop()
+    root = logging.getLogger()
+    root.removeHandler(pipeline.handler)
+    pipeline.output.addFilter(RequestIdFilter())
+    root.addHandler(pipeline.output)
+
+
+def _reset_after_fork():
+    # The listener thread does not survive a fork: give the child its own pipeline
+    global _pipeline, _pipeline_lock
+    _pipeline_lock = threading.Lock()
+    if _pipeline is not None:
+        level = logging.getLevelName(logging.getLogger().level)
+        logging.getLogger().removeHandler(_pipeline.handler)
+        _pipeline = None
+        setup_logging(level)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware that gives each request an id for its log records.
+
+    A client-supplied ``X-Request-ID`` is kept when it is reasonably short;
+    otherwise a new id is generated. The id is echoed in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                if 0 < len(value) <= MAX_REQUEST_ID_LENGTH:
+                    request_id = value.decode("latin-1")
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        token = set_request_id(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            reset_request_id(token)
@@ -1,37 +1,43 @@
 from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from typing import List, Tuple, Union
 import importlib.util
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Default model of the root agent and both sub-agents
+GEMINI_MODEL = "gemini-2.5-flash"
+
 # Configure Google AI API key
 google_api_key = os.getenv("GOOGLE_API_KEY")
 if google_api_key:
     os.environ["GOOGLE_API_KEY"] = google_api_key
 
+def load_module(name, path):
+    """Execute a module from its file once per process, registering it in sys.modules."""
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
 # Load flashcard agent
-flashcard_agent_path = Path(__file__).parent / "sub_agents" / "flashcard_agent" / "agent.py"
-flashcard_spec = importlib.util.spec_from_file_location("flashcard_agent_module", flashcard_agent_path)
-flashcard_module = importlib.util.module_from_spec(flashcard_spec)
-flashcard_spec.loader.exec_module(flashcard_module)
+flashcard_module = load_module("flashcard_agent_module", Path(__file__).parent / "sub_agents" / "flashcard_agent" / "agent.py")
 flashcard_agent = flashcard_module.flashcard_agent
 
 # Load quiz agent
-quiz_agent_path = Path(__file__).parent / "sub_agents" / "quiz_agent" / "agent.py"
-quiz_spec = importlib.util.spec_from_file_location("quiz_agent_module", quiz_agent_path)
-quiz_module = importlib.util.module_from_spec(quiz_spec)
-quiz_spec.loader.exec_module(quiz_module)
+quiz_module = load_module("quiz_agent_module", Path(__file__).parent / "sub_agents" / "quiz_agent" / "agent.py")
 quiz_agent = quiz_module.quiz_agent
 
-# Create the root StudyWithAI agent
-root_agent = Agent(
-    name="studywithai_agent",
-    model="gemini-2.5-flash",
-    description="StudyWithAI agent that helps create flashcards and quizzes from text content or PDF files",
-    instruction="""
+# Instructions of the root agent, whatever its model
+ROOT_INSTRUCTION = """
     You are StudyWithAI, an intelligent educational assistant that helps students create effective study materials.
     Your role is to analyze content provided by users and create appropriate study materials based on their needs.
 
@@ -77,6 +83,27 @@ root_agent = Agent(
     **CRITICAL: Always return valid JSON only. Do not include any explanatory text outside the JSON structure. Pass the educational content directly to the sub-agents without modification.**
 
     Always be helpful, educational, and focused on creating high-quality study materials that enhance learning.
-    """,
-    sub_agents=[flashcard_agent, quiz_agent],
-)
\ No newline at end of file
+    """
+
+def create_root_agent(model: Union[str, BaseLlm], sub_agents: List[Agent]) -> Agent:
+    """Create a root agent backed by ``model`` that delegates to ``sub_agents``."""
+    return Agent(
+        name="studywithai_agent",
+        model=model,
+        description="StudyWithAI agent that helps create flashcards and quizzes from text content or PDF files",
+        instruction=ROOT_INSTRUCTION,
+        sub_agents=sub_agents,
+    )
+
+def create_agents(model: Union[str, BaseLlm]) -> Tuple[Agent, Agent, Agent]:
+    """Create a separate root, flashcard and quiz agent tree backed by ``model``.
+
+    An agent can only belong to one tree, so every model tier gets its own.
+    Returns the root, flashcard and quiz agents.
+    """
+    flashcards = flashcard_module.create_flashcard_agent(model)
+    quiz = quiz_module.create_quiz_agent(model)
+    return create_root_agent(model, [flashcards, quiz]), flashcards, quiz
+
+# Create the root StudyWithAI agent
+root_agent = create_root_agent(GEMINI_MODEL, [flashcard_agent, quiz_agent])
@@ -5,17 +5,16 @@ This agent is responsible for creating flashcards from provided content.
 It focuses on extracting key terms, definitions, concepts, and important facts.
 """
 
+from typing import Union
+
 from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
 
 # --- Constants ---
 GEMINI_MODEL = "gemini-2.5-flash"
 
-# Create the flashcard agent
-flashcard_agent = Agent(
-    name="flashcard_agent",
-    model=GEMINI_MODEL,
-    description="Creates comprehensive flashcard sets from educational content",
-    instruction="""
+# Instructions shared by every flashcard agent, whatever its model
+FLASHCARD_INSTRUCTION = """
     You are a Flashcard Creation Specialist. Your role is to analyze educational content and create effective flashcards for study and memorization.
 
     **CRITICAL: You must ALWAYS return your response as valid JSON in the following format:**
@@ -73,5 +72,18 @@ flashcard_agent = Agent(
        - Create 8-15 flashcards depending on content length and complexity
 
     **REMEMBER: Your response must be valid JSON only. Do not include any explanatory text outside the JSON structure.**
-    """,
-)
\ No newline at end of file
+    """
+
+
+def create_flashcard_agent(model: Union[str, BaseLlm] = GEMINI_MODEL) -> Agent:
+    """Create a flashcard agent backed by ``model``, a model name or a model instance."""
+    return Agent(
+        name="flashcard_agent",
+        model=model,
+        description="Creates comprehensive flashcard sets from educational content",
+        instruction=FLASHCARD_INSTRUCTION,
+    )
+
+
+# Create the flashcard agent
+flashcard_agent = create_flashcard_agent()
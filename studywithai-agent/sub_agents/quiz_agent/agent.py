@@ -5,17 +5,16 @@ This agent is responsible for creating various types of quiz questions from prov
 It focuses on testing comprehension, application, and knowledge retention.
 """
 
+from typing import Union
+
 from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
 
 # --- Constants ---
 GEMINI_MODEL = "gemini-2.5-flash"
 
-# Create the quiz agent
-quiz_agent = Agent(
-    name="quiz_agent",
-    model=GEMINI_MODEL,
-    description="Generates comprehensive quizzes and assessments from educational content",
-    instruction="""
+# Instructions shared by every quiz agent, whatever its model
+QUIZ_INSTRUCTION = """
     You are a Quiz Creation Specialist. Your role is to analyze educational content and create effective quiz questions that test understanding, comprehension, and application of knowledge.
 
     **CRITICAL: You must ALWAYS return your response as valid JSON in the following format:**
@@ -89,5 +88,18 @@ quiz_agent = Agent(
     - Balance different cognitive levels (remember, understand, apply, analyze)
 
     **REMEMBER: Your response must be valid JSON only. Do not include any explanatory text outside the JSON structure.**
-    """,
-)
\ No newline at end of file
+    """
+
+
+def create_quiz_agent(model: Union[str, BaseLlm] = GEMINI_MODEL) -> Agent:
+    """Create a quiz agent backed by ``model``, a model name or a model instance."""
+    return Agent(
+        name="quiz_agent",
+        model=model,
+        description="Generates comprehensive quizzes and assessments from educational content",
+        instruction=QUIZ_INSTRUCTION,
+    )
+
+
+# Create the quiz agent
+quiz_agent = create_quiz_agent()
@@ -0,0 +1,16 @@
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The API module reads these at import time
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("API_SECRET_KEY", "test-secret")
+# Three model tiers for the tiering tests; their agents get fake models
+os.environ.setdefault("MODEL_TIERS", json.dumps([
+    {"name": "fast", "model": "gemini-2.5-flash-lite", "max_chars": 2000, "max_items": 10, "timeout": 0.5},
+    {"name": "standard", "model": "gemini-2.5-flash", "max_chars": 20000, "timeout": 0.5},
+    {"name": "large", "model": "gemini-2.5-pro", "timeout": 0.5},
+]))
@@ -0,0 +1,39 @@
+from dedup import NearDuplicateIndex, dedup_items
+
+
+def test_paraphrased_fronts_are_duplicates():
+    index = NearDuplicateIndex()
+    assert index.add("What is photosynthesis?")
+    assert not index.add("Define photosynthesis")
+    assert index.duplicates == 1
+
+
+def test_negated_stems_are_not_duplicates():
+    pairs = [
+        ("Which statement about mitosis is correct?", "Which statement about mitosis is incorrect?"),
+        ("Which of the following is true of enzymes in the stomach?", "Which of the following is false of enzymes in the stomach?"),
+        ("Which factor most likely increases the rate of diffusion across a membrane?",
+         "Which factor least likely increases the rate of diffusion across a membrane?"),
+        ("Which organelle produces ATP in animal cells?", "Which organelle does not produce ATP in animal cells?"),
+    ]
+    for positive, negative in pairs:
+        index = NearDuplicateIndex()
+        assert index.add(positive)
+        assert index.add(negative), negative
+
+
+def test_negated_paraphrases_are_duplicates():
+    index = NearDuplicateIndex()
+    assert index.add("Which statement about mitosis is incorrect?")
+    assert not index.add("Which of the following statements about mitosis is incorrect?")
+
+
+def test_dedup_items_keeps_first_occurrence():
+    items = [
+        {"question": "What is osmosis?"},
+        {"question": "Define osmosis."},
+        {"question": "What is diffusion?"},
+    ]
+    kept, index = dedup_items(items, "quiz")
+    assert [item["question"] for item in kept] == ["What is osmosis?", "What is diffusion?"]
+    assert index.duplicates == 1
@@ -0,0 +1,42 @@
+from documents import Document, SQLiteDocumentStore
+
+
+def make_document(body: str = "Content from a.pdf:\nCells divide.") -> Document:
+    return Document(["a.pdf"], body, None, {"extraction": {}})
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    first, second = SQLiteDocumentStore(path), SQLiteDocumentStore(path)
+    document = make_document()
+    assert first.add(document)
+
+    found = second.get(document.id)
+    assert found is not None
+    assert (found.files, found.body, found.metadata) == (document.files, document.body, document.metadata)
+    assert found.uses == 1
+    assert first.peek(document.id).uses == 1
+
+    assert second.delete(document.id)
+    assert first.get(document.id) is None
+
+
+def test_sqlite_store_evicts_least_recently_used(tmp_path):
+    store = SQLiteDocumentStore(str(tmp_path / "documents.sqlite"), max_entries=2)
+    documents = [make_document(f"body {i}") for i in range(3)]
+    for document in documents[:2]:
+        assert store.add(document)
+    store.get(documents[0].id)
+    assert store.add(documents[2])
+    assert store.peek(documents[1].id) is None
+    assert store.peek(documents[0].id) is not None
+    assert store.evictions == 1
+    assert len(store) == 2
+
+
+def test_sqlite_store_expires_idle_documents(tmp_path):
+    store = SQLiteDocumentStore(str(tmp_path / "documents.sqlite"), ttl=0)
+    document = make_document()
+    assert store.add(document)
+    assert store.get(document.id) is None
+    assert store.stats()["worker"]["expirations"] == 1
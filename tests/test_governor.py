@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from benchmarks.fake_gemini import FLASHCARDS, FakeGemini
+from governor import AdaptiveRateLimiter, ModelCallGovernor, ModelRateLimited, error_status
+
+
+def make_governor(**kwargs) -> ModelCallGovernor:
+    kwargs.setdefault("limiter", AdaptiveRateLimiter(rate=1000, burst=1000, min_rate=1))
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.001)
+    return ModelCallGovernor(**kwargs)
+
+
+def fake_call(model: FakeGemini, tracker: dict = None):
+    """A governor ``run`` function that makes one call on ``model`` and returns its text."""
+    request = LlmRequest(contents=[types.Content(role="user", parts=[types.Part(text="Generate 2 flashcards")])])
+
+    async def run(suffix: str) -> str:
+        if tracker is not None:
+            tracker["running"] += 1
+            tracker["peak"] = max(tracker["peak"], tracker["running"])
+        try:
+            text = ""
+            async for response in model.generate_content_async(request):
+                text = response.content.parts[0].text
+            return text
+        except asyncio.CancelledError:
+            if tracker is not None:
+                tracker["cancelled"].append(suffix)
+            raise
+        finally:
+            if tracker is not None:
+                tracker["running"] -= 1
+
+    return run
+
+
+def new_tracker() -> dict:
+    return {"running": 0, "peak": 0, "cancelled": []}
+
+
+def test_concurrency_cap():
+    governor = make_governor(max_concurrency=2, max_per_key=2)
+    tracker = new_tracker()
+    run = fake_call(FakeGemini(model="fake-flashcards", role=FLASHCARDS, latency=0.05), tracker)
+
+    async def main():
+        return await asyncio.gather(*[governor.call(run) for _ in range(6)])
+
+    results = asyncio.run(main())
+    assert len(results) == 6 and all("flashcards" in text for text in results)
+    assert tracker["peak"] == 2
+    assert governor.stats()["calls"] == 6
+
+
+def test_per_key_cap_and_idle_keys_dropped():
+    governor = make_governor(max_concurrency=4, callers=2)
+    assert governor.max_per_key == 2
+    tracker = new_tracker()
+    run = fake_call(FakeGemini(model="fake-flashcards", role=FLASHCARDS, latency=0.05), tracker)
+
+    async def main():
+        await asyncio.gather(*[governor.call(run, key="busy") for _ in range(6)])
+        peak = tracker["peak"]
+        await asyncio.gather(*[governor.call(run, key=f"key-{i}") for i in range(6)])
+        return peak
+
+    assert asyncio.run(main()) == 2
+    assert tracker["peak"] == 4
+    assert governor._per_key == {} and not governor._key_users
+
+
+def test_rate_halves_on_quota_error():
+    limiter = AdaptiveRateLimiter(rate=10, burst=10, min_rate=1)
+    governor = make_governor(limiter=limiter, max_retries=0)
+    run = fake_call(FakeGemini(model="fake-flashcards", role=FLASHCARDS, latency=0.01, error_rate=1.0))
+
+    with pytest.raises(ModelRateLimited):
+        asyncio.run(governor.call(run))
+    assert limiter.rate == 5
+    assert limiter.decreases == 1
+    assert governor.counters["throttled"] == 1
+
+
+def test_retry_exhaustion_raises_rate_limited():
+    governor = make_governor(max_retries=2)
+    tracker = new_tracker()
+    calls = []
+    model_run = fake_call(FakeGemini(model="fake-flashcards", role=FLASHCARDS, latency=0.01, error_rate=1.0), tracker)
+
+    async def run(suffix: str) -> str:
+        calls.append(suffix)
+        return await model_run(suffix)
+
+    with pytest.raises(ModelRateLimited) as excinfo:
+        asyncio.run(governor.call(run))
+    assert excinfo.value.retry_after >= 1
+    assert calls == ["", "-retry1", "-retry2"]
+    assert governor.counters["retries"] == 2
+    assert governor.counters["failures"] == 1
+
+
+def test_non_retryable_error_is_raised_unchanged():
+    governor = make_governor(max_retries=3)
+
+    async def run(suffix: str) -> str:
+        raise ValueError("output ran past 500 tokens")
+
+    with pytest.raises(ValueError):
+        asyncio.run(governor.call(run))
+    assert governor.counters["retries"] == 0
+
+
+def test_hedge_cancels_the_slower_call():
+    governor = make_governor(hedge=True)
+    for _ in range(20):
+        governor.record_success(0.01)
+    tracker = new_tracker()
+    slow = fake_call(FakeGemini(model="fake-slow", role=FLASHCARDS, latency=5), tracker)
+    fast = fake_call(FakeGemini(model="fake-fast", role=FLASHCARDS, latency=0.01), tracker)
+
+    async def run(suffix: str) -> str:
+        return await (fast if suffix.endswith("-hedge") else slow)(suffix)
+
+    async def main():
+        result = await asyncio.wait_for(governor.call(run), 2)
+        # Let the cancellation of the losing call run
+        await asyncio.sleep(0)
+        return result
+
+    assert "flashcards" in asyncio.run(main())
+    assert governor.counters["hedges"] == 1
+    assert governor.counters["hedge_wins"] == 1
+    assert tracker["cancelled"] == [""]
+    assert tracker["running"] == 0
+
+
+def test_error_status_ignores_numbers_in_messages():
+    assert error_status(RuntimeError("503 UNAVAILABLE. The model is overloaded")) == 503
+    assert error_status(RuntimeError("Chapter 429 has 500 words")) is None
@@ -0,0 +1,41 @@
+import resources
+
+
+def test_cgroup_v2_quota_is_rounded_up(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("150000 100000\n")
+    monkeypatch.setattr(resources, "_CGROUP_V2_CPU_MAX", str(cpu_max))
+    assert resources.cgroup_cpu_limit() == 2
+
+
+def test_cgroup_v2_without_quota(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("max 100000\n")
+    monkeypatch.setattr(resources, "_CGROUP_V2_CPU_MAX", str(cpu_max))
+    assert resources.cgroup_cpu_limit() is None
+
+
+def test_cgroup_v1_quota(tmp_path, monkeypatch):
+    (tmp_path / "quota").write_text("300000\n")
+    (tmp_path / "period").write_text("100000\n")
+    monkeypatch.setattr(resources, "_CGROUP_V2_CPU_MAX", str(tmp_path / "missing"))
+    monkeypatch.setattr(resources, "_CGROUP_V1_QUOTA", str(tmp_path / "quota"))
+    monkeypatch.setattr(resources, "_CGROUP_V1_PERIOD", str(tmp_path / "period"))
+    assert resources.cgroup_cpu_limit() == 3
+
+
+def test_available_cpus_is_capped_by_quota(monkeypatch):
+    monkeypatch.setattr(resources.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(resources, "cgroup_cpu_limit", lambda: 2)
+    assert resources.available_cpus() == 2
+    monkeypatch.setattr(resources, "cgroup_cpu_limit", lambda: None)
+    assert resources.available_cpus() == 8
+
+
+def test_worker_share_splits_server_limits(monkeypatch):
+    monkeypatch.setenv("SERVE_WORKER_COUNT", "4")
+    assert resources.worker_share(32) == 8
+    assert resources.worker_share(2) == 1
+    assert resources.worker_rate_share(20.0) == 5.0
+    monkeypatch.delenv("SERVE_WORKER_COUNT")
+    assert resources.worker_share(32) == 32
@@ -0,0 +1,100 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import api
+from benchmarks import fake_gemini
+from dispatch import DIRECT
+from governor import AdaptiveRateLimiter, ModelCallGovernor
+from tiering import QUOTA, TIMEOUT, TierRouter, track_tier_usage
+
+FAST_LATENCIES = {"fast": 0.01, "standard": 0.01, "large": 0.01}
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """Fresh governor and router; returns a function that installs fake tier models."""
+    monkeypatch.setattr(api, "model_governor", ModelCallGovernor(
+        limiter=AdaptiveRateLimiter(rate=1000, burst=1000, min_rate=1), max_retries=0,
+    ))
+    monkeypatch.setattr(api, "tier_router", TierRouter(api.model_tiers))
+
+    def install(latencies=None, error_rates=None):
+        fake_gemini.install_fake_tier_models(api.tier_agents, {**FAST_LATENCIES, **(latencies or {})}, error_rates)
+        fake_gemini.MODEL_CALLS.clear()
+
+    return install
+
+
+def generate(content: str, num_items: int = 5):
+    """Generate flashcards and return the response and the tiers that served it."""
+    async def main():
+        usage = track_tier_usage()
+        response = await api.generate_study_materials(content, "flashcards", uuid.uuid4().hex, num_items, DIRECT)
+        return response, dict(usage)
+
+    return asyncio.run(main())
+
+
+def test_tiers_are_selected_by_size(tiers):
+    tiers()
+    assert generate("x" * 500)[1] == {"fast": 1}
+    assert generate("x" * 500, num_items=20)[1] == {"standard": 1}
+    assert generate("x" * 5000)[1] == {"standard": 1}
+    assert generate("x" * 30000)[1] == {"large": 1}
+    assert fake_gemini.MODEL_CALLS == {
+        "fake-fast-flashcards": 1, "fake-standard-flashcards": 2, "fake-large-flashcards": 1,
+    }
+
+
+def test_quota_error_falls_back_to_faster_tier(tiers):
+    tiers(error_rates={"large": 1.0})
+    response, usage = generate("x" * 30000)
+    assert "flashcards" in response
+    assert usage == {"standard": 1}
+    assert api.tier_router.fallbacks == {("large", "standard", QUOTA): 1}
+    # The exhausted tier is skipped for new calls during its cooldown
+    assert generate("x" * 30000)[1] == {"standard": 1}
+
+
+def test_timeout_falls_back_to_faster_tier(tiers):
+    tiers(latencies={"large": 2.0})
+    response, usage = generate("x" * 30000)
+    assert "flashcards" in response
+    assert usage == {"standard": 1}
+    assert api.tier_router.fallbacks == {("large", "standard", TIMEOUT): 1}
+
+
+def test_timeout_does_not_count_queue_time(tiers, monkeypatch):
+    tiers(latencies={"standard": 0.3})
+    monkeypatch.setattr(api, "model_governor", ModelCallGovernor(
+        max_concurrency=1, max_per_key=1, limiter=AdaptiveRateLimiter(rate=1000, burst=1000, min_rate=1),
+    ))
+
+    async def main():
+        # The second call waits 0.3s for the slot, then runs 0.3s: within the 0.5s per-attempt timeout
+        return await asyncio.gather(*[
+            api.generate_study_materials("x" * 5000, "flashcards", uuid.uuid4().hex, 5, DIRECT) for _ in range(2)
+        ])
+
+    assert len(asyncio.run(main())) == 2
+    assert not api.tier_router.fallbacks
+    assert fake_gemini.MODEL_CALLS == {"fake-standard-flashcards": 2}
+
+
+def test_quota_error_without_fallback_returns_429(tiers):
+    tiers(error_rates={"fast": 1.0})
+    with pytest.raises(HTTPException) as excinfo:
+        generate("x" * 500)
+    assert excinfo.value.status_code == 429
+    assert "Retry-After" in excinfo.value.headers
+    assert not api.tier_router.fallbacks
+
+
+def test_timeout_without_fallback_returns_504(tiers):
+    tiers(latencies={"fast": 2.0})
+    with pytest.raises(HTTPException) as excinfo:
+        generate("x" * 500)
+    assert excinfo.value.status_code == 504
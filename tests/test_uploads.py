@@ -0,0 +1,98 @@
+import asyncio
+import os
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from uploads import UPLOAD_CHUNK_BYTES, RequestSizeLimitMiddleware, UploadTooLarge, spool_upload
+
+BOUNDARY = b"test-boundary"
+
+
+def multipart_body(filename: str, size: int) -> bytes:
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="prompt"\r\n\r\nhello\r\n'
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="files"; filename="' + filename.encode() + b'"\r\n'
+        b"Content-Type: application/pdf\r\n\r\n" + b"x" * size + b"\r\n"
+        b"--" + BOUNDARY + b"--\r\n"
+    )
+
+
+def send_chunked(middleware, body: bytes, chunk_size: int = 1000):
+    """Stream ``body`` through the middleware; returns the status, response body and bytes the app read."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    read = []
+    sent = []
+
+    async def receive():
+        chunk = chunks.pop(0)
+        read.append(len(chunk))
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/generate-flashcards",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)],
+    }
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], sent[1]["body"], sum(read)
+
+
+async def read_body_app(scope, receive, send):
+    more = True
+    while more:
+        message = await receive()
+        more = message.get("more_body", False)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_body_over_limit_is_rejected_while_streaming():
+    middleware = RequestSizeLimitMiddleware(read_body_app, max_bytes=5000)
+    body = multipart_body("big.pdf", 50000)
+    status, response, read = send_chunked(middleware, body)
+    assert status == 413
+    assert b"Request body exceeds the limit" in response
+    assert read < 10000 < len(body)
+
+
+def test_body_under_limit_passes():
+    middleware = RequestSizeLimitMiddleware(read_body_app, max_bytes=5000)
+    status, response, read = send_chunked(middleware, multipart_body("small.pdf", 4000))
+    assert (status, response) == (200, b"ok")
+
+
+def make_upload(data: bytes, spool_max_size: int = UPLOAD_CHUNK_BYTES) -> UploadFile:
+    spool = SpooledTemporaryFile(max_size=spool_max_size)
+    spool.write(data)
+    spool.seek(0)
+    return UploadFile(spool, size=len(data), filename="doc.pdf", headers=Headers())
+
+
+def test_small_upload_is_not_copied_to_disk():
+    spooled = asyncio.run(spool_upload(make_upload(b"%PDF small")))
+    assert spooled.source == b"%PDF small"
+    assert spooled.size == 10
+    spooled.close()
+
+
+def test_large_upload_is_copied_to_a_named_file():
+    data = b"%PDF " + os.urandom(UPLOAD_CHUNK_BYTES + 4096)
+    spooled = asyncio.run(spool_upload(make_upload(data)))
+    try:
+        with open(spooled.source, "rb") as f:
+            assert f.read() == data
+    finally:
+        spooled.close()
+    assert not os.path.exists(spooled.source)
+
+
+def test_spool_upload_enforces_file_limit():
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(make_upload(b"x" * 2000), max_bytes=1000))
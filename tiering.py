@@ -0,0 +1,225 @@
+"""
+Tiering
+
+Picks the model tier that serves each generation. Tiers are listed from
+the fastest to the most capable model, and a call goes to the first tier
+whose content size and item count limits fit it. A tier that is over the
+latency SLO (by the p95 of its recent calls) or that recently ran out of
+quota is passed over for a faster one. A call that runs out of quota or
+past its tier's timeout is retried on the next faster tier. The tiers
+used for a request are collected through a context variable so they can
+be reported in its metadata.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Awaitable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger("studywithai.tiering")
+
+# --- Configuration ---
+# JSON list of tiers, fastest first, e.g.
+# [{"name": "fast", "model": "gemini-2.5-flash-lite", "max_chars": 20000, "max_items": 10},
+#  {"name": "standard", "model": "gemini-2.5-flash", "timeout": 60},
+#  {"name": "large", "model": "gemini-2.5-pro"}]
+MODEL_TIERS = os.getenv("MODEL_TIERS", "")
+MODEL_TIER_SLO_SECONDS = float(os.getenv("MODEL_TIER_SLO_SECONDS", "0"))  # 0 = no SLO
+MODEL_TIER_QUOTA_COOLDOWN = float(os.getenv("MODEL_TIER_QUOTA_COOLDOWN", "60"))
+
+# Recent call durations kept per tier, and how many are needed to judge it against the SLO
+LATENCY_WINDOW = 100
+SLO_MIN_SAMPLES = 10
+
+# Reasons a tier was chosen or fallen back to
+SIZE = "size"
+SLO = "slo"
+QUOTA = "quota"
+TIMEOUT = "timeout"
+
+T = TypeVar("T")
+
+_tier_usage: contextvars.ContextVar[Optional[Counter]] = contextvars.ContextVar("tier_usage", default=None)
+
+
+class TierTimeout(Exception):
+    """Raised when one model call attempt runs past its tier's timeout.
+
+    Unlike ``asyncio.TimeoutError`` it is not retried by the governor: the
+    call moves to a faster tier instead.
+    """
+
+    def __init__(self, tier: "ModelTier"):
+        super().__init__(f"Model tier {tier.name} timed out after {tier.timeout}s")
+        self.tier = tier
+
+
+class ModelTier:
+    """A model and the largest requests it is picked for (0 = no limit).
+
+    Call attempts running longer than ``timeout`` seconds (0 = no timeout)
+    are abandoned for a faster tier. Time spent queued in the governor or
+    backing off between retries does not count.
+    """
+
+    def __init__(self, name: str, model: str, max_chars: int = 0, max_items: int = 0, timeout: float = 0):
+        self.name = name
+        self.model = model
+        self.max_chars = max_chars
+        self.max_items = max_items
+        self.timeout = timeout
+
+    async def limit(self, call: Awaitable[T]) -> T:
+        """Await one call attempt, raising TierTimeout if it runs past the tier's timeout."""
+        if not self.timeout:
+            return await call
+        try:
+            return await asyncio.wait_for(call, self.timeout)
+        except asyncio.TimeoutError:
+            raise TierTimeout(self) from None
+
+    def fits(self, chars: int, num_items: int) -> bool:
+        return (not self.max_chars or chars <= self.max_chars) and (not self.max_items or num_items <= self.max_items)
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "max_chars": self.max_chars,
+            "max_items": self.max_items,
+            "timeout": self.timeout,
+        }
+
+
+def parse_tiers(spec: str, default_model: str) -> List[ModelTier]:
+    """Parse the MODEL_TIERS JSON list.
+
+    An empty spec is one "standard" tier on ``default_model``, the agents'
+    GEMINI_MODEL.
+    """
+    if not spec.strip():
+        return [ModelTier("standard", default_model)]
+    try:
+        entries = json.loads(spec)
+        if not isinstance(entries, list) or not entries:
+            raise ValueError("expected a non-empty JSON list")
+        tiers = [
+            ModelTier(
+                str(entry["name"]), str(entry["model"]), int(entry.get("max_chars", 0)),
+                int(entry.get("max_items", 0)), float(entry.get("timeout", 0)),
+            )
+            for entry in entries
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"Invalid MODEL_TIERS: {e}") from e
+    names = [tier.name for tier in tiers]
+    if len(set(names)) != len(names):
+        raise ValueError("Invalid MODEL_TIERS: tier names must be unique")
+    return tiers
+
+
+def track_tier_usage() -> Counter:
+    """Start counting the tiers that serve model calls in the current context (and tasks it starts)."""
+    usage = Counter()
+    _tier_usage.set(usage)
+    return usage
+
+
+def record_tier_use(tier: ModelTier):
+    usage = _tier_usage.get()
+    if usage is not None:
+        usage[tier.name] += 1
+
+
+class TierRouter:
+    """Chooses tiers for model calls and tracks their latency and quota state."""
+
+    def __init__(self, tiers: List[ModelTier], slo: float = MODEL_TIER_SLO_SECONDS,
+                 quota_cooldown: float = MODEL_TIER_QUOTA_COOLDOWN):
+        self.tiers = tiers
+        self.slo = slo
+        self.quota_cooldown = quota_cooldown
+        self._latencies: Dict[str, deque] = {tier.name: deque(maxlen=LATENCY_WINDOW) for tier in tiers}
+        self._cooling_until: Dict[str, float] = {}
+        self.selections = Counter()
+        self.fallbacks = Counter()
+
+    def p95_latency(self, tier: ModelTier) -> Optional[float]:
+        """p95 of the tier's recent call durations in seconds, or None before enough calls."""
+        latencies = self._latencies[tier.name]
+        if len(latencies) < SLO_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def cooling(self, tier: ModelTier) -> bool:
+        return self._cooling_until.get(tier.name, 0) > time.monotonic()
+
+    def over_slo(self, tier: ModelTier) -> bool:
+        if not self.slo:
+            return False
+        p95 = self.p95_latency(tier)
+        return p95 is not None and p95 > self.slo
+
+    def select(self, chars: int, num_items: int) -> Tuple[ModelTier, str]:
+        """Pick the tier for a call on ``chars`` characters of content asking for ``num_items`` items.
+
+        Returns the tier and why it was chosen: it fits the request (size),
+        or the fitting tier was over the SLO (slo) or out of quota (quota).
+        """
+        index = next((i for i, tier in enumerate(self.tiers) if tier.fits(chars, num_items)), len(self.tiers) - 1)
+        reason = SIZE
+        for candidate in reversed(self.tiers[:index + 1]):
+            # Keep the reason the fitting tier was passed over
+            if self.cooling(candidate):
+                reason = QUOTA if reason == SIZE else reason
+            elif self.over_slo(candidate):
+                reason = SLO if reason == SIZE else reason
+            else:
+                self.selections[candidate.name] += 1
+                return candidate, reason
+        # Every tier that could serve the call is degraded: use the one that fits
+        self.selections[self.tiers[index].name] += 1
+        return self.tiers[index], SIZE
+
+    def fallback(self, tier: ModelTier, reason: str) -> Optional[ModelTier]:
+        """Return the next faster tier to retry a call that failed on ``tier`` for ``reason``, or None."""
+        index = self.tiers.index(tier)
+        for candidate in reversed(self.tiers[:index]):
+            if not self.cooling(candidate):
+                self.fallbacks[(tier.name, candidate.name, reason)] += 1
+                logger.warning("Model tier %s failed (%s), falling back to %s", tier.name, reason, candidate.name)
+                return candidate
+        return None
+
+    def observe(self, tier: ModelTier, seconds: float):
+        """Record the duration of a successful call on ``tier``."""
+        self._latencies[tier.name].append(seconds)
+
+    def mark_quota_exhausted(self, tier: ModelTier):
+        """Skip ``tier`` for new calls until its quota cooldown has passed."""
+        self._cooling_until[tier.name] = time.monotonic() + self.quota_cooldown
+
+    def stats(self) -> dict:
+        tiers = []
+        for tier in self.tiers:
+            p95 = self.p95_latency(tier)
+            tiers.append({
+                **tier.describe(),
+                "selected": self.selections[tier.name],
+                "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "over_slo": self.over_slo(tier),
+                "cooling_down": self.cooling(tier),
+            })
+        return {
+            "slo_seconds": self.slo or None,
+            "tiers": tiers,
+            "fallbacks": [
+                {"from": source, "to": target, "reason": reason, "count": count}
+                for (source, target, reason), count in sorted(self.fallbacks.items())
+            ],
+        }
@@ -0,0 +1,195 @@
+"""
+Uploads
+
+Size-capped upload ingestion. Request bodies are limited while they stream
+in, before they are parsed. Each uploaded file is then read once in
+fixed-size chunks, counted against the per-file limit and hashed. Files that
+fit in one chunk are handed to extraction as bytes; larger ones are written
+to a named temporary file as they are read, so extraction workers can read
+them from disk and no request ever holds a whole upload in memory.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Optional, Union
+
+from fastapi import UploadFile
+
+logger = logging.getLogger("studywithai.uploads")
+
+# --- Configuration ---
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# Files up to one chunk (Starlette's in-memory spool size) are kept in memory
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+_BODY_METHODS = ("POST", "PUT", "PATCH")
+
+
+def describe_limit(limit: int) -> str:
+    if limit >= 1024 * 1024:
+        return f"{limit / (1024 * 1024):g} MB"
+    return f"{limit} bytes"
+
+
+class UploadTooLarge(Exception):
+    """Raised when an uploaded file exceeds the per-file limit."""
+
+    def __init__(self, filename: str, limit: int):
+        super().__init__(f"{filename} exceeds the upload limit of {describe_limit(limit)}")
+        self.filename = filename
+        self.limit = limit
+
+
+class SpooledUpload:
+    """An uploaded file with its size and SHA-256.
+
+    ``source`` is the file's bytes when it was small enough to stay in
+    memory, or the path of a named temporary file holding it.
+    """
+
+    def __init__(self, filename: str, source: Union[bytes, str], size: int, digest: str):
+        self.filename = filename
+        self.source = source
+        self.size = size
+        self.digest = digest
+
+    def close(self):
+        """Delete the temporary file, if there is one."""
+        if isinstance(self.source, bytes):
+            return
+        try:
+            os.unlink(self.source)
+        except FileNotFoundError:
+            pass
+
+
+def _spool(source, filename: str, max_bytes: int) -> SpooledUpload:
+    """Read a file object in chunks, hashing and counting as it goes.
+
+    A file that fits in one chunk is returned as bytes; a larger one is
+    written to a named temporary file.
+    """
+    digest = hashlib.sha256()
+    # One byte more than a chunk tells whether anything follows it
+    data = source.read(UPLOAD_CHUNK_BYTES + 1)
+    size = len(data)
+    if size > max_bytes:
+        raise UploadTooLarge(filename, max_bytes)
+    digest.update(data)
+    if size <= UPLOAD_CHUNK_BYTES:
+        return SpooledUpload(filename, data, size, digest.hexdigest())
+
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            target.write(data)
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(filename, max_bytes)
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(filename, path, size, digest.hexdigest())
+
+
+async def spool_upload(upload: UploadFile, max_bytes: int = UPLOAD_MAX_FILE_BYTES) -> SpooledUpload:
+    """Hash an UploadFile and make it readable by extraction workers, off the event loop.
+
+    Raises UploadTooLarge as soon as more than ``max_bytes`` have been read.
+    """
+    # Starlette reports the size once the part has been received
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(upload.filename, max_bytes)
+    await upload.seek(0)
+    return await asyncio.to_thread(_spool, upload.file, upload.filename, max_bytes)
+
+
+def _too_large_body(limit: int) -> bytes:
+    return json.dumps({
+        "success": False,
+        "message": f"Request body exceeds the limit of {describe_limit(limit)}",
+        "error": "HTTP 413",
+    }).encode()
+
+
+class RequestSizeLimitMiddleware:
+    """ASGI middleware that rejects request bodies larger than ``max_bytes`` with 413.
+
+    A declared Content-Length over the limit is rejected before any of the
+    body is read. Otherwise the body is counted as it is received and the
+    request is cut off once the limit is crossed.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = _too_large_body(self.max_bytes)
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in _BODY_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        content_length: Optional[int] = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+        if content_length is not None and content_length > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge("Request body", self.max_bytes)
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Drop whatever error response the app builds for the aborted body
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            logger.warning("Rejected %s request body over %d bytes", scope["path"], self.max_bytes)
+            await self._reject(send)